@@ -3,13 +3,24 @@ import os
 import sqlite3
 import csv
 import copy
+import hashlib
 import tkinter.messagebox
 from tkinter import filedialog
 import logging.config
 from collections import OrderedDict
 from collections import Counter
 
-import re
+import math
+import numpy as np
+from survey_network import ObservationGraph
+from level_loops import LevelLoops
+from qa_rules import QARuleSet
+from tolerance_classes import ToleranceClasses
+from setup_statistics import SetupStatistics
+from edit_journal import EditJournal
+from gsi_delta import GSIDelta
+from atomic_file import AtomicFileWriter, write_file_atomically
+from utilities import group_median, angle_DMS_2_decimal_array, deg2rad_array
 
 
 class GSI:
@@ -27,14 +38,56 @@ class GSI:
                                 'STN_Height', 'STN_Elevation', 'Target_Height', 'Horizontal_Angle', 'Vertical_Angle', 'Slope_Distance',
                                 'Horizontal_Dist', 'Prism_Constant', 'Height_Diff']
 
-    # REGULAR EXPRESSION LOOKUP
-    REGULAR_EXPRESSION_LOOKUP = OrderedDict([('11', r'\*11\d*\+\w+'), ('19', r''), ('21', r''),
-                                             ('22', r''), ('31', r'31..\d\d\+\d*\.?\d?'), ('32', r'32..\d\d\+\d*\.?\d?'),
-                                             ('33', r'33..\d\d[\+-]\d*\.?\d?'), ('51', r'51.{4}[\+-]\d*\+\d{3}'),
-                                             ('81', r'81..00\+\d*\.?\d?'), ('82', r'82..00\+\d*\.?\d?'), ('83', r'83..00\+\d*\.?\d?'),
-                                             ('84', r'84..\d\d[\+-]\d*\.?\d?'), ('85', r'85..\d\d[\+-]\d*\.?\d?'), ('86', r'86..[\+-]\d*\.?\d?'),
-                                             ('87', r'87\.{2}\d{2}\+\d+'), ('88', r'88..\d\d[\+-]\d*\.?\d?')])
+    WORD_IDS = OrderedDict((column_name, word_id) for word_id, column_name in GSI_WORD_ID_DICT.items())
 
+    # column of each word in the word offsets array of a parsed file
+    WORD_INDEXES = OrderedDict((word_id, word_index) for word_index, word_id in enumerate(GSI_WORD_ID_DICT))
+
+    # the sign and value of the point ID word start at column 7 e.g. *110003+000000000GL76900
+    POINT_ID_VALUE_OFFSET = 7
+    POINT_ID_VALUE_WIDTH = 17
+
+    # each word's sign is 6 characters into the word e.g. 81..00+0000000001040000
+    WORD_SIGN_OFFSET = 6
+
+    # words whose 4dp values are written with a decimal before the last digit e.g. 1040.1234 -> 1040123.4
+    DECIMAL_4DP_WORD_IDS = ('31', '32', '33', '81', '82', '83')
+
+    # cached columns that refer to other lines by position so have to be rebuilt when lines are deleted
+    POSITIONAL_COLUMN_KEYS = ('setup index', 'point id index', 'face pairs')
+
+    FACE_LEFT = 'FL'
+    FACE_RIGHT = 'FR'
+
+    # longest point name that can be entered - the point ID word holds 16 characters
+    MAX_POINT_ID_LENGTH = 15
+
+    # robust statistics of repeated observations - a shot is an outlier if its residual from the median is more than
+    # OUTLIER_MAD_MULTIPLIER robust standard deviations (MAD_SCALE * MAD) and the survey tolerance
+    MAD_SCALE = 1.4826
+    OUTLIER_MAD_MULTIPLIER = 3
+    ROBUST_STATISTICS_MIN_OBSERVATIONS = 3
+
+    # recomputed coordinates must agree with the recorded coordinates within the distance tolerance plus the angle
+    # resolution (0.1" for 3dp instruments, 0.01" for 4dp) over the slope distance
+    COGO_DISTANCE_TOLERANCE = 0.003
+    COGO_ANGLE_RESOLUTION = {'3dp': math.radians(0.1 / 3600), '4dp': math.radians(0.01 / 3600)}
+    EARTH_RADIUS = 6378000
+    REFRACTION_COEFFICIENT = 0.13
+
+    # smallest spatial hash grid cell used by the point location check e.g. when the survey tolerance is set to 0
+    MIN_GRID_CELL_SIZE = 0.001
+
+    # survey configuration tolerances that each check result depends on - used to key the check result cache
+    CHECK_TOLERANCE_SETTINGS = {'check_3D_survey': ('easting_tolerance', 'northing_tolerance', 'height_tolerance',
+                                                    'tolerance_classes_signature'),
+                                'check_target_naming': ('tolerance_classes_signature',),
+                                'check_point_locations': ('easting_tolerance', 'northing_tolerance', 'height_tolerance',
+                                                          'tolerance_classes_signature'),
+                                'check_repeated_observations': ('easting_tolerance', 'northing_tolerance', 'height_tolerance'),
+                                'check_height_loops': ('height_tolerance',),
+                                'check_FLFR': ('flfr_easting_tolerance', 'flfr_northing_tolerance', 'flfr_height_tolerance',
+                                               'tolerance_classes_signature')}
 
 
     def __init__(self, logger, survey_config):
@@ -46,6 +99,14 @@ class GSI:
         self.column_ids = list(GSI.GSI_WORD_ID_DICT.keys())
         self.formatted_lines = []
         self.unformatted_lines = []
+        self.original_filename = None
+        self.original_lines = []
+        self.word_offsets = np.full((0, len(GSI.GSI_WORD_ID_DICT), 2), -1, dtype=np.int32)
+        self.content_hash = None
+        self.column_arrays = {}
+        self.observation_graph = None
+        self.setup_statistics = None
+        self.edit_journal = EditJournal()
         self.survey_config = survey_config
 
         # PRISM CONSTANTS
@@ -80,387 +141,528 @@ class GSI:
         print(self.PC_DICT_GSI_VALUES)
 
 
-    def update_target_height(self, line_number, corrections):
+    # Applies a list of edits e.g. [(3, 'Easting', '1040.123'), (3, '83', '52.004')] to the raw gsi lines.  Fields are
+    # the word ID or column name and values are formatted as in the formatted lines.  Each line is rewritten once
+    def apply_edits(self, edits):
 
-        # corrections takes the form of a dictionary e.g. {'33': new_height_difference, '83': new_elevation, '87': new_target_height}
+        # edits made outside of begin_edit() and end_edit() are journaled as an edit of their own
+        if not self.edit_journal.is_editing():
 
-        unformatted_line = self.get_unformatted_line(line_number)
+            self.begin_edit('Edit')
 
-        for field_id, new_value in corrections.items():
+            try:
+                self.apply_edits(edits)
+            except Exception:
+                self.cancel_edit()
+                raise
 
-            re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP[field_id])
-            match = re_pattern.search(unformatted_line)
+            self.end_edit()
+            return
 
-            org_field_value = match.group()
+        line_edits = OrderedDict()  # e.g. {3: {'81': '1040.123', '83': '52.004'}}
 
-            # Lets build the new field value.First lets build the prefix e.g.87..10+  or 83 or 33
-            re_pattern = re.compile(r'\d{2}..\d{2}[\+,-]')
-            prefix = re_pattern.search(org_field_value).group()
+        for line_number, field, new_value in edits:
+            line_edits.setdefault(line_number, OrderedDict())[GSI.WORD_IDS.get(field, field)] = str(new_value)
 
-            # remove the decimal from the new value  e.g. 1.543 -> 1543
-            new_value = new_value.replace(".", "")
+        for line_number, word_edits in line_edits.items():
 
-            # 4dp precision & elevation only - add decimal at second last digit e.g 2013493 ->201349.3
-            if self.survey_config.precision_value == '4dp' and prefix[:2] == '83':
-                new_value = new_value[:-1] + '.' + new_value[-1:]
-                # There are 18 chars in the suffix so we need to fill the new value with leading zeros
-                new_field_value_suffix = new_value.zfill(18)
+            unformatted_line = self.get_unformatted_line(line_number)
+            line_offsets = self.word_offsets[line_number - 1]   # a view so offsets are updated in place
 
-            elif prefix[:2] == '33':    # we need to add the sign to the prefix for height difference
+            missing_word_ids = [word_id for word_id in word_edits if line_offsets[GSI.WORD_INDEXES[word_id], 0] < 0]
 
-                algebraic_sign = '+'
-                if new_value[0] == '-':    # positive numbers don't contain a '+'
-                    algebraic_sign = '-'
-                    new_value = new_value[1:]  # remove the sign + or -
-                prefix = prefix[:-1] + algebraic_sign
+            if missing_word_ids:
+                raise ValueError('Line ' + str(line_number) + ' has no ' +
+                                 ', '.join(GSI.GSI_WORD_ID_DICT[word_id] for word_id in missing_word_ids) + ' field')
 
-                new_field_value_suffix = new_value.zfill(16)
-            else:
-                # There are 16 chars in the suffix so we need to fill the new value with leading zeros
-                new_field_value_suffix = new_value.zfill(16)
+            # replace from the end of the line backwards so the offsets of the words still to be replaced don't move
+            for word_id in sorted(word_edits, key=lambda word_id: line_offsets[GSI.WORD_INDEXES[word_id], 0], reverse=True):
 
-            # lets combine the prefix with the suffix to create the new field value to replace the old one
-            new_field_value = prefix + new_field_value_suffix
+                word_index = GSI.WORD_INDEXES[word_id]
+                value_offset, value_width = line_offsets[word_index]
 
-            # now replace the old value with the new one
-            unformatted_line = unformatted_line.replace(org_field_value, new_field_value)
+                old_word_value = unformatted_line[value_offset:value_offset + value_width]
+                new_word_value = self.format_word_value(word_id, old_word_value[0], old_word_value[1:], word_edits[word_id])
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+                unformatted_line = unformatted_line[:value_offset] + new_word_value + unformatted_line[value_offset + value_width:]
 
-    def update_station_height(self, stn_line_number, new_station_height):
+                # a new value wider than the old one moves the words after it
+                if len(new_word_value) != value_width:
+                    line_offsets[line_offsets[:, 0] > value_offset, 0] += len(new_word_value) - value_width
+                    line_offsets[word_index, 1] = len(new_word_value)
 
-        unformatted_line = self.get_unformatted_line(stn_line_number)
+            # update the raw gsi lines
+            self.edit_journal.record_line(line_number - 1, self.unformatted_lines[line_number - 1])
+            self.unformatted_lines[line_number - 1] = unformatted_line
 
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['88'])
-        match = re_pattern.search(unformatted_line)
+    # Returns the sign and value part of a gsi word for a new value e.g. '+0000000001040123'.  The new value is padded
+    # with leading zeros to the width of the old value
+    def format_word_value(self, word_id, old_algebraic_sign, old_value, new_value):
 
-        org_field_value = match.group()
+        # the point ID can contain letters and spaces
+        if word_id == '11':
+            return old_algebraic_sign + new_value.zfill(len(old_value))
 
-        # Lets build the new field value.First lets build the prefix e.g. 88..10+
-        re_pattern = re.compile(r'\d{2}..\d{2}[\+-]')
-        prefix = re_pattern.search(org_field_value).group()
+        # only the last 3 digits of the prism constant word are the prism constant e.g. 0000+008
+        if word_id == '51':
+            return old_algebraic_sign + old_value[:-3] + new_value.zfill(3)
 
-        # remove the decimal from the new value  e.g. 0.413->0413
-        new_station_height = new_station_height.replace(".", "")
+        # numbers can be positive or negative e.g. height difference.  Positive numbers don't contain a '+'
+        algebraic_sign = '-' if new_value.startswith('-') else '+'
+        new_value = new_value.lstrip('+-')
 
-        # There are 16 chars in the suffix so we need to fill the new value with leading zeros
-        new_field_value_suffix = new_station_height.zfill(16)
+        # remove the decimal from the new value  e.g. 1.543 -> 1543
+        new_value = new_value.replace(".", "")
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_field_value = prefix + new_field_value_suffix
+        # 4dp precision - add decimal at second last digit e.g 2013493 ->201349.3
+        if self.survey_config.precision_value == '4dp' and word_id in GSI.DECIMAL_4DP_WORD_IDS:
+            new_value = new_value[:-1] + '.' + new_value[-1:]
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(org_field_value, new_field_value)
+        return algebraic_sign + new_value.zfill(len(old_value))
 
-        # update the raw gsi lines
-        self.unformatted_lines[stn_line_number - 1] = unformatted_line
+    # Starts journaling the edits made until end_edit() as a single undoable edit.  The file_suffix is added to the file
+    # name when the edits are saved
+    def begin_edit(self, description, file_suffix='_EDITED'):
 
-    def update_station_elevation(self, stn_line_number, new_stn_elevation):
+        # an edit left open by an error is discarded
+        if self.edit_journal.is_editing():
+            self.cancel_edit()
+
+        self.edit_journal.begin_edit(description, file_suffix)
 
-        unformatted_line = self.get_unformatted_line(stn_line_number)
+    # Returns the line numbers changed by the edit
+    def end_edit(self):
 
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['86'])
-        match = re_pattern.search(unformatted_line)
+        line_indexes = self.edit_journal.end_edit(self.unformatted_lines)
+        self.reformat_lines(line_indexes)
 
-        org_field_value = match.group()
+        return [line_index + 1 for line_index in line_indexes]
 
-        # Lets build the new field value.First lets build the prefix e.g. 86..+
-        re_pattern = re.compile(r'\d{2}..[\+-]')
-        prefix = re_pattern.search(org_field_value).group()
+    # Discards the edit in progress, if any
+    def cancel_edit(self):
 
-        # remove the decimal from the new value  e.g. 0.413->0413
-        new_stn_elevation = new_stn_elevation.replace(".", "")
+        if not self.edit_journal.is_editing():
+            return
 
-        # There are 16 chars in the suffix so we need to fill the new value with leading zeros
-        new_field_value_suffix = new_stn_elevation.zfill(16)
+        self.reformat_lines(self.edit_journal.cancel_edit(self.unformatted_lines))
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_field_value = prefix + new_field_value_suffix
+    # Undoes the last edit and returns it e.g. {'description': 'Change target height', 'lines': {...}, ..}
+    def undo_edit(self):
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(org_field_value, new_field_value)
+        edit = self.edit_journal.undo(self.unformatted_lines)
+        self.reformat_lines(list(edit['lines']))
 
-        # update the raw gsi lines
-        self.unformatted_lines[stn_line_number - 1] = unformatted_line
+        return edit
 
-    def update_point_name(self, line_number, new_point_name):
+    def redo_edit(self):
+
+        edit = self.edit_journal.redo(self.unformatted_lines)
+        self.reformat_lines(list(edit['lines']))
 
-        unformatted_line = self.get_unformatted_line(line_number)
+        return edit
+
+    # Re-formats the edited raw lines in memory rather than re-reading the file
+    def reformat_lines(self, line_indexes):
+
+        if not line_indexes:
+            return
 
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['11'])
-        match = re_pattern.search(unformatted_line)
+        for line_index in line_indexes:
+            self.formatted_lines[line_index], line_offsets = self.format_line(self.unformatted_lines[line_index])
+            self.word_offsets[line_index] = line_offsets
 
-        org_point_id_value = match.group()
+        # anything derived from the whole file is rebuilt the next time it is needed
+        self.column_arrays = {}
+        self.observation_graph = None
+        self.setup_statistics = None
+        self.content_hash = hashlib.sha1(''.join(self.unformatted_lines).encode()).hexdigest()
 
-        # Lets build the new field value.
-        # First lets build the prefix e.g.87..10+  or 83
-        re_pattern = re.compile(r'\*\d{6}\+')
-        prefix = re_pattern.search(org_point_id_value).group()
+    # the file the edits are saved to - the file name has the suffix of each kind of edit e.g. survey_PCUpdated_TgtUpdated.gsi
+    def get_edited_file_path(self):
 
-        # NOw, lets build the suffix.  There are 16 chars in the suffix so we need to fill the new value with leading zeros
-        new_point_name_suffix = new_point_name.zfill(16)
+        file_path = os.path.splitext(self.filename)[0]
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_point_id_field_value = prefix + new_point_name_suffix
+        for file_suffix in self.edit_journal.get_file_suffixes():
+            if file_suffix.strip('_') not in file_path:
+                file_path += file_suffix
 
-        # now replace the old value with the new one
-        # unformatted_line = unformatted_line.replace(org_point_id_value, new_point_id_field_value)
-        unformatted_line = new_point_id_field_value + unformatted_line[24:]
+        return file_path + '.gsi'
+
+    # Writes the edited lines to file once and returns the file path.  If save_edits_as_deltas is set in settings.ini
+    # only the lines that differ from the original file are saved
+    def save_edits(self):
+
+        file_path = self.get_edited_file_path()
+
+        if self.survey_config.save_edits_as_deltas:
+            file_path = os.path.splitext(file_path)[0] + GSIDelta.FILE_EXTENSION
+            GSIDelta.create(file_path, self.original_filename, self.original_lines, self.unformatted_lines).save()
+
+        else:
+            self.write_gsi_lines(file_path, self.unformatted_lines)
+
+        self.filename = file_path
+        self.edit_journal.mark_saved()
+
+        return file_path
+
+    # Writes the lines out to file_path in one atomic write.  If they are the lines of this survey the parsed file is
+    # added to the parsed file cache so the file isn't parsed again when it is re-opened
+    def write_gsi_lines(self, file_path, lines):
+
+        atomic_file_writer = write_file_atomically(file_path, lines)
+
+        if atomic_file_writer.content_hash == self.content_hash:
+            parsed_file_cache.add(file_path, self.get_parsed_file(), atomic_file_writer.file_size)
+
+        return file_path
+
+    # Deletes lines from the survey in memory and writes the file once, rather than re-reading and re-parsing it.  Any
+    # unsaved edits are saved first as the edit journal refers to lines by position.  An original that edited variants
+    # are saved against as deltas is never rewritten - the lines are deleted from an _EDITED variant instead.  Returns
+    # the deleted raw lines
+    def delete_lines(self, line_numbers):
+
+        if self.edit_journal.is_modified():
+            self.save_edits()
+
+        file_path = self.filename
+
+        if not GSIDelta.is_delta_file(file_path) and file_path == self.original_filename and \
+                (self.survey_config.save_edits_as_deltas or GSIDelta.get_delta_paths(file_path)):
+            file_path = os.path.splitext(file_path)[0] + '_EDITED'
+            file_path += GSIDelta.FILE_EXTENSION if self.survey_config.save_edits_as_deltas else '.gsi'
+
+        line_indexes = sorted({line_number - 1 for line_number in line_numbers})
+        deleted_lines = [self.unformatted_lines[line_index] for line_index in line_indexes]
+
+        is_kept = np.ones(len(self.unformatted_lines), dtype=bool)
+        is_kept[line_indexes] = False
+        kept_lines = [line for line, keep_line in zip(self.unformatted_lines, is_kept) if keep_line]
+
+        # the file is written first so the survey in memory still matches it if the write fails e.g. the file is locked
+        if GSIDelta.is_delta_file(file_path):
+            # an edited variant saved as a delta stays a delta of its original
+            GSIDelta.create(file_path, self.original_filename, self.original_lines, kept_lines).save()
+            atomic_file_writer = None
+        else:
+            atomic_file_writer = write_file_atomically(file_path, kept_lines)
+
+        self.filename = file_path
+
+        self.unformatted_lines = kept_lines
+        self.formatted_lines = [line for line, keep_line in zip(self.formatted_lines, is_kept) if keep_line]
+        self.word_offsets = self.word_offsets[is_kept]
+
+        # columns of a value for every line just lose the deleted rows
+        for column_key in list(self.column_arrays):
+            if column_key in GSI.POSITIONAL_COLUMN_KEYS:
+                del self.column_arrays[column_key]
+            else:
+                self.column_arrays[column_key] = self.column_arrays[column_key][is_kept]
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+        self.observation_graph = None
+        self.setup_statistics = None
+        self.content_hash = hashlib.sha1(''.join(self.unformatted_lines).encode()).hexdigest()
+        self.edit_journal = EditJournal()
+
+        if atomic_file_writer is not None:
+            parsed_file_cache.add(self.filename, self.get_parsed_file(), atomic_file_writer.file_size)
+
+            # a full file the lines were deleted from in place is its own original from now on
+            if self.filename == self.original_filename:
+                self.original_lines = list(self.unformatted_lines)
+
+        return deleted_lines
+
+    def update_target_height(self, line_number, corrections):
+
+        # corrections takes the form of a dictionary e.g. {'33': new_height_difference, '83': new_elevation, '87': new_target_height}
+        self.apply_edits([(line_number, field_id, new_value) for field_id, new_value in corrections.items()])
+
+    def update_station_height(self, stn_line_number, new_station_height):
+
+        self.apply_edits([(stn_line_number, '88', new_station_height)])
+
+    def update_station_elevation(self, stn_line_number, new_stn_elevation):
+
+        self.apply_edits([(stn_line_number, '86', new_stn_elevation)])
+
+    def update_point_name(self, line_number, new_point_name):
+
+        self.apply_edits([(line_number, '11', new_point_name)])
 
     def pc_change_update_coordinates(self, line_number, corrections):
         # e.g. corrections_dict = {'Prism_Constant': new_pc, 'Easting': new_east, 'Northing': new_north, 'Elevation': new_height,
         #                     'Slope_Distance': new_slant_distance, 'Horizontal_Dist': new_horizontal_distance,
         #                     'Height_Diff': new_height_difference}
 
-        self.update_pc(line_number, corrections['Prism_Constant'])
-        self.update_easting(line_number, corrections['Easting'])
-        self.update_northing(line_number, corrections['Northing'])
-        self.update_elevation(line_number, corrections['Elevation'])
-        self.update_slope_distance(line_number, corrections['Slope_Distance'])
-        self.update_horizontal_dist(line_number, corrections['Horizontal_Dist'])
-        self.update_height_diff(line_number, corrections['Height_Diff'])
+        self.apply_edits([(line_number, column_name, corrections[column_name]) for column_name in
+                          ('Prism_Constant', 'Easting', 'Northing', 'Elevation', 'Slope_Distance', 'Horizontal_Dist', 'Height_Diff')])
 
-    def update_pc(self, line_number, new_pc):
+    # Changes the prism constant of every shot to a point in point_prism_names e.g. {'GL76900': 'Monitoring'} and scales its
+    # slope distance and coordinates from its station setup.  All the shots are corrected as arrays and edited in one
+    # pass.  Returns the gsi line numbers changed and the set of point IDs that aren't in point_prism_names
+    def update_prism_constants(self, point_prism_names):
 
-        unformatted_line = self.get_unformatted_line(line_number)
+        point_ids = self.get_text_column('Point_ID')
+        unique_point_ids, point_indexes = np.unique(point_ids, return_inverse=True)
+        point_indexes = point_indexes.reshape(-1)
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['51'])
-        match = re_pattern.search(unformatted_line)
-        old_pc_unformatted = match.group()
+        # join the point IDs with the prism constants - NaN for points not in point_prism_names
+        unique_prism_names = [point_prism_names.get(point_id) for point_id in unique_point_ids]
+        new_pcs = np.array([self.PC_DICT_REAL_VALUES[prism_name] if prism_name else np.nan
+                            for prism_name in unique_prism_names])[point_indexes]
+        new_gsi_pcs = np.array([self.PC_DICT_GSI_VALUES[prism_name] if prism_name else np.nan
+                                for prism_name in unique_prism_names])[point_indexes]
 
-        # Lets build the new field value.
-        # First lets build the prefix e.g.51..1.+
-        re_pattern = re.compile(r'51.{4}[\+-]')
-        prefix = re_pattern.search(old_pc_unformatted).group()
+        is_setup = ~np.isnan(self.get_float_column('STN_Easting'))
+        points_not_found = set(point_ids[~is_setup & np.isnan(new_pcs)].tolist())
 
-        # lets build the middle part    e.g. +000000000007+
-        # re_pattern = re.compile(r'\+\d*\+')
-        # middle = re_pattern.search(old_pc_unformatted).group().lstrip('+')  # strip off + as this is included in prefix
-        re_pattern = re.compile(r'[\+-]\d*\+')
-        middle = re_pattern.search(old_pc_unformatted).group()[1:]   # strip off + or - at start as this is included in prefix
+        setup_index = self.get_setup_index_column()
+        old_slope_distance = self.get_float_column('Slope_Distance')
+        old_pcs = self.get_float_column('Prism_Constant')
 
-        # lets build the suffix.  There are 3 chars in the suffix so we need to fill the new value with leading zeros
-        suffix = new_pc.zfill(3)
+        # orientation shots and shots before the first setup can't be corrected
+        line_indexes = np.flatnonzero(~is_setup & ~np.isnan(new_pcs) & (old_pcs != new_gsi_pcs) & (setup_index >= 0) &
+                                      (old_slope_distance > 0))
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_pc_unformatted = prefix + middle + suffix
+        setup_index = setup_index[line_indexes]
+        station_easting = self.get_float_column('STN_Easting')[setup_index]
+        station_northing = self.get_float_column('STN_Northing')[setup_index]
+        station_elevation = self.get_float_column('STN_Elevation')[setup_index]
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_pc_unformatted, new_pc_unformatted)
+        # the shot moves along its line of sight by the change in prism constant
+        new_slope_distance = old_slope_distance[line_indexes] + (new_pcs[line_indexes] - old_pcs[line_indexes] / 1000)
+        distance_scale = new_slope_distance / old_slope_distance[line_indexes]
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+        new_easting = station_easting + (self.get_float_column('Easting')[line_indexes] - station_easting) * distance_scale
+        new_northing = station_northing + (self.get_float_column('Northing')[line_indexes] - station_northing) * distance_scale
+        new_elevation = station_elevation + (self.get_float_column('Elevation')[line_indexes] - station_elevation) * distance_scale
+        new_horizontal_dist = np.hypot(new_easting - station_easting, new_northing - station_northing)
+        new_height_diff = np.abs(station_elevation - new_elevation)
 
-    def update_easting(self, line_number, new_easting):
+        number_format = '{:.4f}' if self.survey_config.precision_value == '4dp' else '{:.3f}'
+        new_columns = OrderedDict([('Easting', new_easting), ('Northing', new_northing), ('Elevation', new_elevation),
+                                   ('Slope_Distance', new_slope_distance), ('Horizontal_Dist', new_horizontal_dist),
+                                   ('Height_Diff', new_height_diff)])
+        edits = []
 
-        # new easting must be converted from e.g.'1000.123' to  the 1234123  or 1234123.4 format
-        new_easting = new_easting.replace(".", "")
+        for index, line_index in enumerate(line_indexes.tolist()):
 
-        unformatted_line = self.get_unformatted_line(line_number)
+            # the gsi prism constant is in whole mm e.g. 0.0231 -> 23
+            new_pc = str(int(divmod(new_pcs[line_index] * 1000, 1)[0])).zfill(3).lstrip("0")
+            edits.append((line_index + 1, 'Prism_Constant', new_pc))
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['81'])
-        match = re_pattern.search(unformatted_line)
-        old_easting_unformatted = match.group()
+            for column_name, column_values in new_columns.items():
+                edits.append((line_index + 1, column_name, number_format.format(column_values[index])))
 
-        # Lets build the new field value. First lets build the prefix e.g.81..00+
-        re_pattern = re.compile(r'81..00\+')
-        prefix = re_pattern.search(old_easting_unformatted).group()
+        self.apply_edits(edits)
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            new_easting = new_easting[:-1] + '.' + new_easting[-1:]
-            suffix = new_easting.zfill(17)
-        else:
+        return [line_index + 1 for line_index in line_indexes.tolist()], points_not_found
 
-            suffix = new_easting.zfill(16)
+    # Changes the target height of every shot to a point in point_target_heights e.g. {'GL76900': 0.1} and moves its
+    # elevation and height difference by the change.  line_numbers limits the change to those lines.  The setups of any
+    # station that was shot take the new elevation of the first shot to it.  All the corrections are made as arrays and
+    # edited in one pass.  Returns the gsi line numbers changed and the set of point IDs that aren't in point_target_heights
+    def update_target_heights(self, point_target_heights, line_numbers=None):
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_easting_unformatted = prefix + suffix
+        point_ids = self.get_text_column('Point_ID')
+        unique_point_ids, point_indexes = np.unique(point_ids, return_inverse=True)
+        point_indexes = point_indexes.reshape(-1)
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_easting_unformatted, new_easting_unformatted)
+        # join the point IDs with the target heights - NaN for points not in point_target_heights
+        new_target_heights = np.array([float(point_target_heights.get(point_id, np.nan))
+                                       for point_id in unique_point_ids])[point_indexes]
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+        is_setup = ~np.isnan(self.get_float_column('STN_Easting'))
+        elevations = self.get_float_column('Elevation')
 
-    def update_northing(self, line_number, new_northing):
+        # orientation shots have no elevation
+        is_shot = ~is_setup & (self.get_setup_index_column() >= 0) & ~np.isnan(elevations)
 
-        # new northing must be converted from e.g.'1000.123' to  the 1234123  or 1234123.4 format
-        new_northing = new_northing.replace(".", "")
+        if line_numbers is not None:
+            is_selected = np.zeros(len(self.formatted_lines), dtype=bool)
+            is_selected[np.array(line_numbers, dtype=int) - 1] = True
+            is_shot &= is_selected
 
-        unformatted_line = self.get_unformatted_line(line_number)
+        points_not_found = set(point_ids[is_shot & np.isnan(new_target_heights)].tolist())
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['82'])
-        match = re_pattern.search(unformatted_line)
-        old_northing_unformatted = match.group()
+        # a blank target height is 0
+        old_target_heights = np.nan_to_num(self.get_float_column('Target_Height'))
+        target_height_differences = np.round(new_target_heights - old_target_heights, 3)
+        line_indexes = np.flatnonzero(is_shot & ~np.isnan(new_target_heights) & (target_height_differences != 0))
 
-        # Lets build the new field value. First lets build the prefix e.g.82..00+
-        re_pattern = re.compile(r'82..00\+')
-        prefix = re_pattern.search(old_northing_unformatted).group()
+        new_elevations = elevations[line_indexes] - target_height_differences[line_indexes]
+        new_height_diffs = self.get_float_column('Height_Diff')[line_indexes] - target_height_differences[line_indexes]
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            new_northing = new_northing[:-1] + '.' + new_northing[-1:]
-            suffix = new_northing.zfill(17)
-        else:
+        number_format = '{:.4f}' if self.survey_config.precision_value == '4dp' else '{:.3f}'
+        edits = []
 
-            suffix = new_northing.zfill(16)
+        for index, line_index in enumerate(line_indexes.tolist()):
+            edits.append((line_index + 1, 'Target_Height', '{:.3f}'.format(new_target_heights[line_index])))
+            edits.append((line_index + 1, 'Elevation', number_format.format(new_elevations[index])))
+            edits.append((line_index + 1, 'Height_Diff', number_format.format(new_height_diffs[index])))
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_northiing_unformatted = prefix + suffix
+        # the first corrected shot to each station sets the elevation of all its setups
+        station_setup_indexes = np.flatnonzero(is_setup)
+        station_shot_indexes = np.flatnonzero(np.isin(point_ids[line_indexes], point_ids[station_setup_indexes]))
+        station_ids, first_shot_indexes = np.unique(point_ids[line_indexes][station_shot_indexes], return_index=True)
+        station_elevations = dict(zip(station_ids.tolist(), new_elevations[station_shot_indexes][first_shot_indexes].tolist()))
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_northing_unformatted, new_northiing_unformatted)
+        for line_index in station_setup_indexes.tolist():
+            if point_ids[line_index] in station_elevations:
+                edits.append((line_index + 1, 'STN_Elevation', number_format.format(station_elevations[point_ids[line_index]])))
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+        self.apply_edits(edits)
 
-    def update_elevation(self, line_number, new_elevation):
+        return [line_index + 1 for line_index in line_indexes.tolist()], points_not_found
+
+    # Changes the height and/or elevation of station setups e.g. {12: {'STN_Height': 1.6, 'STN_Elevation': 52.1}} and
+    # moves the elevation of every shot from those setups.  A station height change also changes the height difference of
+    # the shots.  The setups of any station shot from a changed setup take the new elevation of the shot.  If cascade is
+    # True those setups, and the setups that shot a change point that moved, are moved as well and so on through the
+    # network.  All the changes are made in one edit pass.  Returns the gsi line numbers changed
+    def update_station_setups(self, setup_changes, cascade=False):
 
-        # new elevation must be converted from e.g.'1000.123' to  the 1234123  or 1234123.4 format
-        new_elevation = new_elevation.replace(".", "")
+        point_ids = self.get_text_column('Point_ID')
+        setup_index = self.get_setup_index_column()
+        elevations = self.get_float_column('Elevation')
+        station_elevations = self.get_float_column('STN_Elevation')
+        is_setup = ~np.isnan(self.get_float_column('STN_Easting'))
 
-        unformatted_line = self.get_unformatted_line(line_number)
+        # orientation shots have no elevation
+        is_shot = ~is_setup & (setup_index >= 0) & ~np.isnan(elevations)
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['83'])
-        match = re_pattern.search(unformatted_line)
-        old_elevation_unformatted = match.group()
+        # gsi line indexes of the setups of each station and of the setups that shot each target
+        station_setups = OrderedDict()
+        target_setups = OrderedDict()
 
-        # Lets build the new field value. First lets build the prefix e.g.83..00+
-        re_pattern = re.compile(r'83..00\+')
-        prefix = re_pattern.search(old_elevation_unformatted).group()
+        for line_index in np.flatnonzero(is_setup).tolist():
+            station_setups.setdefault(point_ids[line_index], []).append(line_index)
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            new_elevation = new_elevation[:-1] + '.' + new_elevation[-1:]
-            suffix = new_elevation.zfill(17)
-        else:
+        for point_id, line_index in zip(point_ids[is_shot].tolist(), setup_index[is_shot].tolist()):
+            target_setups.setdefault(point_id, OrderedDict())[line_index] = None
 
-            suffix = new_elevation.zfill(16)
+        change_points = set(self.get_change_points())
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_elevation_unformatted = prefix + suffix
+        elevation_shifts = np.zeros(len(self.formatted_lines))
+        height_diff_shifts = np.zeros(len(self.formatted_lines))
+        new_station_values = OrderedDict()  # e.g. {11: {'STN_Elevation': 52.1}}
+        moved_setups = OrderedDict()  # setups whose shots have been moved, in the order they are propagated
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_elevation_unformatted, new_elevation_unformatted)
+        def move_setup(setup_line_index, elevation_shift):
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+            elevation_shifts[is_shot & (setup_index == setup_line_index)] += elevation_shift
+            moved_setups[setup_line_index] = None
 
-    def update_slope_distance(self, line_number, slope_distance):
+        for setup_line_number, changes in setup_changes.items():
 
-        # new slope_distance must be converted from e.g.'1000.123' to  the 1234123  or 1234123.4 format
-        slope_distance = slope_distance.replace(".", "")
+            setup_line_index = setup_line_number - 1
+            new_station_values[setup_line_index] = OrderedDict(changes)
+            elevation_shift = 0.0
 
-        unformatted_line = self.get_unformatted_line(line_number)
+            if 'STN_Height' in changes:
+                height_change = changes['STN_Height'] - self.get_float_column('STN_Height')[setup_line_index]
+                height_diff_shifts[is_shot & (setup_index == setup_line_index)] += height_change
+                elevation_shift += height_change
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['31'])
-        match = re_pattern.search(unformatted_line)
-        old_slope_distance_unformatted = match.group()
+            if 'STN_Elevation' in changes:
+                elevation_shift += changes['STN_Elevation'] - station_elevations[setup_line_index]
 
-        # Lets build the new field value. First lets build the prefix e.g.83..00+
-        re_pattern = re.compile(r'31..\d\d\+')
-        prefix = re_pattern.search(old_slope_distance_unformatted).group()
+            move_setup(setup_line_index, elevation_shift)
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            slope_distance = slope_distance[:-1] + '.' + slope_distance[-1:]
-            suffix = slope_distance.zfill(17)
-        else:
+        propagated_setups = set()
 
-            suffix = slope_distance.zfill(16)
+        while len(propagated_setups) < len(moved_setups):
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_slope_distance_unformatted = prefix + suffix
+            setup_line_index = next(line_index for line_index in moved_setups if line_index not in propagated_setups)
+            propagated_setups.add(setup_line_index)
+            stations_shot = set()
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_slope_distance_unformatted, new_slope_distance_unformatted)
+            for shot_index in np.flatnonzero(is_shot & (setup_index == setup_line_index)).tolist():
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+                point_id = point_ids[shot_index]
+                new_elevation = elevations[shot_index] + elevation_shifts[shot_index]
 
-    def update_horizontal_dist(self, line_number, horizontal_dist):
+                # setups of a station shot from this setup take the elevation of the first shot to it
+                if point_id in station_setups and point_id not in stations_shot:
 
-        # new slope_distance must be converted from e.g.'1000.123' to  the 1234123  or 1234123.4 format
-        horizontal_dist = horizontal_dist.replace(".", "")
+                    stations_shot.add(point_id)
 
-        unformatted_line = self.get_unformatted_line(line_number)
+                    for station_line_index in station_setups[point_id]:
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['32'])
-        match = re_pattern.search(unformatted_line)
-        old_horizontal_dist_unformatted = match.group()
+                        if station_line_index in moved_setups or 'STN_Elevation' in new_station_values.get(station_line_index, {}):
+                            continue
 
-        # Lets build the new field value. First lets build the prefix e.g.83..00+
-        re_pattern = re.compile(r'32..\d\d\+')
-        prefix = re_pattern.search(old_horizontal_dist_unformatted).group()
+                        new_station_values.setdefault(station_line_index, OrderedDict())['STN_Elevation'] = new_elevation
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            horizontal_dist = horizontal_dist[:-1] + '.' + horizontal_dist[-1:]
-            suffix = horizontal_dist.zfill(17)
-        else:
+                        if cascade:
+                            move_setup(station_line_index, new_elevation - station_elevations[station_line_index])
 
-            suffix = horizontal_dist.zfill(16)
+                # other setups that shot a change point that has moved move with it
+                elif cascade and point_id in change_points and elevation_shifts[shot_index]:
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_horizontal_dist_unformatted = prefix + suffix
+                    for other_setup_line_index in target_setups[point_id]:
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_horizontal_dist_unformatted, new_horizontal_dist_unformatted)
+                        if other_setup_line_index in moved_setups:
+                            continue
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+                        new_station_values.setdefault(other_setup_line_index, OrderedDict())['STN_Elevation'] = \
+                            station_elevations[other_setup_line_index] + elevation_shifts[shot_index]
+                        move_setup(other_setup_line_index, elevation_shifts[shot_index])
 
-    def update_height_diff(self, line_number, height_diff):
-        # NOTE: height diff can contain a + or - symbol in the unformatted string
+        number_format = '{:.4f}' if self.survey_config.precision_value == '4dp' else '{:.3f}'
+        edits = []
 
-        if height_diff[0] == '-':
-            algebraic_sign = '-'
-            height_diff = height_diff[1:]   # remove algebraic sign
-        else:
-            algebraic_sign = '+'
+        for line_index, new_values in new_station_values.items():
 
-        # new slope_distance must be converted from e.g.'1000.123' to the 1234123  or 1234123.4 format
-        height_diff = height_diff.replace(".", "")
+            # station heights are always 3 decimal places
+            if 'STN_Height' in new_values:
+                edits.append((line_index + 1, 'STN_Height', '{:.3f}'.format(new_values['STN_Height'])))
 
-        unformatted_line = self.get_unformatted_line(line_number)
+            if 'STN_Elevation' in new_values:
+                edits.append((line_index + 1, 'STN_Elevation', number_format.format(new_values['STN_Elevation'])))
 
-        # lets find the original value
-        re_pattern = re.compile(GSI.REGULAR_EXPRESSION_LOOKUP['33'])
-        match = re_pattern.search(unformatted_line)
-        old_height_diff_unformatted = match.group()
+        for line_index in np.flatnonzero(elevation_shifts).tolist():
+            edits.append((line_index + 1, 'Elevation', number_format.format(elevations[line_index] + elevation_shifts[line_index])))
 
-        # Lets build the new field value. First lets build the prefix e.g.33..00+ or 33..00-
-        re_pattern = re.compile(r'33..\d\d[\+-]')
-        prefix = re_pattern.search(old_height_diff_unformatted).group()
-        prefix = prefix[:-1] + algebraic_sign
+        for line_index in np.flatnonzero(height_diff_shifts).tolist():
+            edits.append((line_index + 1, 'Height_Diff', number_format.format(
+                self.get_float_column('Height_Diff')[line_index] + height_diff_shifts[line_index])))
 
-        # lets build the suffix.
-        if self.survey_config.precision_value == '4dp':
-            height_diff = height_diff[:-1] + '.' + height_diff[-1:]
-            suffix = height_diff.zfill(17)
-        else:
+        self.apply_edits(edits)
+
+        return sorted({line_number for line_number, _, _ in edits})
+
+    def update_pc(self, line_number, new_pc):
+
+        self.apply_edits([(line_number, '51', new_pc)])
+
+    def update_easting(self, line_number, new_easting):
+
+        self.apply_edits([(line_number, '81', new_easting)])
+
+    def update_northing(self, line_number, new_northing):
+
+        self.apply_edits([(line_number, '82', new_northing)])
+
+    def update_elevation(self, line_number, new_elevation):
+
+        self.apply_edits([(line_number, '83', new_elevation)])
 
-            suffix = height_diff.zfill(16)
+    def update_slope_distance(self, line_number, slope_distance):
+
+        self.apply_edits([(line_number, '31', slope_distance)])
+
+    def update_horizontal_dist(self, line_number, horizontal_dist):
 
-        # lets combine the prefix with the suffix to create the new field value to replace the old one
-        new_height_diff_unformatted = prefix + suffix
+        self.apply_edits([(line_number, '32', horizontal_dist)])
 
-        # now replace the old value with the new one
-        unformatted_line = unformatted_line.replace(old_height_diff_unformatted, new_height_diff_unformatted)
+    def update_height_diff(self, line_number, height_diff):
+        # NOTE: height diff can contain a + or - symbol in the unformatted string
 
-        # update the raw gsi lines
-        self.unformatted_lines[line_number - 1] = unformatted_line
+        self.apply_edits([(line_number, '33', height_diff)])
 
     def get_unformatted_line(self, unformatted_line_number):
 
@@ -474,120 +676,242 @@ class GSI:
 
         # self.survey_config = SurveyConfiguration()
 
+        # edited variants saved as deltas are built from their parsed original
+        if GSIDelta.is_delta_file(filename):
+            self.format_gsi_delta(filename)
+            return
+
+        # a file that hasn't changed since it was last parsed is copied from the parsed file cache
+        parsed_file = parsed_file_cache.get(filename)
+
+        if parsed_file is not None:
+            self.load_parsed_file(filename, parsed_file)
+            return
+
         with open(filename, "r") as f:
 
             self.filename = filename
+            self.original_filename = filename
 
             # Create new list of formatted & unformatted GSI lines each time this function is called
             self.formatted_lines = []
             self.unformatted_lines = []
+            self.content_hash = None
+            self.column_arrays = {}
+            self.observation_graph = None
+            self.setup_statistics = None
+            self.edit_journal = EditJournal()
+
+            # column of the sign and width of the sign and value of each word on each line e.g. [[7, 17], [48, 17], ...]
+            word_offsets = []
 
             try:
                 for line in f:
 
                     self.unformatted_lines.append(line)
 
-                    """ Need to create dictionary of ID's & value's e.g. {'Point_ID': 'A', 'STN_Easting': '2858012', 
-                    .. """
+                    formatted_line, line_offsets = self.format_line(line)
 
-                    # First - create default empty string if no field
-                    formatted_line = OrderedDict([('Point_ID', ''), ('Timestamp', ''), ('Horizontal_Angle', ''),
-                                                  ('Vertical_Angle', ''), ('Slope_Distance', ''),
-                                                  ('Horizontal_Dist', ''), ('Height_Diff', ''),
-                                                  ('Prism_Constant', ''), ('Easting', ''), ('Northing', ''),
-                                                  ('Elevation', ''), ('STN_Easting', ''), ('STN_Northing', ''),
-                                                  ('STN_Elevation', ''), ('Target_Height', ''),
-                                                  ('STN_Height', '')])
+                    self.formatted_lines.append(formatted_line)
+                    word_offsets.append(line_offsets)
+                    # self.logger.info('Formatted Line: ' + str(formatted_line))
 
-                    # flag for station setup line
-                    stn_setup = False
+            except KeyError as ex:
+                self.logger.exception("File doesn't appear to be a valid GSI file.  Missing Key ID: {}".format(ex))
+                raise CorruptedGSIFileError
 
-                    # Work with the first field '11' separately - its unique and can contain spaces and alphanumerics
-                    field_value = self.format_point_id(line[8:24].lstrip('0'))
+            self.word_offsets = np.array(word_offsets, dtype=np.int32).reshape(-1, len(GSI.GSI_WORD_ID_DICT), 2)
 
-                    formatted_line[GSI.GSI_WORD_ID_DICT['11']] = field_value
+            # the formatted lines, and therefore every check result, are determined by the file contents
+            self.content_hash = hashlib.sha1(''.join(self.unformatted_lines).encode()).hexdigest()
 
-                    # Create remaining list of fields e.g. [21.324+0000000006854440, 22.324+0000000009042520, ...
-                    remaining_line = line[24:]
-                    field_list = remaining_line.split()
-                    # field_list = [line[i:i + 24] for i in range(0, len(line), 24)]
+        self.original_lines = list(self.unformatted_lines)
+        parsed_file_cache.add(filename, self.get_parsed_file())
 
-                    # match the 2-digit identification with the key in the dictionary and format its corresponding value
-                    for field in field_list:
+    # the parsed contents of the file as stored in the parsed file cache
+    def get_parsed_file(self):
 
-                        two_digit_id = field[0:2]
+        return {'unformatted_lines': list(self.unformatted_lines),
+                'formatted_lines': [OrderedDict(formatted_line) for formatted_line in self.formatted_lines],
+                'word_offsets': self.word_offsets.copy(), 'content_hash': self.content_hash,
+                'precision_value': self.survey_config.precision_value}
 
-                        # Check if the field is '21' so that we can determine precision (3 or 4dp) based on field length
-                        if two_digit_id == '21':
-                            if len(field) == 24:
-                                # self.survey_config.update(SurveyConfiguration.section_instrument, 'instrument_precision', '4dp')
-                                self.survey_config.precision_value = '4dp'
-                            else:
-                                # self.survey_config.update(SurveyConfiguration.section_instrument, 'instrument_precision', '3dp')
-                                self.survey_config.precision_value = '3dp'
+    def load_parsed_file(self, filename, parsed_file):
 
-                        original_field_value = field
+        self.filename = filename
+        self.original_filename = filename
 
-                        # Strip off unnecessary digits and spaces to make the number readable
-                        field_value = field[7:].rstrip().lstrip('0')
-                        # special format for angles
-                        angle_field_value = field[7:-1].rstrip()    # remove blank spaces and last element which is always a zero for some reason
+        # formatted lines are copied as callers may add keys to them e.g. UID
+        self.unformatted_lines = list(parsed_file['unformatted_lines'])
+        self.formatted_lines = [OrderedDict(formatted_line) for formatted_line in parsed_file['formatted_lines']]
+        self.word_offsets = parsed_file['word_offsets'].copy()
+        self.content_hash = parsed_file['content_hash']
+        self.survey_config.precision_value = parsed_file['precision_value']
 
+        self.column_arrays = {}
+        self.observation_graph = None
+        self.setup_statistics = None
+        self.edit_journal = EditJournal()
+        self.original_lines = list(self.unformatted_lines)
 
-                        # apply special formatting rules to particular fields
-                        if two_digit_id == '19':
-                            field_value = self.format_timestamp(original_field_value)
+    # Opens an edited variant saved as a delta.  The original is parsed (or copied from the parsed file cache) and
+    # only the lines the delta changes are formatted
+    def format_gsi_delta(self, delta_path):
 
-                        elif two_digit_id in ('21', '22'):  # horizontal or vertical angles
-                            field_value = self.format_angles(angle_field_value, self.survey_config.precision_value)
+        gsi_delta = GSIDelta.read(delta_path)
+        self.format_gsi(gsi_delta.original_path)
 
-                        elif two_digit_id == '51':
-                            field_value = self.format_prism_constant(field_value)
+        if self.content_hash != gsi_delta.original_hash:
+            raise CorruptedGSIFileError(os.path.basename(gsi_delta.original_path) + ' has changed since ' +
+                                        os.path.basename(delta_path) + ' was saved')
 
-                        # distance and coordinates
-                        elif two_digit_id in ('31', '32', '33', '81', '82', '83', '84', '85', '86', '87', '88'):
+        original_formatted_lines = self.formatted_lines
+        original_word_offsets = self.word_offsets
 
-                            if two_digit_id == '87':
-                                # always format target height to 3 decimal places, even for 4dp precision
-                                field_value = self.format_number(field_value, '3dp')
-                            else:
-                                field_value = self.format_number(field_value, self.survey_config.precision_value)
+        self.unformatted_lines = []
+        self.formatted_lines = []
+        word_offsets = []
 
-                            # Check to see if this line is a station setup
-                            if two_digit_id == "84":
-                                stn_setup = True
+        for original_index, new_line in gsi_delta.get_line_sources():
 
-                            #  if STN setup then set STN height to 0 if height is empty string
-                            if two_digit_id == '88' and field_value == "":
-                                field_value = '0.000'
+            if new_line is None:
+                self.unformatted_lines.append(self.original_lines[original_index])
+                self.formatted_lines.append(original_formatted_lines[original_index])
+                word_offsets.append(original_word_offsets[original_index])
+            else:
+                formatted_line, line_offsets = self.format_line(new_line)
+                self.unformatted_lines.append(new_line)
+                self.formatted_lines.append(formatted_line)
+                word_offsets.append(line_offsets)
+
+        self.word_offsets = np.array(word_offsets, dtype=np.int32).reshape(-1, len(GSI.GSI_WORD_ID_DICT), 2)
+        self.content_hash = hashlib.sha1(''.join(self.unformatted_lines).encode()).hexdigest()
+        self.filename = delta_path
+
+    # Returns the formatted line e.g. {'Point_ID': 'A', 'STN_Easting': '2858012', ..} of a raw gsi line along with the
+    # column of the sign and width of the sign and value of each of its words e.g. [[7, 17], [31, 17], ...]
+    def format_line(self, line):
+
+        # First - create default empty string if no field
+        formatted_line = OrderedDict([('Point_ID', ''), ('Timestamp', ''), ('Horizontal_Angle', ''),
+                                      ('Vertical_Angle', ''), ('Slope_Distance', ''),
+                                      ('Horizontal_Dist', ''), ('Height_Diff', ''),
+                                      ('Prism_Constant', ''), ('Easting', ''), ('Northing', ''),
+                                      ('Elevation', ''), ('STN_Easting', ''), ('STN_Northing', ''),
+                                      ('STN_Elevation', ''), ('Target_Height', ''),
+                                      ('STN_Height', '')])
+
+        # flag for station setup line
+        stn_setup = False
+
+        # Work with the first field '11' separately - its unique and can contain spaces and alphanumerics
+        field_value = self.format_point_id(line[8:24].lstrip('0'))
+
+        formatted_line[GSI.GSI_WORD_ID_DICT['11']] = field_value
+
+        line_offsets = [[-1, 0] for _ in GSI.GSI_WORD_ID_DICT]
+        line_offsets[GSI.WORD_INDEXES['11']] = [GSI.POINT_ID_VALUE_OFFSET, GSI.POINT_ID_VALUE_WIDTH]
+        field_offset = 24
+
+        # Create remaining list of fields e.g. [21.324+0000000006854440, 22.324+0000000009042520, ...
+        remaining_line = line[24:]
+        field_list = remaining_line.split()
+        # field_list = [line[i:i + 24] for i in range(0, len(line), 24)]
+
+        # match the 2-digit identification with the key in the dictionary and format its corresponding value
+        for field in field_list:
+
+            two_digit_id = field[0:2]
+
+            field_offset = line.index(field, field_offset)
+
+            if two_digit_id in GSI.WORD_INDEXES:
+                line_offsets[GSI.WORD_INDEXES[two_digit_id]] = [field_offset + GSI.WORD_SIGN_OFFSET,
+                                                                len(field) - GSI.WORD_SIGN_OFFSET]
+            field_offset += len(field)
+
+            # Check if the field is '21' so that we can determine precision (3 or 4dp) based on field length
+            if two_digit_id == '21':
+                if len(field) == 24:
+                    # self.survey_config.update(SurveyConfiguration.section_instrument, 'instrument_precision', '4dp')
+                    self.survey_config.precision_value = '4dp'
+                else:
+                    # self.survey_config.update(SurveyConfiguration.section_instrument, 'instrument_precision', '3dp')
+                    self.survey_config.precision_value = '3dp'
 
-                            # set target height to 0 rather than empty string if line is not a station setup
-                            elif two_digit_id == '87' and field_value == "" and not stn_setup:
-                                field_value = '0.000'
+            original_field_value = field
 
-                            # Height difference may contain a poistive or negative
-                            if two_digit_id == "33":
-                                if field_value == "":
-                                    field_value = '0.000'
-                                else:
-                                    algebraic_sign = field[6]
-                                    field_value = algebraic_sign + field_value
+            # Strip off unnecessary digits and spaces to make the number readable
+            field_value = field[7:].rstrip().lstrip('0')
+            # special format for angles
+            angle_field_value = field[7:-1].rstrip()    # remove blank spaces and last element which is always a zero for some reason
 
-                        elif field_value == "":
 
-                            field_value = 'N/A'
+            # apply special formatting rules to particular fields
+            if two_digit_id == '19':
+                field_value = self.format_timestamp(original_field_value)
 
-                        field_name = GSI.GSI_WORD_ID_DICT[two_digit_id]
-                        formatted_line[field_name] = field_value
+            elif two_digit_id in ('21', '22'):  # horizontal or vertical angles
+                field_value = self.format_angles(angle_field_value, self.survey_config.precision_value)
 
-                    self.formatted_lines.append(formatted_line)
-                    # self.logger.info('Formatted Line: ' + str(formatted_line))
+            elif two_digit_id == '51':
+                field_value = self.format_prism_constant(field_value)
 
-                    stn_setup = False
+            # distance and coordinates
+            elif two_digit_id in ('31', '32', '33', '81', '82', '83', '84', '85', '86', '87', '88'):
 
-            except KeyError:
-                self.logger.exception( "File doesn't appear to be a valid GSI file.  Missing Key ID: {}".format(field_value))
-                raise CorruptedGSIFileError
+                if two_digit_id == '87':
+                    # always format target height to 3 decimal places, even for 4dp precision
+                    field_value = self.format_number(field_value, '3dp')
+                else:
+                    field_value = self.format_number(field_value, self.survey_config.precision_value)
+
+                # Check to see if this line is a station setup
+                if two_digit_id == "84":
+                    stn_setup = True
+
+                #  if STN setup then set STN height to 0 if height is empty string
+                if two_digit_id == '88' and field_value == "":
+                    field_value = '0.000'
+
+                # set target height to 0 rather than empty string if line is not a station setup
+                elif two_digit_id == '87' and field_value == "" and not stn_setup:
+                    field_value = '0.000'
+
+                # Height difference may contain a poistive or negative
+                if two_digit_id == "33":
+                    if field_value == "":
+                        field_value = '0.000'
+                    else:
+                        algebraic_sign = field[6]
+                        field_value = algebraic_sign + field_value
+
+            elif field_value == "":
+
+                field_value = 'N/A'
+
+            field_name = GSI.GSI_WORD_ID_DICT[two_digit_id]
+            formatted_line[field_name] = field_value
+
+        return formatted_line, line_offsets
+
+    # Returns check_function(*args), or the result from an earlier run of this check if neither the GSI contents nor the
+    # tolerances the check depends on have changed since
+    def run_cached_check(self, check_name, survey_config, check_function, *args):
+
+        if self.content_hash is None:
+            return check_function(*args)
+
+        tolerances = tuple(getattr(survey_config, setting) for setting in GSI.CHECK_TOLERANCE_SETTINGS.get(check_name, ()))
+        cache_key = (check_name, self.content_hash) + tolerances
+
+        try:
+            return check_result_cache.get(cache_key)
+        except KeyError:
+            check_result = check_function(*args)
+            check_result_cache.add(cache_key, check_result)
+
+            return check_result
 
     @staticmethod
     def format_point_id(point_id_field):
@@ -674,6 +998,273 @@ class GSI:
 
         return column_values
 
+    # returns a numpy array of a numeric column for every gsi line.  Blank or non-numeric values are NaN
+    def get_float_column(self, column_name):
+
+        if column_name not in self.column_arrays:
+
+            column_values = np.full(len(self.formatted_lines), np.nan)
+
+            for index, formatted_line in enumerate(self.formatted_lines):
+                try:
+                    column_values[index] = float(formatted_line[column_name])
+                except ValueError:
+                    pass  # blank value e.g. a station setup or orientation shot
+
+            self.column_arrays[column_name] = column_values
+
+        return self.column_arrays[column_name]
+
+    # the network of station setups and targets - built once for each parse of the GSI file
+    def get_observation_graph(self):
+
+        if self.observation_graph is None:
+            self.observation_graph = ObservationGraph(self.formatted_lines)
+
+        return self.observation_graph
+
+    # returns a numpy array of the text of a column for every gsi line
+    def get_text_column(self, column_name):
+
+        column_key = 'text ' + column_name
+
+        if column_key not in self.column_arrays:
+            self.column_arrays[column_key] = np.array([formatted_line[column_name] for formatted_line in self.formatted_lines],
+                                                      dtype=str)
+
+        return self.column_arrays[column_key]
+
+    # tolerances of every gsi line from the tolerance class of its point ID e.g. {'eastings': array([0.01, 0.005, ..])}
+    def get_tolerance_arrays(self, survey_config):
+
+        return ToleranceClasses(survey_config).get_tolerance_arrays(self.get_text_column('Point_ID'))
+
+    # gsi line indexes of every face left / face right pair in the survey e.g. (array([2, 3]), array([6, 7]))
+    def get_face_pair_indexes(self):
+
+        if 'face pairs' not in self.column_arrays:
+
+            face_pairs = []
+
+            for setup_line_number, station_name in self.get_observation_graph().setup_stations.items():
+                obs_from_station_dict = self.get_all_shots_from_a_station_including_setup(station_name, setup_line_number - 1)
+                face_pairs.extend(self.get_face_pairs(obs_from_station_dict)[0])
+
+            face_pairs = np.array(face_pairs, dtype=int).reshape(-1, 2)
+            self.column_arrays['face pairs'] = (face_pairs[:, 0], face_pairs[:, 1])
+
+        return self.column_arrays['face pairs']
+
+    # returns a numpy array of the raw signed integer value of a GSI word (e.g. '21') for every gsi line.  Missing words
+    # are NaN.  Angles are returned in decimal degrees decoded from the raw DDDMMSSs (3dp) or DDDMMSSsss (4dp) value
+    def get_word_column(self, word_id):
+
+        column_name = 'word ' + word_id
+
+        if column_name not in self.column_arrays:
+
+            column_values = np.full(len(self.unformatted_lines), np.nan)
+            is_4dp = np.zeros(len(self.unformatted_lines), dtype=bool)
+
+            for index, unformatted_line in enumerate(self.unformatted_lines):
+                for field in unformatted_line[24:].split():
+                    if field[0:2] == word_id:
+                        try:
+                            column_values[index] = int(field[6] + field[7:])
+                        except ValueError:
+                            pass  # blank word
+                        is_4dp[index] = len(field) == 24
+                        break
+
+            if word_id in ('21', '22'):
+                angle_scale = np.where(is_4dp, 1000, 10)
+                seconds = (column_values % (100 * angle_scale)) / angle_scale
+                minutes = (column_values // (100 * angle_scale)) % 100
+                degrees = column_values // (10000 * angle_scale)
+                column_values = angle_DMS_2_decimal_array(degrees, minutes, seconds)
+
+            self.column_arrays[column_name] = column_values
+
+        return self.column_arrays[column_name]
+
+    # gsi line index of the station setup each line belongs to, or -1 for lines before the first setup
+    def get_setup_index_column(self):
+
+        if 'setup index' not in self.column_arrays:
+
+            setup_lines = ~np.isnan(self.get_float_column('STN_Easting'))
+            self.column_arrays['setup index'] = np.maximum.accumulate(
+                np.where(setup_lines, np.arange(len(self.formatted_lines)), -1)) if len(setup_lines) else setup_lines.astype(int)
+
+        return self.column_arrays['setup index']
+
+    # Recomputes the coordinates of every shot from its station setup (words 84-88), horizontal and vertical angle, slope
+    # distance and target height.  The slope distance recorded by the instrument already has the prism constant applied.
+    def compute_shot_coordinates(self):
+
+        setup_index = self.get_setup_index_column()
+        has_setup = setup_index >= 0
+        setup_index = np.where(has_setup, setup_index, 0)
+
+        station_easting = np.where(has_setup, self.get_float_column('STN_Easting')[setup_index], np.nan)
+        station_northing = np.where(has_setup, self.get_float_column('STN_Northing')[setup_index], np.nan)
+        station_elevation = np.where(has_setup, self.get_float_column('STN_Elevation')[setup_index], np.nan)
+        station_height = np.where(has_setup, self.get_float_column('STN_Height')[setup_index], np.nan)
+        target_height = np.nan_to_num(self.get_float_column('Target_Height'))
+
+        horizontal_angle = deg2rad_array(self.get_word_column('21'))
+        zenith_angle = deg2rad_array(self.get_word_column('22'))
+        slope_distance = self.get_float_column('Slope_Distance')
+
+        # sin(Z) is negative on face right and the horizontal angle is 180 degrees out so both faces give the same result
+        horizontal_distance = slope_distance * np.sin(zenith_angle)
+        height_difference = station_height + slope_distance * np.cos(zenith_angle) - target_height
+        curvature_refraction = (1 - GSI.REFRACTION_COEFFICIENT) * horizontal_distance ** 2 / (2 * GSI.EARTH_RADIUS)
+
+        return {'Easting': station_easting + horizontal_distance * np.sin(horizontal_angle),
+                'Northing': station_northing + horizontal_distance * np.cos(horizontal_angle),
+                'Elevation': station_elevation + height_difference,
+                'Elevation_Curvature_Refraction': station_elevation + height_difference + curvature_refraction,
+                'Horizontal_Dist': np.abs(horizontal_distance),
+                'Height_Diff': height_difference}
+
+    # Compares the recomputed coordinates and distances of every shot with the ones recorded in the GSI.  Catches manual
+    # edits and instrument-side errors such as a prism constant or target height changed without the coordinates
+    def check_cogo(self):
+
+        dialog_text = ""
+        computed_values = self.compute_shot_coordinates()
+        slope_distance = self.get_float_column('Slope_Distance')
+
+        tolerance = GSI.COGO_DISTANCE_TOLERANCE + slope_distance * GSI.COGO_ANGLE_RESOLUTION[self.survey_config.precision_value]
+
+        residuals = OrderedDict()
+        for column_name in ('Easting', 'Northing', 'Horizontal_Dist'):
+            residuals[column_name] = self.get_float_column(column_name) - computed_values[column_name]
+
+        # instrument may or may not have applied earth curvature and refraction so take whichever agrees best
+        elevation_residual = self.get_float_column('Elevation') - computed_values['Elevation']
+        curvature_elevation_residual = self.get_float_column('Elevation') - computed_values['Elevation_Curvature_Refraction']
+        residuals['Elevation'] = np.where(np.abs(curvature_elevation_residual) < np.abs(elevation_residual),
+                                          curvature_elevation_residual, elevation_residual)
+
+        # height difference may be recorded unsigned
+        residuals['Height_Diff'] = np.abs(self.get_float_column('Height_Diff')) - np.abs(computed_values['Height_Diff'])
+
+        errors = np.zeros(len(self.formatted_lines), dtype=bool)
+        for residual in residuals.values():
+            errors |= np.abs(residual) > tolerance
+
+        error_line_indexes = np.flatnonzero(errors)
+
+        for index in error_line_indexes:
+            dialog_text += ' Line ' + str(int(index) + 1) + ':  ' + self.formatted_lines[index]['Point_ID'].ljust(10) + \
+                           'E=' + "{:.3f}".format(residuals['Easting'][index]) + 'm  N=' + "{:.3f}".format(residuals['Northing'][index]) + \
+                           'm  H=' + "{:.3f}".format(residuals['Elevation'][index]) + 'm  HD=' + \
+                           "{:.3f}".format(residuals['Horizontal_Dist'][index]) + 'm  dH=' + \
+                           "{:.3f}".format(residuals['Height_Diff'][index]) + 'm\n'
+
+        if dialog_text:
+            dialog_text = "The recorded coordinates or distances of the following shots don't agree with the coordinates " \
+                          "recomputed from the station setup, angles, slope distance and target height.  Recorded minus " \
+                          "recomputed values are shown:\n\n" + dialog_text.replace('nanm', 'N/A')
+        else:
+            dialog_text = "Recorded coordinates agree with the coordinates recomputed from the observations."
+
+        return dialog_text, (error_line_indexes + 1).tolist()
+
+    # Height differences (word 33) of every shot from the station mark to the target mark.  Word 33 may have been
+    # written unsigned so its sign is taken from the height difference recomputed from the vertical angle
+    def get_height_difference_column(self):
+
+        recorded_height_differences = self.get_float_column('Height_Diff')
+        computed_height_differences = self.compute_shot_coordinates()['Height_Diff']
+
+        return np.where(np.isnan(computed_height_differences), recorded_height_differences,
+                        np.copysign(recorded_height_differences, computed_height_differences))
+
+    # Misclose of every independent level loop and every station to station traverse leg of the network.  The
+    # tolerance of a loop grows with the square root of its number of legs
+    def check_height_loops(self, survey_config):
+
+        dialog_text = ""
+        line_number_errors = set()
+        height_tolerance = float(survey_config.height_tolerance)
+
+        observation_graph = self.get_observation_graph()
+        station_elevations = OrderedDict()
+
+        for station_name, setup_line_numbers in observation_graph.stations.items():
+            station_elevations[station_name] = self.get_float_column('STN_Elevation')[setup_line_numbers[0] - 1]
+
+        level_loops = LevelLoops(observation_graph, self.get_height_difference_column(), station_elevations)
+        loop_misclosures = level_loops.get_loop_misclosures()
+        leg_misclosures = level_loops.get_leg_misclosures()
+
+        loops_text = ""
+        for loop, misclose in loop_misclosures:
+            if abs(misclose) > height_tolerance * math.sqrt(len(loop)):
+                loops_text += ' ' + ' - '.join(loop + loop[:1]) + '   misclose=' + "{:.3f}".format(misclose) + 'm\n'
+                line_number_errors.update(line_number for _, line_number in level_loops.get_loop_observations(loop))
+
+        legs_text = ""
+        for station_1, station_2, misclose in leg_misclosures:
+            if abs(misclose) > height_tolerance:
+                legs_text += ' ' + station_1 + ' - ' + station_2 + '   misclose=' + "{:.3f}".format(misclose) + 'm\n'
+                line_number_errors.update(line_number for _, line_number in observation_graph.get_observations(station_1, station_2))
+
+        if loops_text:
+            dialog_text += "The following level loops are outside the height tolerance:\n\n" + loops_text + '\n'
+
+        if legs_text:
+            dialog_text += "The height difference between the following stations doesn't agree with their setup " \
+                           "elevations:\n\n" + legs_text + '\n'
+
+        if dialog_text:
+            dialog_text += "Station setups contributing most to the misclosures:\n\n"
+
+            setup_contributions = level_loops.get_setup_contributions(loop_misclosures, leg_misclosures)
+            for setup_line_number, contribution in [item for item in setup_contributions.items() if item[1] > 0][:5]:
+                dialog_text += ' Line ' + str(setup_line_number) + ':  ' + observation_graph.setup_stations[setup_line_number] + \
+                               '   ' + "{:.3f}".format(contribution) + 'm\n'
+        else:
+            dialog_text = "All " + str(len(loop_misclosures)) + " level loops and " + str(len(leg_misclosures)) + \
+                          " station legs are within the height tolerance."
+
+        return dialog_text, sorted(line_number_errors)
+
+    # Evaluates the site specific QA rules in the QA rules file (see QARule)
+    def check_qa_rules(self, survey_config):
+
+        dialog_text = ""
+        line_number_errors = set()
+
+        for rule, failed_line_numbers in QARuleSet(survey_config.qa_rules_file).evaluate(self, survey_config):
+
+            dialog_text += rule.name + ':  ' + (rule.message if rule.message else rule.check) + '\n'
+
+            for line_number in failed_line_numbers:
+                dialog_text += '    Line ' + str(line_number) + ':  ' + self.formatted_lines[line_number - 1]['Point_ID'] + '\n'
+
+            dialog_text += '\n'
+            line_number_errors.update(failed_line_numbers)
+
+        if not dialog_text:
+            dialog_text = "All QA rules passed."
+        else:
+            dialog_text = "The following QA rules failed:\n\n" + dialog_text
+
+        return dialog_text, sorted(line_number_errors)
+
+    # shot counts, double doubles, orientation shots and change points of each station setup - built once for each parse
+    # of the GSI file and updated when points are renamed
+    def get_setup_statistics(self):
+
+        if self.setup_statistics is None:
+            self.setup_statistics = SetupStatistics(self.formatted_lines, self.get_change_points())
+
+        return self.setup_statistics
+
     def get_set_of_station_setups(self):
 
         control_points = set()
@@ -686,6 +1277,22 @@ class GSI:
 
         return sorted(control_points)
 
+    # returns dictionary of shots labelled 'STN' that are not a station setup, along with their gsi line numbers
+    # e.g. {'STN5': [12, 40]}
+    def get_stn_shots_not_in_setup(self):
+
+        unique_station_setups = self.get_set_of_station_setups()
+        stn_shots_not_in_setup = OrderedDict()
+
+        for line_number, formatted_line in enumerate(self.formatted_lines, start=1):
+
+            point_id = formatted_line['Point_ID']
+
+            if 'STN' in point_id and point_id not in unique_station_setups:
+                stn_shots_not_in_setup.setdefault(point_id, []).append(line_number)
+
+        return stn_shots_not_in_setup
+
     # returns dictionary of station setups along with their gsi line number
     def get_list_of_station_setups(self, formatted_lines):
 
@@ -714,6 +1321,23 @@ class GSI:
 
         return shot_points
 
+    # returns the set of prism constants and target heights of every point shot e.g. {'GL76900': ({'8'}, {'0.100'})}.
+    # Orientation shots have no prism constant so are left out
+    def get_point_summary(self):
+
+        point_summary = OrderedDict()
+
+        for formatted_line in self.formatted_lines:
+
+            if self.is_station_setup(formatted_line) or self.is_orientation_shot(formatted_line):
+                continue
+
+            prism_constants, target_heights = point_summary.setdefault(formatted_line['Point_ID'], (set(), set()))
+            prism_constants.add(formatted_line['Prism_Constant'])
+            target_heights.add(formatted_line['Target_Height'])
+
+        return point_summary
+
     # returns a dict containing formatted lines and their line number
     def get_all_shots_from_a_station_including_setup(self, station_name, gsi_line_number=None):
 
@@ -766,34 +1390,73 @@ class GSI:
 
         return False
 
-    def is_changepoint(self, formatted_line):
+    @staticmethod
+    def get_face(formatted_line):
 
-        if formatted_line['Point_ID'] in self.get_change_points():
-            return True
+        # face left has a vertical angle between 0 and 180 degrees, face right between 180 and 360 degrees
+        try:
+            vertical_angle_degrees = int(formatted_line['Vertical_Angle'][:3])
+        except ValueError:
+            return GSI.FACE_LEFT    # no vertical angle recorded - treat as a face left shot
 
-        return False
+        if vertical_angle_degrees >= 180:
+            return GSI.FACE_RIGHT
 
-    def get_change_points(self):
+        return GSI.FACE_LEFT
 
-        change_points = []
-        control_points_dict = self.get_list_of_station_setups(self.formatted_lines)
+    # Pairs the face left and face right shots from a station setup e.g. the dict returned from
+    # get_all_shots_from_a_station_including_setup().  Shots are grouped by point ID (orientation shots separately) and
+    # sorted by timestamp, then each shot is paired with the earliest unpaired shot of the opposite face.  This handles
+    # double doubles and multiple rounds to the same point.  Returns a list of (FL line, FR line) pairs and a list of
+    # lines without a second face - both in point ID then time order.
+    def get_face_pairs(self, obs_from_station_dict):
 
-        # First, create a list of all point_ids and there frequency of occurrence
-        point_id_list = []
-        for formatted_line in self.formatted_lines:
-            point_id_list.append(formatted_line['Point_ID'])
+        face_pairs = []
+        unpaired_lines = []
 
-        point_id_frequency = Counter(point_id_list)
+        sorted_obs = sorted((formatted_line['Point_ID'], self.is_orientation_shot(formatted_line), formatted_line['Timestamp'],
+                             gsi_line_number) for gsi_line_number, formatted_line in obs_from_station_dict.items()
+                            if not self.is_station_setup(formatted_line))
 
-        # Next, determine if point_id is change point - i.e. if it occurs more than 4 times its probably a change point
-        for point_id, count in point_id_frequency.items():
-            if count > 3:
-                if point_id in control_points_dict.values():
-                    continue  # don't add stations to change point list
+        group_key = None
+        unpaired_faces = {GSI.FACE_LEFT: [], GSI.FACE_RIGHT: []}
+
+        for point_id, is_orientation, timestamp, gsi_line_number in sorted_obs:
+
+            # new point (or orientation shots to the point) - any shots left over from the last group have no second face
+            if (point_id, is_orientation) != group_key:
+                unpaired_lines.extend(sorted(unpaired_faces[GSI.FACE_LEFT] + unpaired_faces[GSI.FACE_RIGHT]))
+                unpaired_faces = {GSI.FACE_LEFT: [], GSI.FACE_RIGHT: []}
+                group_key = (point_id, is_orientation)
+
+            face = self.get_face(obs_from_station_dict[gsi_line_number])
+            opposite_face = GSI.FACE_RIGHT if face == GSI.FACE_LEFT else GSI.FACE_LEFT
+
+            if unpaired_faces[opposite_face]:
+                opposite_line_number = unpaired_faces[opposite_face].pop(0)
+
+                if face == GSI.FACE_LEFT:
+                    face_pairs.append((gsi_line_number, opposite_line_number))
                 else:
-                    change_points.append(point_id)
+                    face_pairs.append((opposite_line_number, gsi_line_number))
+            else:
+                unpaired_faces[face].append(gsi_line_number)
+
+        unpaired_lines.extend(sorted(unpaired_faces[GSI.FACE_LEFT] + unpaired_faces[GSI.FACE_RIGHT]))
+
+        return face_pairs, unpaired_lines
+
+    def is_changepoint(self, formatted_line):
+
+        if formatted_line['Point_ID'] in self.get_change_points():
+            return True
+
+        return False
+
+    # change points are non-station targets that are observed from two or more different stations
+    def get_change_points(self):
 
-        return sorted(change_points)
+        return self.get_observation_graph().get_change_points()
 
     # Create a new GSI with suffix that contains only control.  ALl other shots are removed from the GSI
     def create_control_only_gsi(self):
@@ -816,8 +1479,7 @@ class GSI:
         print(control_only_gsi_file_contents)
 
         # write out new GSI
-        with open(control_only_filename, 'w') as f_stripped:
-            f_stripped.write(control_only_gsi_file_contents)
+        write_file_atomically(control_only_filename, [control_only_gsi_file_contents])
 
         return control_only_filename
 
@@ -920,13 +1582,32 @@ class GSI:
         return dialog_text, line_number_errors
 
 
-    # Check each setup to see if coordinates for duplicate Point names are within 30mm
+    # e.g. '30mm', or '10-30mm' if the tolerance classes of the points checked have different tolerances
+    @staticmethod
+    def format_tolerance_range(tolerances):
+
+        tolerances = np.asarray(tolerances, dtype=float)
+        tolerances = tolerances[~np.isnan(tolerances)]
+
+        if not len(tolerances):
+            return '0mm'
+
+        min_tolerance = str(int(round(tolerances.min() * 1000)))
+        max_tolerance = str(int(round(tolerances.max() * 1000)))
+
+        return (min_tolerance if min_tolerance == max_tolerance else min_tolerance + '-' + max_tolerance) + 'mm'
+
+    # Check each setup to see if coordinates for duplicate Point names are within the naming tolerance of their tolerance class
     def check_target_naming(self):
 
-        survey_check_tolerance = 0.030
+        # naming tolerance of each line from its tolerance class
+        survey_check_tolerances = self.get_tolerance_arrays(self.survey_config)['naming']
+        shot_tolerances = survey_check_tolerances[~np.isnan(self.get_float_column('Easting'))]
 
-        error_text = "WARNING!  The following Point ID's have duplicate shots with different coordinates outside 30mm tolerance:\n\n"
-        dialog_text = 'For each setup, shots with the same Point ID are all within 30mm.  No naming issues detected!'
+        error_text = ""
+        dialog_text = 'For each setup, shots with the same Point ID are all within ' + \
+                      self.format_tolerance_range(shot_tolerances) + '.  No naming issues detected!'
+        error_tolerances = []
 
         line_number_errors = set()
         error_messages = set()
@@ -970,6 +1651,9 @@ class GSI:
                                 north_diff = float(shot_northing) - float(shot_compare['Northing'])
                                 height_diff = float(shot_elevation) - float(shot_compare['Elevation'])
 
+                                survey_check_tolerance = min(survey_check_tolerances[shot_line_number],
+                                                             survey_check_tolerances[compare_line_number])
+
                                 if abs(east_diff) > float(survey_check_tolerance):
                                     point_tolerances_errors_dict['Easting'] = 'E=' + "{:.3f}".format(round(east_diff, 3)) + 'm  '
 
@@ -983,6 +1667,7 @@ class GSI:
                                 if point_tolerances_errors_dict:
                                     line_number_errors.add(shot_line_number+1)
                                     line_number_errors.add(compare_line_number+1)
+                                    error_tolerances.append(survey_check_tolerance)
 
                                     # don't duplicate error messages
                                     if ((station_label + shot_point_id) not in error_labels):
@@ -1001,19 +1686,119 @@ class GSI:
 
         if not line_number_errors:
             error_text = dialog_text
+        else:
+            error_text = "WARNING!  The following Point ID's have duplicate shots with different coordinates outside " + \
+                         self.format_tolerance_range(error_tolerances) + " tolerance:\n\n" + error_text
 
         return error_text, line_number_errors
 
 
+    # Finds shots with different point IDs at the same location, and shots with the same point ID that are far apart.
+    # All observed coordinates are put in a spatial hash grid with a cell size of the survey tolerance so each shot is only
+    # compared with the shots in its own and neighbouring cells
+    def check_point_locations(self, survey_config):
+
+        horizontal_tolerance = max(float(survey_config.easting_tolerance), float(survey_config.northing_tolerance))
+        height_tolerance = float(survey_config.height_tolerance)
+
+        same_location_text = ""
+        far_apart_text = ""
+        line_number_errors = set()
+
+        eastings = self.get_float_column('Easting')
+        northings = self.get_float_column('Northing')
+        elevations = self.get_float_column('Elevation')
+
+        # station setups and orientation shots have no coordinates
+        shot_indexes = np.flatnonzero(~np.isnan(eastings) & ~np.isnan(northings) & ~np.isnan(elevations))
+
+        # naming tolerance of each shot from the tolerance class of its point ID
+        naming_tolerances = self.get_tolerance_arrays(survey_config)['naming'][shot_indexes]
+
+        dialog_text = 'No naming issues detected!  Shots with different Point IDs are all further apart than the survey tolerance ' \
+                      'and shots with the same Point ID are all within ' + self.format_tolerance_range(naming_tolerances) + '.'
+        point_ids = [self.formatted_lines[index]['Point_ID'] for index in shot_indexes]
+
+        # build the spatial hash grid e.g. {(easting cell, northing cell): [shot, shot, ...]}.  A cell at least as big as
+        # the tolerance means shots within the tolerance are always in the same or neighbouring cells
+        grid = {}
+        cell_size = max(horizontal_tolerance, GSI.MIN_GRID_CELL_SIZE)
+        easting_cells = np.floor(eastings[shot_indexes] / cell_size).astype(np.int64)
+        northing_cells = np.floor(northings[shot_indexes] / cell_size).astype(np.int64)
+
+        for shot, cell in enumerate(zip(easting_cells.tolist(), northing_cells.tolist())):
+            grid.setdefault(cell, []).append(shot)
+
+        # compare each shot with later shots in its own and the 8 neighbouring cells
+        reported_point_pairs = set()
+
+        for shot, (easting_cell, northing_cell) in enumerate(zip(easting_cells.tolist(), northing_cells.tolist())):
+            for cell in [(easting_cell + e, northing_cell + n) for e in (-1, 0, 1) for n in (-1, 0, 1)]:
+                for compare_shot in grid.get(cell, []):
+
+                    if compare_shot <= shot or point_ids[shot] == point_ids[compare_shot]:
+                        continue
+
+                    line_index = int(shot_indexes[shot])
+                    compare_line_index = int(shot_indexes[compare_shot])
+                    horizontal_dist = math.hypot(eastings[line_index] - eastings[compare_line_index],
+                                                 northings[line_index] - northings[compare_line_index])
+                    height_diff = elevations[line_index] - elevations[compare_line_index]
+
+                    if horizontal_dist <= horizontal_tolerance and abs(height_diff) <= height_tolerance:
+                        line_number_errors.update((line_index + 1, compare_line_index + 1))
+
+                        # only report each pair of point names once
+                        point_pair = tuple(sorted((point_ids[shot], point_ids[compare_shot])))
+                        if point_pair not in reported_point_pairs:
+                            reported_point_pairs.add(point_pair)
+                            same_location_text += ' Line ' + str(line_index + 1) + ':  ' + point_ids[shot] + '  <--->  Line ' + \
+                                                  str(compare_line_index + 1) + ':  ' + point_ids[compare_shot] + '   (dist=' + \
+                                                  "{:.3f}".format(horizontal_dist) + 'm  H=' + "{:.3f}".format(height_diff) + 'm)\n'
+
+        # Now check the spread of the coordinates of all shots to each point ID
+        if len(shot_indexes):
+            unique_point_ids, point_id_groups = np.unique(point_ids, return_inverse=True)
+            spread_errors = np.zeros(len(unique_point_ids), dtype=bool)
+            spreads = []
+
+            # the shots to a point all have the tolerance class of the point
+            point_naming_tolerances = np.full(len(unique_point_ids), np.inf)
+            np.minimum.at(point_naming_tolerances, point_id_groups, naming_tolerances)
+
+            for coordinates in (eastings, northings, elevations):
+                min_values = np.full(len(unique_point_ids), np.inf)
+                max_values = np.full(len(unique_point_ids), -np.inf)
+                np.minimum.at(min_values, point_id_groups, coordinates[shot_indexes])
+                np.maximum.at(max_values, point_id_groups, coordinates[shot_indexes])
+                spreads.append(max_values - min_values)
+                spread_errors |= (max_values - min_values) > point_naming_tolerances
+
+            for point_group in np.flatnonzero(spread_errors):
+                line_number_errors.update((shot_indexes[point_id_groups == point_group] + 1).tolist())
+                far_apart_text += ' ' + (unique_point_ids[point_group] + ':').ljust(10) + 'E=' + "{:.3f}".format(spreads[0][point_group]) + \
+                                  'm  N=' + "{:.3f}".format(spreads[1][point_group]) + 'm  H=' + "{:.3f}".format(spreads[2][point_group]) + 'm\n'
+
+        if same_location_text or far_apart_text:
+            dialog_text = ""
+
+        if same_location_text:
+            dialog_text += "WARNING!  The following shots have different Point ID's but are within the survey tolerance of each " \
+                           "other:\n\n" + same_location_text
+
+        if far_apart_text:
+            dialog_text += "\nWARNING!  The following Point ID's have shots further apart than " + \
+                           self.format_tolerance_range(point_naming_tolerances[spread_errors]) + ":\n\n" + far_apart_text
+
+        return dialog_text, sorted(line_number_errors)
+
     def check_control_naming(self):
 
         unique_station_setups = self.get_set_of_station_setups()
-        list_station_setups = self.get_list_of_station_setups(self.formatted_lines)
 
         print('STATION SETUP LIST: ' + str(unique_station_setups))
 
         stn_shots_not_in_setup = ""
-        shots_to_stations = []
         shots_with_same_id_as_stn = ""
 
         line_number_errors = []
@@ -1038,25 +1823,14 @@ class GSI:
                     stn_shots_not_in_setup += "Line No. " + str(line_number) + ':   ' + point_id + '\n'
                     line_number_errors.append(line_number)
 
-                # Also want to track of how many times each station is shot so this info can be displayed to user
-                # check to see if point id is a station setup
-                if not formatted_line['STN_Easting']:
-                    shots_to_stations.append(formatted_line['Point_ID'])
-
         # Next lets check points from each setup - none of them should contain same point_id as the station name. i.e. station can't shoot to itself
-        for line_number, stn_name in list_station_setups.items():
-            all_shots_from_station = self.get_all_shots_from_a_station_including_setup(stn_name, line_number)
-            for line_no, formatted_line in all_shots_from_station.items():
-                if self.is_station_setup(formatted_line):
-                    # ignore the station setup line
-                    continue
-                else:
-                    # if stn_name in formatted_line['Point_ID']:
-                    if stn_name == formatted_line['Point_ID']:
-                        # error found in GSI
-                        shots_with_same_id_as_stn += "Line No. " + str(line_no + 1) + ':      ' + stn_name + ' ---> ' + formatted_line[
-                            'Point_ID'] + '\n'
-                        line_number_errors.append(line_no + 1)
+        for setup in self.get_setup_statistics().setups.values():
+            stn_name = setup['station_name']
+            for line_no in setup['line_numbers']:
+                if stn_name == self.formatted_lines[line_no - 1]['Point_ID']:
+                    # error found in GSI
+                    shots_with_same_id_as_stn += "Line No. " + str(line_no) + ':      ' + stn_name + ' ---> ' + stn_name + '\n'
+                    line_number_errors.append(line_no)
 
         # Display message to user of the station shots not found in station setups.
         if stn_shots_not_in_setup:
@@ -1078,116 +1852,245 @@ class GSI:
         if not dialog_text:
             dialog_text = "Control naming looks good!\n"
 
+        # Warn about any station setups that aren't tied to the rest of the network
+        observation_graph = self.get_observation_graph()
+        isolated_stations = observation_graph.get_isolated_stations()
+
+        if isolated_stations:
+            dialog_text += "\nThe following stations have no shots in common with any other station setup:\n\n"
+
+            for station_name in isolated_stations:
+                dialog_text += station_name + '\n'
+
         # Create and display no. of times each station was shot
-        counter = Counter(shots_to_stations)
-        for key, value in sorted(counter.items()):
+        shot_counts = observation_graph.get_shot_counts(sorted(point_id for point_id in observation_graph.shot_counts
+                                                               if 'STN' in point_id))
+        for key, value in shot_counts.items():
             shots_to_stations_message += str(key) + '  ' + str(value) + '\n'
 
         # if shots to stations found (2D surveys typically have none)
-        if len(counter) != 0:
+        if len(shot_counts) != 0:
             dialog_text += '\n\n' + shots_to_stations_message
 
         return dialog_text, line_number_errors
 
-    def check_3D_survey(self, conn, survey_config):
+    def check_3D_survey(self, survey_config):
 
         control_points = self.get_set_of_station_setups()
         change_points = self.get_change_points()
         points = change_points + control_points
 
-        # First, lets determine is station set up is a 2D surey or 3D
+        error_text = ""
+        error_points = set()
 
-        sql_query_columns = 'Point_ID, Easting, Northing, Elevation'
-        sql_where_column = 'Point_ID'
+        point_ids = self.get_text_column('Point_ID')
+        coordinates = np.column_stack((self.get_float_column('Easting'), self.get_float_column('Northing'),
+                                       self.get_float_column('Elevation')))
 
-        error_points_dict = OrderedDict()
-        error_points = set()
+        # only check shots to control and change points - station setups have no coordinates
+        shot_indexes = np.flatnonzero(np.isin(point_ids, points) & ~np.isnan(coordinates).any(axis=1))
+
+        if not len(shot_indexes):
+            return error_text, error_points
 
-        with conn:
+        # tolerance of each shot from its tolerance class
+        tolerance_arrays = self.get_tolerance_arrays(survey_config)
+        tolerances = np.column_stack((tolerance_arrays['eastings'], tolerance_arrays['northings'],
+                                      tolerance_arrays['height']))[shot_indexes]
 
-            sql_query_text = "SELECT {} FROM GSI WHERE {}=?".format(sql_query_columns, sql_where_column)
+        # spread (max - min) of the coordinates of each point
+        point_names, point_groups = np.unique(point_ids[shot_indexes], return_inverse=True)
+        point_groups = point_groups.reshape(-1)
+        min_coordinates = np.full((len(point_names), 3), np.inf)
+        max_coordinates = np.full((len(point_names), 3), -np.inf)
+        point_tolerances = np.full((len(point_names), 3), np.inf)
 
-            cur = conn.cursor()
+        np.minimum.at(min_coordinates, point_groups, coordinates[shot_indexes])
+        np.maximum.at(max_coordinates, point_groups, coordinates[shot_indexes])
+        np.minimum.at(point_tolerances, point_groups, tolerances)
 
-            for point in points:
+        differences = max_coordinates - min_coordinates
+        tolerance_errors = differences > point_tolerances
 
-                # create a list of eastings, northings and height and check min max value of each
-                eastings = []
-                northings = []
-                elevation = []
-                point_id = ""
-                error_text = ""
+        # report points in control and change point order
+        for point_name in points:
 
-                print('Survey mark is: ' + point)
-                cur.execute(sql_query_text, (point,))
+            point_group = np.searchsorted(point_names, point_name)
 
-                # get eastings, northings and height for each shot to this point_ID
-                rows = cur.fetchall()
+            if point_group == len(point_names) or point_names[point_group] != point_name or \
+                    not tolerance_errors[point_group].any():
+                continue
 
-                for row in rows:
-                    print(row)
-                    point_id = row[0]
+            east_diff, north_diff, height_diff = differences[point_group]
+            error_points.add(point_name)
+            error_text += '\n ' + (point_name + ':').ljust(10)
 
-                    # create a list of eastings, northings and height and check min max value of each
+            if tolerance_errors[point_group][0]:
+                error_text += 'E=' + "{:.3f}".format(round(east_diff, 3)) + 'm  '
 
-                    if row[1] == '':
-                        pass  # should be a station setup
+            if tolerance_errors[point_group][1]:
+                error_text += 'N=' + "{:.3f}".format(round(north_diff, 3)) + 'm  '
 
-                    else:
+            if tolerance_errors[point_group][2]:
+                error_text += 'H=' + "{:.3f}".format(round(height_diff, 3)) + 'm'
 
-                        eastings.append(row[1])
-                        northings.append(row[2])
-                        elevation.append(row[3])
+        return error_text, error_points
 
-                try:
+    # Median, MAD and residuals of the coordinates of every shot grouped by point ID.  Coordinate arrays are in
+    # Easting, Northing, Elevation column order
+    def get_repeated_observation_statistics(self):
 
-                    # Check for differences
-                    point_tolerances_errors_dict = {}       # Easting, Northing, Elevation
-                    east_diff = float(max(eastings)) - float(min(eastings))
-                    north_diff = float(max(northings)) - float(min(northings))
-                    height_diff = float(max(elevation)) - float(min(elevation))
+        coordinates = np.column_stack((self.get_float_column('Easting'), self.get_float_column('Northing'),
+                                       self.get_float_column('Elevation')))
 
-                    if east_diff > float(survey_config.easting_tolerance):
-                        point_tolerances_errors_dict['Easting'] = 'E='+"{:.3f}".format(round(east_diff, 3)) + 'm  '
+        # station setups and orientation shots have no coordinates
+        shot_indexes = np.flatnonzero(~np.isnan(coordinates).any(axis=1))
+        coordinates = coordinates[shot_indexes]
 
-                    if north_diff > float(survey_config.northing_tolerance):
-                        point_tolerances_errors_dict['Northing'] = 'N='+"{:.3f}".format(round(north_diff, 3)) + 'm  '
+        point_ids, point_groups = np.unique([self.formatted_lines[index]['Point_ID'] for index in shot_indexes],
+                                            return_inverse=True)
+        point_groups = point_groups.reshape(-1)
+        observation_counts = np.bincount(point_groups, minlength=len(point_ids))
 
-                    if height_diff > float(survey_config.height_tolerance):
-                        point_tolerances_errors_dict['Height'] = 'H='+"{:.3f}".format(round(height_diff, 3)) + 'm'
+        medians = np.empty((len(point_ids), 3))
+        mads = np.empty((len(point_ids), 3))
+        max_residuals = np.zeros((len(point_ids), 3))
 
-                    # add to error dictionary if errors found:
-                    if point_tolerances_errors_dict:
-                        error_points_dict[point_id] = point_tolerances_errors_dict
+        for column in range(3):
+            medians[:, column] = group_median(coordinates[:, column], point_groups, len(point_ids))
 
-                except ValueError:
-                    print('Value error at point : ' + point)
+        residuals = coordinates - medians[point_groups]
 
-            # create error message if exist
-            if error_points_dict:
+        for column in range(3):
+            mads[:, column] = group_median(np.abs(residuals[:, column]), point_groups, len(point_ids))
+            np.maximum.at(max_residuals[:, column], point_groups, np.abs(residuals[:, column]))
 
-                for point_name, tolerance_errors in error_points_dict.items():
-                    error_points.add(point_name)
-                    point_text = (point_name + ':').ljust(10)
-                    error_text += '\n '+ point_text
-                    error_text += tolerance_errors.get('Easting', '')
-                    error_text += tolerance_errors.get('Northing', '')
-                    error_text += tolerance_errors.get('Height', '')
+        return {'point_ids': point_ids, 'observation_counts': observation_counts, 'medians': medians, 'mads': mads,
+                'max_residuals': max_residuals, 'shot_indexes': shot_indexes, 'point_groups': point_groups,
+                'residuals': residuals}
 
-        return error_text, error_points
+    # Flags individual shots to points observed many times (e.g. double doubles and change points) whose residual from
+    # the median of all shots to that point is an outlier
+    def check_repeated_observations(self, survey_config):
+
+        dialog_text = ""
+        statistics = self.get_repeated_observation_statistics()
+        point_groups = statistics['point_groups']
+
+        tolerances = np.array([float(survey_config.easting_tolerance), float(survey_config.northing_tolerance),
+                               float(survey_config.height_tolerance)])
+        outlier_limits = np.maximum(GSI.OUTLIER_MAD_MULTIPLIER * GSI.MAD_SCALE * statistics['mads'][point_groups], tolerances)
+
+        enough_observations = statistics['observation_counts'][point_groups] >= GSI.ROBUST_STATISTICS_MIN_OBSERVATIONS
+        outlier_shots = np.flatnonzero((np.abs(statistics['residuals']) > outlier_limits).any(axis=1) & enough_observations)
+
+        for shot in outlier_shots:
+            point_group = point_groups[shot]
+            east_residual, north_residual, height_residual = statistics['residuals'][shot]
+
+            dialog_text += ' Line ' + str(int(statistics['shot_indexes'][shot]) + 1) + ':  ' + \
+                           statistics['point_ids'][point_group].ljust(10) + 'E=' + "{:.3f}".format(east_residual) + \
+                           'm  N=' + "{:.3f}".format(north_residual) + 'm  H=' + "{:.3f}".format(height_residual) + \
+                           'm   (' + str(statistics['observation_counts'][point_group]) + ' obs)\n'
+
+        if dialog_text:
+            dialog_text = "The following shots are outliers from the median of all shots to the same point.  Residuals " \
+                          "from the median are shown:\n\n" + dialog_text
+        else:
+            dialog_text = "No outlying shots found in points observed " + str(GSI.ROBUST_STATISTICS_MIN_OBSERVATIONS) + \
+                          " or more times."
+
+        return dialog_text, sorted((statistics['shot_indexes'][outlier_shots] + 1).tolist())
+
+    # export the median, MAD and maximum residual of each point observed more than once
+    def export_point_statistics(self, csv_file_path):
+
+        statistics = self.get_repeated_observation_statistics()
+
+        csv_header_name = ['Point_ID', 'Observations', 'Median_Easting', 'Median_Northing', 'Median_Elevation',
+                           'MAD_Easting', 'MAD_Northing', 'MAD_Elevation', 'Max_Residual_Easting',
+                           'Max_Residual_Northing', 'Max_Residual_Elevation']
+
+        with AtomicFileWriter(csv_file_path) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(csv_header_name)
+
+            for point_group, point_id in enumerate(statistics['point_ids']):
+
+                if statistics['observation_counts'][point_group] < 2:
+                    continue
+
+                writer.writerow([point_id, statistics['observation_counts'][point_group]] +
+                                ["{:.4f}".format(value) for value in statistics['medians'][point_group]] +
+                                ["{:.4f}".format(value) for value in statistics['mads'][point_group]] +
+                                ["{:.4f}".format(value) for value in statistics['max_residuals'][point_group]])
+
+    # inverted index of the gsi line indexes of every point ID e.g. {'GL76900': array([2, 6]), 'STN1': array([0, 23])}
+    def get_point_id_index(self):
+
+        if 'point id index' not in self.column_arrays:
+
+            point_ids = self.get_text_column('Point_ID')
+            unique_point_ids, point_indexes = np.unique(point_ids, return_inverse=True)
+            line_indexes = np.argsort(point_indexes.reshape(-1), kind='stable')
+            point_line_indexes = np.split(line_indexes, np.cumsum(np.bincount(point_indexes.reshape(-1)))[:-1])
+
+            self.column_arrays['point id index'] = OrderedDict(zip(unique_point_ids.tolist(), point_line_indexes))
+
+        return self.column_arrays['point id index']
 
     def get_point_name_line_numbers(self, point_name):
 
-        point_line_numbers = []
+        line_indexes = self.get_point_id_index().get(point_name, np.array([], dtype=int))
+        is_setup = ~np.isnan(self.get_float_column('STN_Easting'))
 
-        for line_number, formatted_line in enumerate(self.formatted_lines, start=1):
+        return [line_index + 1 for line_index in line_indexes.tolist() if not is_setup[line_index]]
 
-            if self.is_station_setup(formatted_line):
-                continue
-            elif point_name == formatted_line['Point_ID']:
-                point_line_numbers.append(line_number)
+    # Returns the new point names of point_renames e.g. {'GL1': 'GL76900'} that would merge points together, along with
+    # the old names that would be merged into each e.g. {'GL76900': ['GL1', 'GL76900']}.  A new name collides if it is
+    # already a point in the survey that isn't being renamed to another name, or if more than one point is renamed to it
+    def get_point_rename_collisions(self, point_renames):
+
+        point_id_index = self.get_point_id_index()
+        merged_point_names = OrderedDict()
+
+        for old_point_name, new_point_name in point_renames.items():
+            if old_point_name in point_id_index and old_point_name != new_point_name:
+                merged_point_names.setdefault(new_point_name, []).append(old_point_name)
+
+        # an existing point only stays out of the way if it is renamed to something else
+        for new_point_name, old_point_names in merged_point_names.items():
+            if new_point_name in point_id_index and point_renames.get(new_point_name, new_point_name) == new_point_name:
+                old_point_names.append(new_point_name)
+
+        return OrderedDict((new_point_name, old_point_names) for new_point_name, old_point_names in
+                           merged_point_names.items() if len(old_point_names) > 1)
+
+    # Renames every point in point_renames e.g. {'GL1': 'GL76900'} in one edit pass.  Only the lines of the points
+    # being renamed are touched.  The station setup lines of a point are renamed too unless include_setups is False.
+    # Returns the gsi line numbers changed
+    def rename_points(self, point_renames, include_setups=True):
+
+        point_id_index = self.get_point_id_index()
+        is_setup = ~np.isnan(self.get_float_column('STN_Easting'))
+        edits = []
+
+        for old_point_name, new_point_name in point_renames.items():
+
+            if not new_point_name.strip():
+                raise ValueError('Point ' + old_point_name + ' has a blank new name')
+
+            if len(new_point_name) > GSI.MAX_POINT_ID_LENGTH:
+                raise ValueError('Point name ' + new_point_name + ' is longer than ' + str(GSI.MAX_POINT_ID_LENGTH) +
+                                 ' characters')
+
+            for line_index in point_id_index.get(old_point_name, np.array([], dtype=int)).tolist():
+                if include_setups or not is_setup[line_index]:
+                    edits.append((line_index + 1, 'Point_ID', new_point_name))
+
+        self.apply_edits(edits)
 
-        return point_line_numbers
+        return sorted(line_number for line_number, _, _ in edits)
 
     def export_csv(self, gsi_file_path):
 
@@ -1220,12 +2123,10 @@ class GSI:
 
         try:
             # Export the sorted GSI
-            with open(out_gsi_file_path, "w") as gsi_file:
-                for line in self.unformatted_lines:
-                    gsi_file.write(line)
+            self.write_gsi_lines(out_gsi_file_path, self.unformatted_lines)
 
             # Export the csv file
-            with open(out_csv_file_path, 'w', newline='') as csv_file:
+            with AtomicFileWriter(out_csv_file_path) as csv_file:
                 writer = csv.DictWriter(csv_file, fieldnames=csv_header_name)
                 writer.writeheader()
                 for export_formatted_line in export_formatted_lines:
@@ -1399,6 +2300,14 @@ class GSIDatabase:
 
         self.conn.close()
 
+    # Deletes the rows of the gsi line numbers - rows are inserted in line order so the nth row is line n
+    def delete_rows(self, line_numbers):
+
+        with self.conn:
+            row_ids = [row[0] for row in self.conn.execute('SELECT rowid FROM {} ORDER BY rowid'.format(GSIDatabase.TABLE_NAME))]
+            self.conn.executemany('DELETE FROM {} WHERE rowid=?'.format(GSIDatabase.TABLE_NAME),
+                                  [(row_ids[line_number - 1],) for line_number in sorted(set(line_numbers))])
+
     def populate_table(self, gsi_formatted_lines):
 
         # formatted_lines = checkIsSTNandIsCP(gsi_formatted_lines)
@@ -1423,6 +2332,104 @@ class GSIDatabase:
             self.conn.executemany(sql, values_list)
 
 
+class CheckResultCache:
+    """Least recently used cache of survey check results, keyed by the GSI content hash and check tolerances.
+
+    Cached results are shared between callers so they must be treated as read only.
+    """
+
+    MAX_ENTRIES = 100
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+
+        self.max_entries = max_entries
+        self.check_results = OrderedDict()
+
+    def get(self, cache_key):
+
+        check_result = self.check_results[cache_key]
+        self.check_results.move_to_end(cache_key)
+
+        return check_result
+
+    def add(self, cache_key, check_result):
+
+        self.check_results[cache_key] = check_result
+        self.check_results.move_to_end(cache_key)
+
+        # remove the least recently used results once the cache is full
+        while len(self.check_results) > self.max_entries:
+            self.check_results.popitem(last=False)
+
+    def clear(self):
+
+        self.check_results.clear()
+
+
+check_result_cache = CheckResultCache()
+
+
+class ParsedFileCache:
+    """Least recently used cache of parsed GSI files, keyed by the file path, modification time and size.
+
+    A file is only parsed again once it has changed on disk.  Entries must be copied before they are edited.
+    """
+
+    MAX_ENTRIES = 10
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+
+        self.max_entries = max_entries
+        self.parsed_files = OrderedDict()
+
+    @staticmethod
+    def get_cache_key(file_path):
+
+        file_stat = os.stat(file_path)
+
+        return os.path.normcase(os.path.abspath(file_path)), file_stat.st_mtime, file_stat.st_size
+
+    # Returns the parsed file or None if the file hasn't been parsed since it last changed
+    def get(self, file_path):
+
+        try:
+            cache_key = self.get_cache_key(file_path)
+        except OSError:
+            return None
+
+        parsed_file = self.parsed_files.get(cache_key)
+
+        if parsed_file is not None:
+            self.parsed_files.move_to_end(cache_key)
+
+        return parsed_file
+
+    # file_size is the size the file was written with - the file isn't cached if it has changed on disk since
+    def add(self, file_path, parsed_file, file_size=None):
+
+        cache_key = self.get_cache_key(file_path)
+
+        if file_size is not None and cache_key[2] != file_size:
+            return
+
+        # older versions of the file will never be used again
+        for old_cache_key in [key for key in self.parsed_files if key[0] == cache_key[0]]:
+            del self.parsed_files[old_cache_key]
+
+        self.parsed_files[cache_key] = parsed_file
+
+        # remove the least recently used files once the cache is full
+        while len(self.parsed_files) > self.max_entries:
+            self.parsed_files.popitem(last=False)
+
+    def clear(self):
+
+        self.parsed_files.clear()
+
+
+parsed_file_cache = ParsedFileCache()
+
+
 class CorruptedGSIFileError(Exception):
     """Raised when a GSI file can't be read properly"""
 
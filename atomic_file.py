@@ -0,0 +1,93 @@
+import os
+import io
+import hashlib
+import tempfile
+
+
+def get_umask():
+
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return umask
+
+
+class AtomicFileWriter:
+    """ Writes a file in one go so a crash, or a target locked by another program (e.g. Excel), never leaves it
+    half written.
+
+    The contents are built in memory, written to a temporary file in the same directory, flushed to disk and then
+    renamed over the target.  Newlines are normalised to the platform newline.  Once written, the size and hash of the
+    contents are kept e.g. for the parsed file cache.
+
+        with AtomicFileWriter(gsi_file_path) as gsi_file:
+            gsi_file.writelines(lines)
+    """
+
+    def __init__(self, file_path):
+
+        self.file_path = file_path
+        self.buffer = io.StringIO()
+        self.file_size = None
+        self.content_hash = None
+
+    def __enter__(self):
+
+        return self.buffer
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # nothing is written if the contents couldn't be built
+        if exc_type is None:
+            self.commit()
+
+        self.buffer.close()
+
+        return False
+
+    # the contents with every newline as '\n' - they are written out with the platform newline
+    def get_contents(self):
+
+        return self.buffer.getvalue().replace('\r\n', '\n').replace('\r', '\n')
+
+    def commit(self):
+
+        contents = self.get_contents()
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        temp_file_descriptor, temp_file_path = tempfile.mkstemp(
+            dir=directory, prefix='.' + os.path.basename(self.file_path) + '.', suffix='.tmp')
+
+        try:
+            with os.fdopen(temp_file_descriptor, 'w') as temp_file:
+                temp_file.write(contents)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+
+            # temporary files are only readable by their owner so give the file the permissions of the file being
+            # replaced, or of a newly created file
+            if os.path.exists(self.file_path):
+                os.chmod(temp_file_path, os.stat(self.file_path).st_mode)
+            else:
+                os.chmod(temp_file_path, 0o666 & ~get_umask())
+
+            os.replace(temp_file_path, self.file_path)
+
+        except BaseException:
+            # the target is left as it was e.g. it is open in another program
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+
+        self.file_size = os.stat(self.file_path).st_size
+        self.content_hash = hashlib.sha1(contents.encode()).hexdigest()
+
+
+# Writes the lines to file_path in one atomic write and returns the writer e.g. for its content hash
+def write_file_atomically(file_path, lines):
+
+    atomic_file_writer = AtomicFileWriter(file_path)
+
+    with atomic_file_writer as out_file:
+        out_file.writelines(lines)
+
+    return atomic_file_writer
@@ -1,5 +1,6 @@
 from configparser import ConfigParser
 import shutil
+import os
 
 
 class SurveyConfiguration:
@@ -57,6 +58,12 @@ class SurveyConfiguration:
         self.sorted_station_config = self.config_parser.get(SurveyConfiguration.section_config_files, 'sorted_station_config')
         self.monitoring_file_search_keys = self.config_parser.get(SurveyConfiguration.section_config_files, 'monitoring_file_search_keys')
         self.prism_constants_names = self.config_parser.get(SurveyConfiguration.section_config_files, 'prism_constants_names')
+        self.qa_rules_file = self.config_parser.get(SurveyConfiguration.section_config_files, 'qa_rules_file',
+                                                    fallback='Config Files/qa_rules.ini')
+        self.tolerance_classes_file = self.config_parser.get(SurveyConfiguration.section_config_files, 'tolerance_classes_file',
+                                                             fallback='Config Files/tolerance_classes.ini')
+        self.save_edits_as_deltas = self.config_parser.getboolean(SurveyConfiguration.section_config_files,
+                                                                  'save_edits_as_deltas', fallback=False)
 
         # FILE DIRECTORIES
         self.last_used_file_dir = ""
@@ -73,6 +80,33 @@ class SurveyConfiguration:
                                                                         'current_rail_monitoring_file_name')
         self.job_tracker_filename = self.config_parser.get(SurveyConfiguration.section_file_directories, 'job_tracker_filename')
 
+    # changes whenever the tolerance classes file, or a pc batch file it assigns points to a class from, is edited so
+    # cached check results using them are recomputed
+    @property
+    def tolerance_classes_signature(self):
+
+        file_paths = [self.tolerance_classes_file]
+
+        config_parser = ConfigParser()
+        config_parser.read(self.tolerance_classes_file)
+
+        for class_name in config_parser.sections():
+            pc_batch_file = config_parser.get(class_name, 'pc_batch_file', fallback='')
+
+            if pc_batch_file:
+                file_paths.append(os.path.join('Config Files', pc_batch_file))
+
+        file_signatures = []
+
+        for file_path in file_paths:
+            try:
+                file_stat = os.stat(file_path)
+                file_signatures.append(str(file_stat.st_mtime) + ':' + str(file_stat.st_size))
+            except OSError:
+                file_signatures.append('')
+
+        return '|'.join(file_signatures)
+
     def update(self, section, key, value):
         self.config_parser.set(section, key, value)
 
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+
+class EditJournal:
+    """ In-memory undo/redo journal of the edits made to the raw lines of a GSI file.
+
+    An edit only stores the lines it changed (copy-on-write), before and after, so edits can be undone and redone
+    without re-reading the file.  Each edit also records the suffix its file is saved with e.g. _PCUpdated.
+    """
+
+    def __init__(self):
+
+        self.undo_edits = []
+        self.redo_edits = []
+        self.current_edit = None
+
+        # the edit at the top of the undo stack when the file was last saved
+        self.saved_edit = None
+
+    def begin_edit(self, description, file_suffix):
+
+        self.current_edit = {'description': description, 'file_suffix': file_suffix, 'lines': OrderedDict()}
+
+    def is_editing(self):
+
+        return self.current_edit is not None
+
+    # keeps the original of a line the first time the current edit changes it
+    def record_line(self, line_index, old_line):
+
+        self.current_edit['lines'].setdefault(line_index, [old_line, None])
+
+    # Adds the current edit to the undo stack and returns the indexes of the lines it changed
+    def end_edit(self, lines):
+
+        edit = self.current_edit
+        self.current_edit = None
+
+        edit['lines'] = OrderedDict((line_index, [old_line, lines[line_index]]) for line_index, (old_line, _)
+                                    in edit['lines'].items() if old_line != lines[line_index])
+
+        if not edit['lines']:
+            return []
+
+        self.undo_edits.append(edit)
+        self.redo_edits = []
+
+        return list(edit['lines'])
+
+    # Restores the lines changed by the current edit and returns their indexes
+    def cancel_edit(self, lines):
+
+        edit = self.current_edit
+        self.current_edit = None
+
+        for line_index, (old_line, _) in edit['lines'].items():
+            lines[line_index] = old_line
+
+        return list(edit['lines'])
+
+    def can_undo(self):
+
+        return bool(self.undo_edits)
+
+    def can_redo(self):
+
+        return bool(self.redo_edits)
+
+    def undo(self, lines):
+
+        edit = self.undo_edits.pop()
+
+        for line_index, (old_line, _) in edit['lines'].items():
+            lines[line_index] = old_line
+
+        self.redo_edits.append(edit)
+
+        return edit
+
+    def redo(self, lines):
+
+        edit = self.redo_edits.pop()
+
+        for line_index, (_, new_line) in edit['lines'].items():
+            lines[line_index] = new_line
+
+        self.undo_edits.append(edit)
+
+        return edit
+
+    def is_modified(self):
+
+        return (self.undo_edits[-1] if self.undo_edits else None) is not self.saved_edit
+
+    def mark_saved(self):
+
+        self.saved_edit = self.undo_edits[-1] if self.undo_edits else None
+
+    # suffixes of the edits that haven't been undone, in the order they were made e.g. ['_PCUpdated', '_TgtUpdated']
+    def get_file_suffixes(self):
+
+        return list(OrderedDict.fromkeys(edit['file_suffix'] for edit in self.undo_edits))
@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+import difflib
+
+from atomic_file import AtomicFileWriter, write_file_atomically
+
+
+class GSIDelta:
+    """ An edited variant of a GSI file (e.g. _PCUpdated) stored as its line-level differences from the original file.
+
+    The variant is a list of blocks, each either a [start, end] range of original lines that are unchanged or a new
+    line.  The content hash of the original is kept so a delta is never applied to an original that has since changed.
+    """
+
+    FILE_EXTENSION = '.gsidelta'
+
+    def __init__(self, delta_path, original_path, original_hash, blocks):
+
+        self.delta_path = delta_path
+        self.original_path = original_path
+        self.original_hash = original_hash
+        self.blocks = blocks  # e.g. [[0, 2], '*110003+000000000GL76900 ...', [3, 38]]
+
+    @staticmethod
+    def is_delta_file(file_path):
+
+        return file_path.lower().endswith(GSIDelta.FILE_EXTENSION)
+
+    @staticmethod
+    def get_content_hash(lines):
+
+        return hashlib.sha1(''.join(lines).encode()).hexdigest()
+
+    # Returns the paths of the deltas saved against the original e.g. ['C:/.../survey_PCUpdated.gsidelta'].  Deltas are
+    # saved next to their original
+    @staticmethod
+    def get_delta_paths(original_path):
+
+        directory = os.path.dirname(os.path.abspath(original_path))
+        original_path = os.path.normcase(os.path.abspath(original_path))
+        delta_paths = []
+
+        for file_name in os.listdir(directory):
+
+            if not GSIDelta.is_delta_file(file_name):
+                continue
+
+            delta_path = os.path.join(directory, file_name)
+
+            try:
+                if os.path.normcase(os.path.abspath(GSIDelta.read(delta_path).original_path)) == original_path:
+                    delta_paths.append(delta_path)
+            except (OSError, ValueError, KeyError):
+                continue  # not a readable delta
+
+        return delta_paths
+
+    # Creates the delta between the lines of the original file and the lines of the edited variant
+    @staticmethod
+    def create(delta_path, original_path, original_lines, lines):
+
+        blocks = []
+        sequence_matcher = difflib.SequenceMatcher(None, original_lines, lines, autojunk=False)
+
+        for tag, original_start, original_end, start, end in sequence_matcher.get_opcodes():
+            if tag == 'equal':
+                blocks.append([original_start, original_end])
+            else:
+                blocks.extend(lines[start:end])
+
+        return GSIDelta(delta_path, original_path, GSIDelta.get_content_hash(original_lines), blocks)
+
+    @staticmethod
+    def read(delta_path):
+
+        with open(delta_path, 'r') as delta_file:
+            delta_contents = json.load(delta_file)
+
+        # the original is stored relative to the delta so directories can be moved
+        original_path = os.path.normpath(os.path.join(os.path.dirname(delta_path), delta_contents['original_file']))
+
+        return GSIDelta(delta_path, original_path, delta_contents['original_hash'], delta_contents['blocks'])
+
+    def save(self):
+
+        delta_contents = {'original_file': os.path.relpath(self.original_path, os.path.dirname(self.delta_path)),
+                          'original_hash': self.original_hash, 'blocks': self.blocks}
+
+        with AtomicFileWriter(self.delta_path) as delta_file:
+            json.dump(delta_contents, delta_file)
+
+    # Returns a list of (original line index, None) for each unchanged line and (None, new line) for each changed line
+    def get_line_sources(self):
+
+        line_sources = []
+
+        for block in self.blocks:
+            if isinstance(block, list):
+                line_sources.extend((original_index, None) for original_index in range(block[0], block[1]))
+            else:
+                line_sources.append((None, block))
+
+        return line_sources
+
+    def get_lines(self, original_lines):
+
+        if GSIDelta.get_content_hash(original_lines) != self.original_hash:
+            raise ValueError(os.path.basename(self.original_path) + ' has changed since ' +
+                             os.path.basename(self.delta_path) + ' was saved')
+
+        return [original_lines[original_index] if new_line is None else new_line
+                for original_index, new_line in self.get_line_sources()]
+
+    # Writes the edited variant out as a full GSI file e.g. for CompNet.  Returns the GSI file path
+    def materialise(self, gsi_path=None):
+
+        if gsi_path is None:
+            gsi_path = os.path.splitext(self.delta_path)[0] + '.gsi'
+
+        with open(self.original_path, 'r') as original_file:
+            original_lines = original_file.readlines()
+
+        write_file_atomically(gsi_path, self.get_lines(original_lines))
+
+        return gsi_path
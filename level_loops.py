@@ -0,0 +1,112 @@
+import math
+from collections import OrderedDict
+
+
+class LevelLoops:
+    """ Chains height differences between station setups through shared change points and stations.
+
+    Uses the observation graph of the survey.  The mean height difference of each edge is carried around every
+    independent loop of the network to give its misclose, and each station to station shot is compared with the
+    difference of the two station elevations to give the misclose of each traverse leg.
+    """
+
+    def __init__(self, observation_graph, height_differences, station_elevations):
+
+        self.observation_graph = observation_graph
+        self.station_elevations = station_elevations  # e.g. {'STN1': 50.0}
+        self.edge_height_differences = {}  # mean height difference from edge[0] to edge[1]
+
+        for edge, observations in observation_graph.observations.items():
+
+            edge_height_differences = []
+
+            for setup_line_number, line_number in observations:
+                height_difference = height_differences[line_number - 1]
+
+                if math.isnan(height_difference):
+                    continue  # e.g. an orientation shot
+
+                # shots are from the setup station to the target
+                if observation_graph.setup_stations[setup_line_number] == edge[0]:
+                    edge_height_differences.append(height_difference)
+                else:
+                    edge_height_differences.append(-height_difference)
+
+            if edge_height_differences:
+                self.edge_height_differences[edge] = sum(edge_height_differences) / len(edge_height_differences)
+
+    # height difference from point_1 to point_2, or None if it wasn't observed
+    def get_height_difference(self, point_1, point_2):
+
+        edge = self.observation_graph.get_edge(point_1, point_2)
+
+        if edge not in self.edge_height_differences:
+            return None
+        elif edge[0] == point_1:
+            return self.edge_height_differences[edge]
+        else:
+            return -self.edge_height_differences[edge]
+
+    # returns a list of (loop, misclose) e.g. [(['STN1', 'CP1', 'STN2'], 0.002)]
+    def get_loop_misclosures(self):
+
+        loop_misclosures = []
+
+        for loop in self.observation_graph.get_loops():
+
+            misclose = 0
+
+            for point_1, point_2 in zip(loop, loop[1:] + loop[:1]):
+                height_difference = self.get_height_difference(point_1, point_2)
+
+                if height_difference is None:
+                    break  # loop contains a 2D shot
+                misclose += height_difference
+
+            else:
+                loop_misclosures.append((loop, misclose))
+
+        return loop_misclosures
+
+    # returns a list of (from station, to station, misclose) for every shot between two setup stations
+    def get_leg_misclosures(self):
+
+        leg_misclosures = []
+
+        for station_1, station_2 in self.edge_height_differences:
+
+            if station_1 in self.station_elevations and station_2 in self.station_elevations:
+                misclose = self.station_elevations[station_1] + self.get_height_difference(station_1, station_2) - \
+                           self.station_elevations[station_2]
+
+                if not math.isnan(misclose):
+                    leg_misclosures.append((station_1, station_2, misclose))
+
+        return leg_misclosures
+
+    # the shots that make up a loop e.g. [(setup line number, line number), ...]
+    def get_loop_observations(self, loop):
+
+        loop_observations = []
+
+        for point_1, point_2 in zip(loop, loop[1:] + loop[:1]):
+            loop_observations.extend(self.observation_graph.get_observations(point_1, point_2))
+
+        return loop_observations
+
+    # Ranks station setups by the size of the misclosures of the loops and legs they are part of.  Returns an ordered
+    # dictionary of setup line number: sum of absolute misclosures, largest first
+    def get_setup_contributions(self, loop_misclosures, leg_misclosures):
+
+        setup_contributions = {}
+
+        for loop, misclose in loop_misclosures:
+            for setup_line_number in {setup_line_number for setup_line_number, _ in self.get_loop_observations(loop)}:
+                setup_contributions[setup_line_number] = setup_contributions.get(setup_line_number, 0) + abs(misclose)
+
+        for station_1, station_2, misclose in leg_misclosures:
+            for setup_line_number in {setup_line_number for setup_line_number, _ in
+                                      self.observation_graph.get_observations(station_1, station_2)}:
+                setup_contributions[setup_line_number] = setup_contributions.get(setup_line_number, 0) + abs(misclose)
+
+        return OrderedDict(sorted(setup_contributions.items(), key=lambda item: item[1], reverse=True))
@@ -32,6 +32,13 @@ from tkinter import filedialog
 from GSI import *
 from GSI import GSIDatabase, CorruptedGSIFileError, GSIFileContents
 from decimal import *
+from point_name_index import PointNameIndex
+from qa_rules import QARuleError
+from point_registry import PointRegistry
+from survey_comparison import SurveyComparison
+from survey_index import SurveyIndex
+from gsi_delta import GSIDelta
+from atomic_file import write_file_atomically
 from compnet import CRDCoordinateFile, ASCCoordinateFile, STDCoordinateFile, CoordinateFile, FixedFile
 from utilities import *
 from survey_files import *
@@ -79,6 +86,7 @@ class MenuBar(tk.Frame):
         self.user_config = UserConfiguration()
         self.monitoring_job_dir = os.path.join(
             survey_config.root_job_directory, survey_config.current_year, survey_config.default_survey_type)
+        self.survey_index = SurveyIndex()
         self.query_dialog_box = None
         self.filename_path = ""
         # self.compnet_working_dir = ""
@@ -90,6 +98,8 @@ class MenuBar(tk.Frame):
         self.file_sub_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.file_sub_menu.add_command(
             label="Open GSI...", command=self.choose_gsi_file)
+        self.file_sub_menu.add_command(
+            label="Save GSI", command=self.save_gsi_file)
         self.file_sub_menu.add_command(
             label="Print GSI", command=self.print_gsi)
         self.file_sub_menu.add_command(
@@ -120,10 +130,17 @@ class MenuBar(tk.Frame):
 
         # Edit menu
         self.edit_sub_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.edit_sub_menu.add_command(
+            label="Undo", command=self.undo_edit, accelerator="Ctrl+Z")
+        self.edit_sub_menu.add_command(
+            label="Redo", command=self.redo_edit, accelerator="Ctrl+Y")
+        self.edit_sub_menu.add_separator()
         self.edit_sub_menu.add_command(
             label="Delete all 2D Orientation Shots", command=self.delete_orientation_shots)
         self.edit_sub_menu.add_command(
             label="Change point name...", command=self.change_point_name)
+        self.edit_sub_menu.add_command(
+            label="Rename points from file...", command=self.rename_points_from_file)
         self.edit_sub_menu.add_command(
             label="Change target height...", command=self.change_target_height)
         self.edit_sub_menu.add_command(
@@ -133,10 +150,16 @@ class MenuBar(tk.Frame):
             label="Prism Constant - Fix single...", command=self.prism_constant_update_manually)
         self.edit_sub_menu.add_command(
             label="Prism Constant - Fix batch ...", command=self.prism_constant_update_batch)
+        self.edit_sub_menu.add_command(
+            label="Target Height - Fix batch ...", command=self.target_height_update_batch)
 
         self.menu_bar.add_cascade(
             label="Edit Survey", menu=self.edit_sub_menu, state="disabled")
 
+        self.master.bind('<Control-z>', lambda event: self.undo_edit())
+        self.master.bind('<Control-y>', lambda event: self.redo_edit())
+        self.master.bind('<Control-s>', lambda event: self.save_gsi_file())
+
         # Check menu
         self.check_sub_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.check_sub_menu.add_command(
@@ -151,6 +174,18 @@ class MenuBar(tk.Frame):
             label="Check FL-FR", command=self.check_FLFR)
         self.check_sub_menu.add_command(
             label="Check Tolerances (3D)", command=self.check_3d_survey)
+        self.check_sub_menu.add_command(
+            label="Check Point Locations", command=self.check_point_locations)
+        self.check_sub_menu.add_command(
+            label="Check Repeated Observations", command=self.check_repeated_observations)
+        self.check_sub_menu.add_command(
+            label="Check Coordinates (COGO)", command=self.check_cogo)
+        self.check_sub_menu.add_command(
+            label="Check Height Loops", command=self.check_height_loops)
+        self.check_sub_menu.add_command(
+            label="Check QA Rules", command=self.check_qa_rules)
+        self.check_sub_menu.add_command(
+            label="Check Against Point Registry", command=self.check_point_registry)
         self.check_sub_menu.add_command(
             label="Check All", command=self.check_3d_all)
         self.check_sub_menu.add_separator()
@@ -180,6 +215,13 @@ class MenuBar(tk.Frame):
             label="Create control only GSI", command=self.create_control_only_gsi)
         self.compnet_sub_menu.add_command(
             label="Combine/Re-order GSI Files", command=self.combine_gsi_files)
+        self.compnet_sub_menu.add_command(
+            label="Create GSI Files from Deltas...", command=self.materialise_gsi_deltas)
+        self.compnet_sub_menu.add_separator()
+        self.compnet_sub_menu.add_command(
+            label="Network Summary", command=self.show_network_summary)
+        self.compnet_sub_menu.add_command(
+            label="Station Summary", command=self.show_station_summary)
 
         self.menu_bar.add_cascade(label="Compnet", menu=self.compnet_sub_menu)
 
@@ -187,6 +229,8 @@ class MenuBar(tk.Frame):
         self.utility_sub_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.utility_sub_menu.add_command(
             label="Export CSV", command=self.export_csv)
+        self.utility_sub_menu.add_command(
+            label="Export Point Statistics", command=self.export_point_statistics)
         self.utility_sub_menu.add_command(
             label="Create popup CSV from .ASC file", command=self.create_CSV_from_ASC)
         self.utility_sub_menu.add_command(
@@ -238,16 +282,22 @@ class MenuBar(tk.Frame):
                 intial_directory = os.path.join(
                     survey_config.todays_dated_directory, "TS")
 
-            MenuBar.filename_path = tk.filedialog.askopenfilename(
-                initialdir=intial_directory, title="Select file", filetypes=[("GSI Files", ".gsi")])
+            chosen_file_path = tk.filedialog.askopenfilename(
+                initialdir=intial_directory, title="Select file", filetypes=[("GSI Files", ".gsi"),
+                                                                            ("GSI Delta Files", GSIDelta.FILE_EXTENSION)])
             # survey_config.update(SurveyConfiguration.section_file_directories, 'last_used', os.path.dirname(MenuBar.filename_path))
 
-            if not MenuBar.filename_path:  # user cancelled
+            if not chosen_file_path:  # user cancelled
+                return
+
+            # the edits of the survey that is open are saved, or the user cancels, before it is replaced
+            if not MenuBar.ask_save_edits():
                 return
 
+            MenuBar.filename_path = chosen_file_path
             logger.info("OPENING UP A GSI FILE: " + MenuBar.filename_path)
 
-            GUIApplication.refresh()
+            GUIApplication.refresh(ask_save_edits=False)
             self.enable_menus()
         except Exception as ex:
             print("Problem opening up the GSI file\n\n" + str(ex))
@@ -805,22 +855,15 @@ class MenuBar(tk.Frame):
 
             csv_dict = {}
 
-            station_list_dict = gsi.get_list_of_station_setups(
-                gsi.formatted_lines)
-
-            for line_number, station_name in station_list_dict.items():
+            for setup in gsi.get_setup_statistics().setups.values():
 
+                station_name = setup['station_name']
                 coordinate_dict = OrderedDict()
 
-                station_shots_dict = gsi.get_all_shots_from_a_station_including_setup(
-                    station_name, line_number)
-
                 # Create a csv for each of the station shots
-                for formatted_line in station_shots_dict.values():
-
-                    if gsi.is_station_setup(formatted_line):
-                        continue
+                for line_number in setup['line_numbers']:
 
+                    formatted_line = gsi.formatted_lines[line_number - 1]
                     coordinate_dict[formatted_line['Point_ID']] = [formatted_line['Point_ID'], formatted_line['Easting'], formatted_line['Northing'],
                                                                    formatted_line['Elevation']]
 
@@ -903,6 +946,15 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\ncreate_and_populate_database()\n\n" + str(ex))
             return
 
+    @staticmethod
+    def update_point_registry():
+        try:
+            point_registry.register_survey(gsi)
+        except Exception as ex:
+            # the registry is only used for checking so don't stop the file opening
+            logger.exception(
+                "Unable to update the point registry\n\n" + str(ex))
+
     @staticmethod
     def update_database():
         try:
@@ -920,7 +972,7 @@ class MenuBar(tk.Frame):
         try:
 
             gui_app.list_box.populate(gsi.formatted_lines)
-            gui_app.status_bar.status['text'] = MenuBar.filename_path
+            MenuBar.update_status_bar()
         except Exception as ex:
             print("Problem opening up the GSI file\n\n" + str(ex))
             logger.exception(
@@ -929,6 +981,24 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\nupdate_gui()\n\n" + str(ex))
             return
 
+    @staticmethod
+    def update_status_bar():
+
+        status_text = MenuBar.filename_path
+
+        if gsi.edit_journal.is_modified():
+            status_text += '    (unsaved changes)'
+
+        gui_app.status_bar.status['text'] = status_text
+
+    # Rebuilds the database and GUI after an in-memory edit, highlighting the edited lines
+    @staticmethod
+    def refresh_edits(line_numbers_edited=None):
+
+        MenuBar.create_and_populate_database()
+        gui_app.list_box.populate(gsi.formatted_lines, line_numbers_edited or [])
+        MenuBar.update_status_bar()
+
     def check_3d_survey(self):
 
         errors, error_points, subject, = "", "", ""
@@ -936,8 +1006,8 @@ class MenuBar(tk.Frame):
         subject = "Checking Survey Tolerances"
 
         try:
-            errors, error_points = gsi.check_3D_survey(
-                database.conn, survey_config)
+            errors, error_points = gsi.run_cached_check(
+                'check_3D_survey', survey_config, gsi.check_3D_survey, survey_config)
             error_text = "The following points are outside the specified survey tolerance:\n"
             specified_tolerance_txt = "\n\nThe current tolerance is E:" + survey_config.easting_tolerance + "  N:" + \
                                       survey_config.northing_tolerance + "  H: " + survey_config.height_tolerance
@@ -971,21 +1041,130 @@ class MenuBar(tk.Frame):
     def check_control_naming(self):
 
         try:
-            error_text, error_line_numbers = gsi.check_control_naming()
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_control_naming', survey_config, gsi.check_control_naming)
 
             # display error dialog box
             tkinter.messagebox.showinfo("Checking GSI Naming", error_text)
             gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
 
+            # suggest the closest station setup name for any STN shots that aren't a setup
+            stn_shots_not_in_setup = gsi.get_stn_shots_not_in_setup()
+
+            if stn_shots_not_in_setup:
+                self.suggest_point_renames("Checking GSI Naming", stn_shots_not_in_setup.keys(),
+                                           gsi.get_set_of_station_setups())
+
         except Exception as ex:
             logger.exception('Error checking station naming\n\n' + str(ex))
             tk.messagebox.showerror(
                 "Error", 'Error checking control naming:\n\n' + str(ex))
 
+    # Offers to bulk rename each misnamed point to the closest of the candidate point names
+    def suggest_point_renames(self, dialog_subject, misnamed_points, candidate_point_names):
+
+        point_name_index = PointNameIndex(candidate_point_names)
+        point_renames = OrderedDict()
+        rename_text = "The following points may have been misnamed.  Closest existing names are shown:\n\n"
+
+        for point_name in misnamed_points:
+            suggestions = point_name_index.suggest(point_name)
+
+            if suggestions:
+                point_renames[point_name] = suggestions[0]
+                rename_text += ' ' + point_name + ' ---> ' + suggestions[0]
+
+                if len(suggestions) > 1:
+                    rename_text += '   (or ' + ', '.join(suggestions[1:]) + ')'
+
+                rename_text += '\n'
+
+        if not point_renames:
+            return
+
+        rename_text += '\nWould you like to rename these points to the closest name?'
+
+        if not tk.messagebox.askyesno(dialog_subject, rename_text):
+            return
+
+        gsi.begin_edit('Rename points', '_EDITED')
+
+        try:
+            gsi.rename_points(point_renames, include_setups=False)
+        except Exception:
+            gsi.cancel_edit()
+            raise
+
+        # rebuild database and GUI
+        MenuBar.refresh_edits(gsi.end_edit())
+
+    def rename_points_from_file(self):
+
+        try:
+            rename_file_path = tk.filedialog.askopenfilename(parent=self.master, title='Select the point rename file '
+                                                             '(old name, new name)', filetypes=[("CSV Files", ".csv")])
+
+            if not rename_file_path:
+                return  # user cancelled
+
+            # lets create a dictionary of old point name -> new point name from the rename file
+            point_renames = OrderedDict()
+            with open(rename_file_path) as csvfile:
+                for row in csv.reader(csvfile):
+                    if len(row) > 1 and row[0].strip():
+                        point_renames[row[0].strip()] = row[1].strip()
+
+            invalid_point_renames = [old_point_name + ' ---> ' + new_point_name
+                                     for old_point_name, new_point_name in point_renames.items()
+                                     if not new_point_name or len(new_point_name) > GSI.MAX_POINT_ID_LENGTH]
+
+            if invalid_point_renames:
+                tk.messagebox.showinfo("Renaming Points", "New point names can't be blank and must be " +
+                                       str(GSI.MAX_POINT_ID_LENGTH) + " characters or less in length:\n\n" +
+                                       "\n".join(invalid_point_renames))
+                return
+
+            # warn the user before writing about any renames that would merge two points together
+            collisions = gsi.get_point_rename_collisions(point_renames)
+
+            if collisions:
+                collision_text = "The following new point names are already used or more than one point is being " \
+                                 "renamed to them:\n\n"
+
+                for new_point_name, old_point_names in collisions.items():
+                    collision_text += ' ' + ', '.join(old_point_names) + ' ---> ' + new_point_name + '\n'
+
+                collision_text += '\nWould you like to rename these points anyway?'
+
+                if not tk.messagebox.askyesno("Renaming Points", collision_text):
+                    return
+
+            gsi.begin_edit('Rename points from ' + os.path.basename(rename_file_path), '_EDITED')
+
+            try:
+                gsi.rename_points(point_renames)
+            except Exception:
+                gsi.cancel_edit()
+                raise
+
+            # rebuild database and GUI
+            line_numbers_renamed = gsi.end_edit()
+            MenuBar.refresh_edits(line_numbers_renamed)
+
+            logger.info(str(len(line_numbers_renamed)) + " lines renamed from " + rename_file_path)
+            tk.messagebox.showinfo("Survey Assist", str(len(line_numbers_renamed)) + " lines renamed")
+
+        except Exception as ex:
+            logger.exception(
+                "An unexpected error has occurred\n\nrename_points_from_file()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nrename_points_from_file()\n\n" + str(ex))
+
     def check_target_naming(self):
 
         try:
-            error_text, error_line_numbers = gsi.check_target_naming()
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_target_naming', survey_config, gsi.check_target_naming)
 
             # display error dialog box
             tkinter.messagebox.showinfo(
@@ -997,10 +1176,119 @@ class MenuBar(tk.Frame):
             tk.messagebox.showerror(
                 "Error", 'Error checking target naming:\n\n' + str(ex))
 
+    def check_point_locations(self):
+
+        try:
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_point_locations', survey_config, gsi.check_point_locations, survey_config)
+
+            # display error dialog box
+            tkinter.messagebox.showinfo(
+                "Checking Point Locations", error_text)
+            gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
+
+        except Exception as ex:
+            logger.exception('Error checking point locations\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error checking point locations:\n\n' + str(ex))
+
+    def check_repeated_observations(self):
+
+        try:
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_repeated_observations', survey_config, gsi.check_repeated_observations, survey_config)
+
+            # display error dialog box
+            tkinter.messagebox.showinfo(
+                "Checking Repeated Observations", error_text)
+            gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
+
+        except Exception as ex:
+            logger.exception('Error checking repeated observations\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error checking repeated observations:\n\n' + str(ex))
+
+    def check_cogo(self):
+
+        try:
+            error_text, error_line_numbers = gsi.run_cached_check('check_cogo', survey_config, gsi.check_cogo)
+
+            # display error dialog box
+            tkinter.messagebox.showinfo(
+                "Checking Coordinates", error_text)
+            gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
+
+        except Exception as ex:
+            logger.exception('Error recomputing coordinates\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error recomputing coordinates:\n\n' + str(ex))
+
+    def check_height_loops(self):
+
+        try:
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_height_loops', survey_config, gsi.check_height_loops, survey_config)
+
+            # display error dialog box
+            tkinter.messagebox.showinfo(
+                "Checking Height Loops", error_text + "\n\nThe current height tolerance is " + survey_config.height_tolerance)
+            gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
+
+        except Exception as ex:
+            logger.exception('Error checking height loops\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error checking height loops:\n\n' + str(ex))
+
+    def check_qa_rules(self):
+
+        try:
+            error_text, error_line_numbers = gsi.check_qa_rules(survey_config)
+
+            # display error dialog box
+            tkinter.messagebox.showinfo("Checking QA Rules", error_text)
+            gui_app.list_box.populate(gsi.formatted_lines, error_line_numbers)
+
+        except QARuleError as ex:
+            tk.messagebox.showerror("Checking QA Rules", str(ex))
+
+        except Exception as ex:
+            logger.exception('Error checking QA rules\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error checking QA rules:\n\n' + str(ex))
+
+    def check_point_registry(self):
+
+        try:
+            differences = point_registry.check_survey(gsi)
+            line_number_errors = []
+            error_text = ""
+
+            for point_id, prism_constants, target_heights, registered_row in differences:
+
+                error_text += ' ' + point_id + ' ---> current PC: ' + ', '.join(sorted(prism_constants)) + '  TH: ' + \
+                              ', '.join(sorted(target_heights)) + '    registered PC: ' + registered_row[0] + '  TH: ' + \
+                              registered_row[1] + '  (' + registered_row[2] + ' ' + os.path.basename(registered_row[3]) + ')\n'
+                line_number_errors.extend(gsi.get_point_name_line_numbers(point_id))
+
+            if error_text:
+                error_text = "The prism constant or target height of the following points differ from the last survey " \
+                             "they were seen in:\n\n" + error_text
+            else:
+                error_text = "Prism constants and target heights match the point registry."
+
+            tkinter.messagebox.showinfo("Checking Point Registry", error_text)
+            gui_app.list_box.populate(gsi.formatted_lines, line_number_errors)
+
+        except Exception as ex:
+            logger.exception('Error checking the point registry\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error checking the point registry:\n\n' + str(ex))
+
     def check_prism_constants(self):
 
         try:
-            error_text, error_line_numbers = gsi.check_prism_constants()
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_prism_constants', survey_config, gsi.check_prism_constants)
 
             # display error dialog box
             tkinter.messagebox.showinfo("Checking Prism Constants", error_text)
@@ -1014,7 +1302,8 @@ class MenuBar(tk.Frame):
     def check_target_heights(self):
 
         try:
-            error_text, error_line_numbers = gsi.check_target_heights()
+            error_text, error_line_numbers = gsi.run_cached_check(
+                'check_target_heights', survey_config, gsi.check_target_heights)
 
             # display error dialog box
             tkinter.messagebox.showinfo("Checking Target Heights", error_text)
@@ -1029,58 +1318,8 @@ class MenuBar(tk.Frame):
 
         try:
 
-            error_line_number_list = []
-            dialog_text_set = set()
-            points_no_2nd_face = []
-            points_no_2nd_face_text = ""
-
-            formatted_gsi_lines_analysis = []
-
-            for gsi_line_number, line in enumerate(gsi.formatted_lines, start=0):
-
-                if GSI.is_station_setup(line):
-                    station_name = line['Point_ID']
-                    obs_from_station_dict = gsi.get_all_shots_from_a_station_including_setup(
-                        station_name, gsi_line_number)
-                    points_no_2nd_face, analysed_lines = self.anaylseFLFR(
-                        copy.deepcopy(obs_from_station_dict))
-
-                    # add the analysis lines for this station
-                    for aline in analysed_lines:
-                        formatted_gsi_lines_analysis.append(aline)
-
-                        # for each station setup add 'STN->Point_ID' for each error found
-                        for key, field_value in aline.items():
-                            if '*' in field_value:
-                                if aline['Point_ID'] in points_no_2nd_face:
-                                    points_no_2nd_face_text += "         " + \
-                                        station_name + "  --->  " + \
-                                        aline['Point_ID'] + '\n'
-                                else:
-                                    dialog_text_set.add(
-                                        "         " + station_name + "  --->  " + aline['Point_ID'] + '\n')
-                                break
-
-            # check for tagged values so line error can be determined
-            for index, line_dict in enumerate(formatted_gsi_lines_analysis):
-
-                for key, field_value in line_dict.items():
-
-                    if '*' in field_value:
-                        error_line_number_list.append(index + 1)
-                        break
-
-            if dialog_text_set:
-                dialog_text = " The following shots exceed the FL_FR tolerance:\n\n"
-
-                for line in sorted(dialog_text_set):
-                    dialog_text += line
-            else:
-                dialog_text = " FL-FR shots are within specified tolerance."
-
-            if points_no_2nd_face_text:
-                dialog_text += "\n\n The following points only have one face:\n\n"
-                dialog_text += points_no_2nd_face_text
+            formatted_gsi_lines_analysis, error_line_number_list, dialog_text = gsi.run_cached_check(
+                'check_FLFR', survey_config, self.analyse_all_FLFR)
 
             # display dialog box
             tkinter.messagebox.showinfo("Checking FL-FR", dialog_text)
@@ -1099,9 +1338,67 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\ncheck_FLFR()\n\n" + str(ex))
             return
 
-    def anaylseFLFR(self, obs_from_station_dict):
+    # returns the FL-FR analysis lines for every station setup, the analysis line numbers to highlight and the dialog text
+    def analyse_all_FLFR(self):
 
-        precision = survey_config.precision_value
+        # FL-FR tolerances can be set per class of point - each gsi line's tolerances are looked up once
+        tolerance_arrays = gsi.get_tolerance_arrays(survey_config)
+        error_line_number_list = []
+        dialog_text_set = set()
+        points_no_2nd_face = []
+        points_no_2nd_face_text = ""
+
+        formatted_gsi_lines_analysis = []
+
+        for gsi_line_number, line in enumerate(gsi.formatted_lines, start=0):
+
+            if GSI.is_station_setup(line):
+                station_name = line['Point_ID']
+                obs_from_station_dict = gsi.get_all_shots_from_a_station_including_setup(
+                    station_name, gsi_line_number)
+                points_no_2nd_face, analysed_lines = self.anaylseFLFR(
+                    copy.deepcopy(obs_from_station_dict), tolerance_arrays)
+
+                # add the analysis lines for this station
+                for aline in analysed_lines:
+                    formatted_gsi_lines_analysis.append(aline)
+
+                    # for each station setup add 'STN->Point_ID' for each error found
+                    for key, field_value in aline.items():
+                        if '*' in field_value:
+                            if aline['Point_ID'] in points_no_2nd_face:
+                                points_no_2nd_face_text += "         " + \
+                                    station_name + "  --->  " + \
+                                    aline['Point_ID'] + '\n'
+                            else:
+                                dialog_text_set.add(
+                                    "         " + station_name + "  --->  " + aline['Point_ID'] + '\n')
+                            break
+
+        # check for tagged values so line error can be determined
+        for index, line_dict in enumerate(formatted_gsi_lines_analysis):
+
+            for key, field_value in line_dict.items():
+
+                if '*' in field_value:
+                    error_line_number_list.append(index + 1)
+                    break
+
+        if dialog_text_set:
+            dialog_text = " The following shots exceed the FL_FR tolerance:\n\n"
+
+            for line in sorted(dialog_text_set):
+                dialog_text += line
+        else:
+            dialog_text = " FL-FR shots are within specified tolerance."
+
+        if points_no_2nd_face_text:
+            dialog_text += "\n\n The following points only have one face:\n\n"
+            dialog_text += points_no_2nd_face_text
+
+        return formatted_gsi_lines_analysis, error_line_number_list, dialog_text
+
+    def anaylseFLFR(self, obs_from_station_dict, tolerance_arrays):
 
         points_no_2nd_face = []
         analysed_lines = []
@@ -1112,121 +1409,111 @@ class MenuBar(tk.Frame):
                                            'STN_Northing': '', 'STN_Elevation': '', 'Target_Height': ' ',
                                            'STN_Height': ' '}
 
-        line_already_compared = -1
-
-        # create an ordered list of obs
-        obs_from_station_list = []
-        for dict in obs_from_station_dict.values():
-            obs_from_station_list.append(dict)
-        sorted_obs_from_station_list = sorted(
-            obs_from_station_list, key=lambda i: i['Point_ID'])
-
-        for index, formatted_line_dict in enumerate(sorted_obs_from_station_list):
+        # match face left and face right shots by vertical angle and time order rather than by neighbouring point ID's
+        face_pairs, unpaired_lines = gsi.get_face_pairs(obs_from_station_dict)
 
-            obs_line_1_dict = formatted_line_dict
+        # display the pairs and the shots without a second face in point ID and time order
+        analysis_order = [(face_pair[0], face_pair) for face_pair in face_pairs]
+        analysis_order += [(gsi_line_number, None) for gsi_line_number in unpaired_lines]
+        analysis_order.sort(key=lambda item: (obs_from_station_dict[item[0]]['Point_ID'],
+                                              obs_from_station_dict[item[0]]['Timestamp'], item[0]))
 
+        for formatted_line_dict in obs_from_station_dict.values():
             if GSI.is_station_setup(formatted_line_dict):
                 # dont analyse stn setup - append to start of list
-                analysed_lines.insert(0, formatted_line_dict)
-                continue
-
-            # check to see if line has already compared
-            if index == line_already_compared:
-                continue
+                analysed_lines.append(formatted_line_dict)
 
-            # if not at the end of the dictionary ( could use try except IndexError )
-            try:
+        for gsi_line_number, face_pair in analysis_order:
 
-                # if index < len(sorted_obs_from_station_list):
-                obs_line_2_dict = sorted_obs_from_station_list[index + 1]
-
-            except IndexError:  # end of dictionary reached
-
-                pass
-            else:
+            obs_line_1_dict = obs_from_station_dict[gsi_line_number]
+            blank_line_dict = analysed_line_blank_values_dict.copy()
+            blank_line_dict['Point_ID'] = obs_line_1_dict['Point_ID']
 
-                # points match - lets analyse
-                if obs_line_1_dict['Point_ID'] == obs_line_2_dict['Point_ID']:
-
-                    for key, obs_line_1_field_value_str in obs_line_1_dict.items():
-
-                        obs_line_2_field_value_str = obs_line_2_dict[key]
-
-                        # default type
-                        if key == 'Timestamp':
-                            # time_difference = get_time_differance(obs_line_1_field_value_str,
-                            #                                       obs_line_2_field_value_str)
-                            obs_line_2_dict[key] = ' '
-                        elif key in ('Horizontal_Angle', 'Vertical_Angle'):
-                            field_type = FIELD_TYPE_ANGLE
-                            obs_line_1_field_value = get_numerical_value_from_string(
-                                obs_line_1_field_value_str, field_type, precision)
-
-                            obs_line_2_field_value = get_numerical_value_from_string(
-                                obs_line_2_field_value_str, field_type, precision)
-                            if key == 'Horizontal_Angle':
-                                angular_diff = decimalize_value(angular_difference(
-                                    obs_line_1_field_value, obs_line_2_field_value, 180), '3dp')
-                            else:  # key is vertical angle:
-                                obs_angular_diff = angular_difference(
-                                    obs_line_2_field_value, obs_line_1_field_value, 0)
-                                angular_diff = decimalize_value(
-                                    angular_difference(obs_angular_diff, -360.00, 0), '3dp')
-
-                            angle_dms = angle_decimal2DMS(angular_diff)
-                            # make 3dp precision for 4dp shots so it formats correctly
-                            obs_line_2_dict[key] = GSI.format_angles(
-                                angle_dms, '3dp')
-
-                        elif key == 'Prism_Constant':
-                            obs_line_2_dict[key] = str(
-                                int(obs_line_1_dict[key]) - int(obs_line_1_dict[key]))
-                        elif key == 'Point_ID':
-                            pass
-                        else:  # field should be a float
-                            field_type = FIELD_TYPE_FLOAT
-                            obs_line_1_field_value = get_numerical_value_from_string(
-                                obs_line_1_field_value_str, field_type, precision)
-
-                            obs_line_2_field_value = get_numerical_value_from_string(
-                                obs_line_2_field_value_str, field_type, precision)
-                            if (obs_line_1_field_value != "") and (obs_line_2_field_value != ""):
-                                float_diff_str = str(decimalize_value(
-                                    obs_line_1_field_value - obs_line_2_field_value, precision))
-                                float_diff_str = self.check_diff_exceed_tolerance(
-                                    key, float_diff_str)
-                                obs_line_2_dict[key] = float_diff_str
+            if face_pair is None:
 
-                else:
-                    # probably an orientation shot, or a shot that doesn't have a double - make blank and tag
+                # a single 2D orientation shot only needs one face
+                if not GSI.is_orientation_shot(obs_line_1_dict):
                     points_no_2nd_face.append(obs_line_1_dict['Point_ID'])
-                    blank_line_dict = analysed_line_blank_values_dict.copy()
-                    blank_line_dict['Point_ID'] = obs_line_1_dict['Point_ID']
                     blank_line_dict['Timestamp'] = '*'
-                    analysed_lines.append(blank_line_dict)
-                    continue
 
-                blank_line_dict = analysed_line_blank_values_dict.copy()
-                blank_line_dict['Point_ID'] = obs_line_1_dict['Point_ID']
                 analysed_lines.append(blank_line_dict)
-                analysed_lines.append(obs_line_2_dict)
-                line_already_compared = index + 1
+                continue
 
-            # else:
-            #     # end of the dictionary reached - do not analyse but add as it hasnt been compared
-            #     analysed_lines.append(obs_line_1_dict)
-            #     pass
+            point_tolerances = {tolerance_name: tolerance_arrays[tolerance_name][gsi_line_number]
+                                for tolerance_name in ('flfr_eastings', 'flfr_northings', 'flfr_height')}
+            obs_line_2_dict = self.analyse_face_pair(obs_line_1_dict, obs_from_station_dict[face_pair[1]],
+                                                     point_tolerances)
+
+            analysed_lines.append(blank_line_dict)
+            analysed_lines.append(obs_line_2_dict)
 
         return points_no_2nd_face, analysed_lines
 
-    def check_diff_exceed_tolerance(self, key, float_diff_str):
+    # returns the face right line with its values replaced by the differences to the face left line.  Differences
+    # exceeding the point's FL-FR tolerances are tagged
+    def analyse_face_pair(self, obs_line_1_dict, obs_line_2_dict, point_tolerances):
+
+        precision = survey_config.precision_value
+
+        for key, obs_line_1_field_value_str in obs_line_1_dict.items():
+
+            obs_line_2_field_value_str = obs_line_2_dict[key]
+
+            # default type
+            if key == 'Timestamp':
+                # time_difference = get_time_differance(obs_line_1_field_value_str,
+                #                                       obs_line_2_field_value_str)
+                obs_line_2_dict[key] = ' '
+            elif key in ('Horizontal_Angle', 'Vertical_Angle'):
+                field_type = FIELD_TYPE_ANGLE
+                obs_line_1_field_value = get_numerical_value_from_string(
+                    obs_line_1_field_value_str, field_type, precision)
+
+                obs_line_2_field_value = get_numerical_value_from_string(
+                    obs_line_2_field_value_str, field_type, precision)
+                if key == 'Horizontal_Angle':
+                    angular_diff = decimalize_value(angular_difference(
+                        obs_line_1_field_value, obs_line_2_field_value, 180), '3dp')
+                else:  # key is vertical angle:
+                    obs_angular_diff = angular_difference(
+                        obs_line_2_field_value, obs_line_1_field_value, 0)
+                    angular_diff = decimalize_value(
+                        angular_difference(obs_angular_diff, -360.00, 0), '3dp')
+
+                angle_dms = angle_decimal2DMS(angular_diff)
+                # make 3dp precision for 4dp shots so it formats correctly
+                obs_line_2_dict[key] = GSI.format_angles(
+                    angle_dms, '3dp')
+
+            elif key == 'Prism_Constant':
+                obs_line_2_dict[key] = str(
+                    int(obs_line_1_dict[key]) - int(obs_line_1_dict[key]))
+            elif key == 'Point_ID':
+                pass
+            else:  # field should be a float
+                field_type = FIELD_TYPE_FLOAT
+                obs_line_1_field_value = get_numerical_value_from_string(
+                    obs_line_1_field_value_str, field_type, precision)
+
+                obs_line_2_field_value = get_numerical_value_from_string(
+                    obs_line_2_field_value_str, field_type, precision)
+                if (obs_line_1_field_value != "") and (obs_line_2_field_value != ""):
+                    float_diff_str = str(decimalize_value(
+                        obs_line_1_field_value - obs_line_2_field_value, precision))
+                    float_diff_str = self.check_diff_exceed_tolerance(
+                        key, float_diff_str, point_tolerances)
+                    obs_line_2_dict[key] = float_diff_str
+
+        return obs_line_2_dict
+
+    def check_diff_exceed_tolerance(self, key, float_diff_str, point_tolerances):
 
         float_diff = float(float_diff_str)
 
-        # get flfr tolerances from config
-        flfr_height_tolerance = float(survey_config.flfr_height_tolerance)
-        flfr_northings_tolerance = float(survey_config.flfr_northing_tolerance)
-        flfr_eastings_tolerance = float(survey_config.flfr_easting_tolerance)
+        # get flfr tolerances of the point's tolerance class
+        flfr_height_tolerance = point_tolerances['flfr_height']
+        flfr_northings_tolerance = point_tolerances['flfr_northings']
+        flfr_eastings_tolerance = point_tolerances['flfr_eastings']
 
         if key == 'Elevation':
             if abs(float_diff) > flfr_height_tolerance:
@@ -1237,7 +1524,7 @@ class MenuBar(tk.Frame):
                 # add a tag
                 float_diff_str = '*' + float_diff_str
         elif key == 'Northing':
-            if abs(float_diff) > flfr_height_tolerance:
+            if abs(float_diff) > flfr_northings_tolerance:
                 # add a tag
                 float_diff_str = '*' + float_diff_str
 
@@ -1256,6 +1543,11 @@ class MenuBar(tk.Frame):
         self.check_target_heights()
         self.check_3d_survey()
         self.check_target_naming()
+        self.check_point_locations()
+        self.check_repeated_observations()
+        self.check_cogo()
+        self.check_height_loops()
+        self.check_qa_rules()
 
     def change_target_height(self):
 
@@ -1352,6 +1644,17 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\nprism_constant_update_batch()\n\n" + str(ex))
             return
 
+    def target_height_update_batch(self):
+        try:
+            TargetHeightBatchUpdate(self.master)
+        except Exception as ex:
+            print("Problem opening up the GSI file\n\n" + str(ex))
+            logger.exception(
+                "An unexpected error has occurred\n\ntarget_height_update_batch()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\ntarget_height_update_batch()\n\n" + str(ex))
+            return
+
     def check_2d_doubles(self):
 
         error_text = ""
@@ -1364,37 +1667,11 @@ class MenuBar(tk.Frame):
                 return
 
             # All the shots from each station should have 2 points with 4 shots each.  Lets check for that.
-            # First, lets get a lits of the station setups so we can get all the shots from each setup
-            station_points_dict = gsi.get_list_of_station_setups(
-                gsi.formatted_lines)
-            for gsi_stn_line_number, station_name in station_points_dict.items():
-
-                # reset the below list for each station setup
-                point_id_list = []
-                more_than_4_shots_list = []
-                doubles_list = []
-
-                station_shots_dict = gsi.get_all_shots_from_a_station_including_setup(
-                    station_name, gsi_stn_line_number)
-
-                # lets go through all shots except station setup and orientation shots and count frequency of Point ID's
-                for gsi_line_number, formatted_line in station_shots_dict.items():
-                    if gsi.is_station_setup(formatted_line) or gsi.is_orientation_shot(formatted_line):
-                        continue
-                    else:
-                        point_id_list.append(formatted_line['Point_ID'])
+            setup_statistics = gsi.get_setup_statistics()
+            for gsi_stn_line_number, setup in setup_statistics.setups.items():
 
-                # Lets check the frequency of points from this setup
-                point_id_frequency = Counter(point_id_list)
-
-                for point_id, count in point_id_frequency.items():
-                    if count > 3:  # point has been shot 4 or more times
-                        doubles_list.append(point_id)
-                    # elif count > 4:   # point has been shot more than 4 times - let user know
-                    #     more_than_4_shots_list.append(point_id)
-
-                    else:  # just a normal double radiation
-                        continue
+                station_name = setup['station_name']
+                doubles_list = setup_statistics.get_double_doubles(gsi_stn_line_number)
 
                 # Lets check to see the frequency of doubles for this setup.  There should be two double doubles.
                 if len(doubles_list) == 0:
@@ -1428,6 +1705,33 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\ncheck_2d_doubles()\n\n" + str(ex))
             return
 
+    # Returns the archived survey of the current job whose point IDs are most similar to the open GSI file, or None
+    def get_most_similar_survey(self):
+
+        try:
+            # the job directory is the first directory below the monitoring job directory e.g. .../2020/MONITORING/A9 Ravenswood
+            relative_path = os.path.relpath(MenuBar.filename_path, self.monitoring_job_dir)
+
+            if relative_path.startswith(os.pardir) or os.sep not in relative_path:
+                job_directory = self.monitoring_job_dir
+            else:
+                job_directory = os.path.join(self.monitoring_job_dir, relative_path.split(os.sep)[0])
+
+            self.survey_index.update(job_directory)
+            point_ids = {formatted_line['Point_ID'] for formatted_line in gsi.formatted_lines}
+            similar_surveys = self.survey_index.rank_similar_surveys(point_ids, job_directory, MenuBar.filename_path)
+
+        except Exception as ex:
+            # the file dialog still opens in the monitoring directory
+            logger.exception("Unable to find a similar survey\n\n" + str(ex))
+            return None
+
+        if similar_surveys and similar_surveys[0][0] > 0:
+            logger.info('Most similar survey: ' + similar_surveys[0][1] + ' (' + str(similar_surveys[0][0]) + ')')
+            return similar_surveys[0][1]
+
+        return None
+
     def compare_survey(self):
         try:
             if not MenuBar.filename_path:
@@ -1435,107 +1739,89 @@ class MenuBar(tk.Frame):
                     "Compare Survey", "Please open up a GSI file first.")
                 return
 
-            points_pc_diff_dict = {}
-            points_target_height_diff_dict = {}
-            old_point_ids = set()
-            new_point_ids = set()
+            # preselect the previous survey of this job with the most points in common
+            similar_survey_filepath = self.get_most_similar_survey()
 
-            old_survey_filepath = tk.filedialog.askopenfilename(parent=self.master, initialdir=self.monitoring_job_dir,
-                                                                title="Please choose a similar survey", filetypes=[("GSI Files", ".GSI")])
+            if similar_survey_filepath:
+                old_survey_filepaths = tk.filedialog.askopenfilenames(parent=self.master,
+                                                                      initialdir=os.path.dirname(similar_survey_filepath),
+                                                                      initialfile=os.path.basename(similar_survey_filepath),
+                                                                      title="Please choose one or more similar surveys",
+                                                                      filetypes=[("GSI Files", ".GSI")])
+            else:
+                old_survey_filepaths = tk.filedialog.askopenfilenames(parent=self.master, initialdir=self.monitoring_job_dir,
+                                                                      title="Please choose one or more similar surveys",
+                                                                      filetypes=[("GSI Files", ".GSI")])
 
-            if not old_survey_filepath:  # user cancelled
+            if not old_survey_filepaths:  # user cancelled
                 return
 
-            old_survey_gsi = GSI(logger, survey_config)
-            old_survey_gsi.format_gsi(old_survey_filepath)
-            old_survey_formatted_lines_except_setups = old_survey_gsi.get_all_lines_except_setup()
-            old_point_compare_dict = OrderedDict()
+            old_survey_gsis = []
+
+            for old_survey_filepath in old_survey_filepaths:
+                old_survey_gsi = GSI(logger, survey_config)
+                old_survey_gsi.format_gsi(old_survey_filepath)
+                old_survey_gsis.append(old_survey_gsi)
+
+            survey_differences = SurveyComparison(gsi).compare_all(old_survey_gsis)
 
             line_number_errors = set()
+            old_point_ids = set()
+            diff_points = set()
 
             dialog_subject = "Survey Comparision"
             all_good_text = "Point naming, prism constants and target heights match between surveys "
-            error_text = "A difference between the two surveys was found:\n\n"
-
-            # Create a dictionary of points and their prism constant.
-            # ASSUMPTION: prism constant for an old survey with no errors should be the same for the same point ID
-            for index, formatted_line in enumerate(old_survey_formatted_lines_except_setups):
-                # add a unique point ID so we are not overwritting point_id with potential different values
-                old_point_compare_dict[formatted_line['Point_ID'] + str(index)] = {'old_point_id': formatted_line['Point_ID'],
-                                                                                   'Prism_Constant': formatted_line['Prism_Constant'],
-                                                                                   'Target_Height': formatted_line['Target_Height']}
-                old_point_ids.add(formatted_line['Point_ID'])
-
-            # for each point and its corresponding PC in old survey, check to see it matches PC in current survey
-            for old_compare_values_list in old_point_compare_dict.values():
-
-                for line_number, current_gsi_line in enumerate(gsi.formatted_lines, start=1):
-
-                    # check to see if point id is a control point and skip if true
-                    if gsi.is_station_setup(current_gsi_line):
-                        continue
+            error_text = ""
 
-                    current_point_id = current_gsi_line['Point_ID']
-                    current_PC = current_gsi_line['Prism_Constant']
-                    current_target_height = current_gsi_line['Target_Height']
+            for old_survey_filepath, differences in zip(old_survey_filepaths, survey_differences):
 
-                    new_point_ids.add(current_point_id)
+                line_number_errors.update(differences['line_numbers'])
+                old_point_ids.update(differences['old_point_ids'])
+                diff_points.update(differences['missing_points'])
 
-                    if old_compare_values_list['old_point_id'] == current_point_id:
-
-                        # Compare PC - they should be the same.  If not report to user
-                        if old_compare_values_list['Prism_Constant'] != current_PC:
-                            points_pc_diff_dict[current_point_id] = {
-                                'current_pc': current_PC, 'old_pc': old_compare_values_list['Prism_Constant']}
-                            line_number_errors.add(line_number)
-
-                        # Compare target height - they should be the same.  If not report to user
-                        print(current_point_id + "  " +
-                              old_compare_values_list['Target_Height'])
-                        if old_compare_values_list['Target_Height'] != current_target_height:
-                            points_target_height_diff_dict[current_point_id] = {'current_target_height': current_target_height,
-                                                                                'old_target_height': old_compare_values_list['Target_Height']}
-                            line_number_errors.add(line_number)
+                if not differences['line_numbers']:
+                    continue
 
-            # get list of points if any, that are different between the two surveys
-            diff_points = sorted((new_point_ids.difference(old_point_ids)))
+                if len(old_survey_filepaths) > 1:
+                    error_text += os.path.basename(old_survey_filepath) + ':\n\n'
 
-            # check if any errors found
-            if points_pc_diff_dict or points_target_height_diff_dict or diff_points:
-
-                if points_pc_diff_dict:
+                if differences['Prism_Constant']:
 
                     error_text += 'DIFFERENCES IN PRISM CONSTANT:\n\n'
-                    for point, differences_dict in points_pc_diff_dict.items():
-                        error_text += ' ' + point + ' ----> current PC: ' + differences_dict['current_pc'] + '  old PC: ' + differences_dict[
-                            'old_pc'] + '\n'
+                    for point, (current_pcs, old_pcs) in differences['Prism_Constant'].items():
+                        error_text += ' ' + point + ' ----> current PC: ' + ', '.join(current_pcs) + '  old PC: ' + \
+                                      ', '.join(old_pcs) + '\n'
 
-                if points_target_height_diff_dict:
+                if differences['Target_Height']:
 
                     error_text += '\nDIFFERENCES IN TARGET HEIGHT:\n\n'
-                    for point, differences_dict in points_target_height_diff_dict.items():
-                        error_text += ' ' + point + ' ---> current height: ' + differences_dict['current_target_height'] + '  old height: ' + \
-                                      differences_dict['old_target_height'] + '\n'
+                    for point, (current_heights, old_heights) in differences['Target_Height'].items():
+                        error_text += ' ' + point + ' ---> current height: ' + ', '.join(current_heights) + '  old height: ' + \
+                                      ', '.join(old_heights) + '\n'
 
-                if diff_points:
+                if differences['missing_points']:
                     error_text += '\nThe following list of points were not found in the compared survey:\n\n'
-                    for point in diff_points:
+                    for point in differences['missing_points']:
                         error_text += "  " + point + '\n'
 
-                        # add line numbers where point_id is found in current gsi
-                        point_line_number_errors = gsi.get_point_name_line_numbers(
-                            point)
-                        for line_number in point_line_number_errors:
-                            line_number_errors.add(line_number)
-
-                display_text = error_text + '\nThese differences will be highlighted in yellow'
+                error_text += '\n'
 
+            # check if any errors found
+            if error_text:
+                display_text = "A difference between the surveys was found:\n\n" + error_text + \
+                               'These differences will be highlighted in yellow'
             else:
                 display_text = all_good_text
 
             tkinter.messagebox.showinfo(dialog_subject, display_text)
             gui_app.list_box.populate(
-                gsi.formatted_lines, list(line_number_errors))
+                gsi.formatted_lines, sorted(line_number_errors))
+
+            # suggest the closest point name in the compared surveys for any points not found in any of them
+            diff_points.difference_update(old_point_ids)
+
+            if diff_points:
+                self.suggest_point_renames(dialog_subject, sorted(diff_points), old_point_ids)
 
         except Exception as ex:
             print("Problem opening up the GSI file\n\n" + str(ex))
@@ -1556,6 +1842,29 @@ class MenuBar(tk.Frame):
                 "Survey Assist", "An unexpected error has occurred\n\nexport_csv()\n\n" + str(ex))
             return
 
+    def export_point_statistics(self):
+
+        if not MenuBar.filename_path:
+            tk.messagebox.showinfo(
+                "Export Point Statistics", "Please open up a GSI file first.")
+            return
+
+        try:
+            csv_file_path = tk.filedialog.asksaveasfilename(parent=self.master, initialdir=os.path.dirname(MenuBar.filename_path),
+                                                            initialfile=os.path.splitext(os.path.basename(MenuBar.filename_path))[0] +
+                                                            '_Point_Statistics.csv', title="Export point statistics",
+                                                            defaultextension=".csv", filetypes=[("CSV Files", ".csv")])
+            if not csv_file_path:  # user cancelled
+                return
+
+            gsi.export_point_statistics(csv_file_path)
+
+        except Exception as ex:
+            logger.exception(
+                "An unexpected error has occurred\n\nexport_point_statistics()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nexport_point_statistics()\n\n" + str(ex))
+
     def display_query_input_box(self):
 
         QueryDialogWindow(self.master)
@@ -1643,6 +1952,53 @@ class MenuBar(tk.Frame):
 
         CombineGSIFilesWindow(self.master)
 
+    # CompNet needs full GSI files, so write out edited variants that were saved as deltas
+    def materialise_gsi_deltas(self):
+        try:
+            delta_file_paths = tk.filedialog.askopenfilenames(parent=self.master, initialdir=survey_config.todays_dated_directory or
+                                                              self.monitoring_job_dir, title="Please select GSI delta files",
+                                                              filetypes=[("GSI Delta Files", GSIDelta.FILE_EXTENSION)])
+
+            if not delta_file_paths:  # user cancelled
+                return
+
+            gsi_file_paths = [GSIDelta.read(delta_file_path).materialise() for delta_file_path in delta_file_paths]
+
+            tk.messagebox.showinfo("Survey Assist", "The following GSI files have been created:\n\n" +
+                                   '\n'.join(os.path.basename(gsi_file_path) for gsi_file_path in gsi_file_paths))
+
+        except Exception as ex:
+            print("Problem creating GSI files from deltas\n\n" + str(ex))
+            logger.exception(
+                "An unexpected error has occurred\n\nmaterialise_gsi_deltas()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nmaterialise_gsi_deltas()\n\n" + str(ex))
+
+    def show_network_summary(self):
+
+        if not MenuBar.filename_path:
+            tk.messagebox.showinfo(
+                "Network Summary", "Please open up a GSI file first.")
+            return
+
+        try:
+            tkinter.messagebox.showinfo(
+                "Network Summary", gsi.get_observation_graph().get_summary())
+
+        except Exception as ex:
+            logger.exception('Error creating network summary\n\n' + str(ex))
+            tk.messagebox.showerror(
+                "Error", 'Error creating network summary:\n\n' + str(ex))
+
+    def show_station_summary(self):
+
+        if not MenuBar.filename_path:
+            tk.messagebox.showinfo(
+                "Station Summary", "Please open up a GSI file first.")
+            return
+
+        StationSummaryWindow(self.master)
+
     def create_CSV_from_ASC(self):
 
         try:
@@ -1885,44 +2241,15 @@ class MenuBar(tk.Frame):
             if not MenuBar.filename_path:  # no gsi open
                 return
 
-            change_points = gsi.get_change_points()
-            # change_points = []
-
-            # get a list of stations
-            control_points_dict = gsi.get_list_of_station_setups(
-                gsi.formatted_lines)
-
-            # # determine change points. First create a point id list
-            # point_id_list = []
-            # for formatted_line in gsi.formatted_lines:
-            #     point_id_list.append(formatted_line['Point_ID'])
-            #
-            # point_id_frequency = Counter(point_id_list)
-            #
-            # # if point_id occurs more than 4 times its probably a change point
-            # for point_id, count in point_id_frequency.items():
-            #     if count > 3:
-            #         if point_id in control_points_dict.values():
-            #             continue  # dont add stations to change point list
-            #         else:
-            #             change_points.append(point_id)
+            setup_statistics = gsi.get_setup_statistics()
 
             # determine the change points for each station setup
-            for line_number, control_name in control_points_dict.items():
-                shots_from_station = gsi.get_all_shots_from_a_station_including_setup(
-                    control_name, line_number)
-
-                station_change_points = set()
+            for setup_line_number, setup in setup_statistics.setups.items():
 
-                for formatted_line in shots_from_station.values():
-                    # should only ever be one
-                    if gsi.is_station_setup(formatted_line):
-                        change_point_list_text += "@" + control_name + '\n'
-                    elif formatted_line['Point_ID'] in change_points:
-                        station_change_points.add(formatted_line['Point_ID'])
+                change_point_list_text += "@" + setup['station_name'] + '\n'
 
                 # formatted the file to write out
-                for change_point in sorted(station_change_points):
+                for change_point in setup_statistics.get_setup_change_points(setup_line_number):
                     change_point_list_text += "   " + change_point + '\n'
 
             # Write out file
@@ -2070,64 +2397,134 @@ class MenuBar(tk.Frame):
     @staticmethod
     def client_exit():
         # logger.info("Exiting the application")
-        exit()
+        if MenuBar.ask_save_edits():
+            exit()
 
+    # closing the main window with the title bar X
     @staticmethod
-    def delete_orientation_shots():
+    def close_window(root):
 
-        deleted_lines = []  # used to display to user after deletion
+        if MenuBar.ask_save_edits():
+            root.destroy()
 
-        try:
+    # Asks the user whether to save any unsaved edits before the GSI file is closed or re-read.  Returns False if the
+    # user cancels, or the edits couldn't be saved, so the file isn't closed
+    @staticmethod
+    def ask_save_edits():
 
-            with open(MenuBar.filename_path, "r") as gsi_file:
+        if not gsi.filename or not gsi.edit_journal.is_modified():
+            return True
 
-                line_list = list(gsi_file)  # puts all lines in a list
+        save_edits = tk.messagebox.askyesnocancel("Survey Assist", "Do you want to save the changes made to " +
+                                                  os.path.basename(gsi.filename) + "?")
 
-                counter = 1  # this is used to keep track so the correct line is deleted
+        if save_edits is None:
+            return False
 
-                for orientation_line_number in ListBoxFrame.orientation_line_numbers:
-                    deleted_lines.append(
-                        line_list[int(orientation_line_number) - counter])
+        if save_edits:
+            open_file_path = gsi.filename
 
-                    del line_list[int(orientation_line_number) - counter]
-                    counter += 1
+            try:
+                saved_file_path = gsi.save_edits()
+            except Exception as ex:
+                logger.exception(
+                    "An unexpected error has occurred\n\nask_save_edits()\n\n" + str(ex))
+                tk.messagebox.showerror(
+                    "Survey Assist", "An unexpected error has occurred saving the changes\n\n" + str(ex))
+                return False
 
-            # rewrite the line_list from list contents/elements:
-            with open(MenuBar.filename_path, "w") as gsi_file:
-                for line in line_list:
-                    gsi_file.write(line)
+            # re-reading the same survey should show the saved edits
+            if MenuBar.filename_path and os.path.normpath(MenuBar.filename_path) == os.path.normpath(open_file_path):
+                MenuBar.filename_path = saved_file_path
 
-            print("deleted lines are: \n\n" + str(deleted_lines))
+        return True
 
-            # rebuild database and GUI
-            GUIApplication.refresh()
+    @staticmethod
+    def save_gsi_file():
+        try:
+            if not gsi.edit_journal.is_modified():
+                return
 
-            msg_deleted_lines = str(len(deleted_lines)) + \
-                " 2D orientation shots have been deleted"
+            MenuBar.filename_path = gsi.save_edits()
+            MenuBar.update_point_registry()
+            MenuBar.update_status_bar()
 
-            # display deleted lines dialog box
-            tkinter.messagebox.showinfo(
-                "2D Orientation Shots", msg_deleted_lines)
+        except Exception as ex:
+            print("Problem saving the GSI file\n\n" + str(ex))
+            logger.exception(
+                "An unexpected error has occurred\n\nsave_gsi_file()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nsave_gsi_file()\n\n" + str(ex))
 
-        except FileNotFoundError:
+    @staticmethod
+    def undo_edit():
+        try:
+            if not gsi.edit_journal.can_undo():
+                return
 
-            # Do nothing: User has hit the cancel button
-            gui_app.status_bar.status['text'] = 'Please choose a GSI File'
+            edit = gsi.undo_edit()
+            MenuBar.refresh_edits([line_index + 1 for line_index in edit['lines']])
+            gui_app.status_bar.status['text'] += '    Undone: ' + edit['description']
 
-        except CorruptedGSIFileError:
+        except Exception as ex:
+            logger.exception(
+                "An unexpected error has occurred\n\nundo_edit()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nundo_edit()\n\n" + str(ex))
 
-            # Most likely an corrupted GSI file was selected
+    @staticmethod
+    def redo_edit():
+        try:
+            if not gsi.edit_journal.can_redo():
+                return
+
+            edit = gsi.redo_edit()
+            MenuBar.refresh_edits([line_index + 1 for line_index in edit['lines']])
+            gui_app.status_bar.status['text'] += '    Redone: ' + edit['description']
+
+        except Exception as ex:
+            logger.exception(
+                "An unexpected error has occurred\n\nredo_edit()\n\n" + str(ex))
             tk.messagebox.showerror(
-                "LOADING GSI", 'Error reading GSI File:\n\nThis file is a corrupted or incorrect GSI file')
+                "Survey Assist", "An unexpected error has occurred\n\nredo_edit()\n\n" + str(ex))
 
-            gui_app.status_bar.status['text'] = 'Please choose a GSI File'
+    # Deletes lines from the survey in memory and removes just those rows from the database and list box.  The file is
+    # written once.  Returns the deleted gsi lines
+    @staticmethod
+    def delete_lines(line_numbers):
+
+        number_of_lines = len(gsi.formatted_lines)
+        deleted_lines = gsi.delete_lines(line_numbers)
+        MenuBar.filename_path = gsi.filename
+
+        database.delete_rows(line_numbers)
+        gui_app.list_box.remove_lines(line_numbers, number_of_lines)
+        MenuBar.update_point_registry()
+        MenuBar.update_status_bar()
+
+        return deleted_lines
+
+    @staticmethod
+    def delete_orientation_shots():
+
+        try:
+            deleted_lines = MenuBar.delete_lines(ListBoxFrame.orientation_line_numbers)
+
+            print("deleted lines are: \n\n" + str(deleted_lines))
+
+            msg_deleted_lines = str(len(deleted_lines)) + \
+                " 2D orientation shots have been deleted"
+
+            # display deleted lines dialog box
+            tkinter.messagebox.showinfo(
+                "2D Orientation Shots", msg_deleted_lines)
 
         except Exception as ex:
 
-            # Most likely an incorrect file was chosen
+            # Most likely the file is opened by another program
             logger.exception('Error has occurred. ')
 
-            tk.messagebox.showerror("ERROR", 'Error reading GSI File:\n\nPlease make sure file is not opened '
+            tk.messagebox.showerror("ERROR", 'Error writing GSI File:\n\nPlease make sure file is not opened '
                                              'by another program.  If problem continues please contact Richard Walter\n\n' + str(ex))
 
 
@@ -3134,45 +3531,49 @@ class ListBoxFrame(tk.Frame):
             line_numbers_to_delete.append(
                 self.list_box_view.item(selected_item)['values'][0])
 
+        if not line_numbers_to_delete:
+            return
+
         try:
-            # get gsi file so lines can be deleted
-            with open(MenuBar.filename_path, "r") as gsi_file:
+            MenuBar.delete_lines(line_numbers_to_delete)
 
-                gsi_line_list = list(gsi_file)  # puts all lines in a list
+        except Exception as ex:
 
-                for index, line_number in enumerate(line_numbers_to_delete, start=1):
-                    del gsi_line_list[line_number - index]
+            # Most likely the file is opened by another program
+            logger.exception('Error has occurred.\n\n' + str(ex))
 
-                print(gsi_line_list)
+            tk.messagebox.showerror("ERROR", 'Error writing GSI File:\n\nPlease make sure file is not opened '
+                                             'by another program.  If problem continues please contact Richard Walter')
 
-            # rewrite the line_list from list contents/elements:
-            with open(MenuBar.filename_path, "w") as gsi_file:
-                for line in gsi_line_list:
-                    gsi_file.write(line)
+    # Removes the rows of deleted gsi lines and renumbers the rows after them.  number_of_lines is the number of gsi lines
+    # before the deletion - if the list box isn't showing every line (e.g. query results) it is re-populated instead
+    def remove_lines(self, line_numbers, number_of_lines):
 
-        except FileNotFoundError:
+        items = self.list_box_view.get_children()
 
-            # Do nothing: User has hit the cancel button
-            gui_app.status_bar.status['text'] = 'Please choose a GSI File'
+        if len(items) != number_of_lines:
+            self.populate(gsi.formatted_lines)
+            return
 
-        except CorruptedGSIFileError as ex:
+        line_numbers = sorted(set(line_numbers))
+        self.list_box_view.delete(*[items[line_number - 1] for line_number in line_numbers])
 
-            # Most likely an corrupted GSI file was selected
-            tk.messagebox.showerror("ERROR", 'Error reading GSI File:\n\nThis file is a corrupted or '
-                                             'incorrect GSI file\n\n' + str(ex))
+        deleted_line_count = 0
+        ListBoxFrame.orientation_line_numbers = []
 
-            gui_app.status_bar.status['text'] = 'Please choose a GSI File'
+        for line_number, item in enumerate(items, start=1):
 
-        except Exception as ex:
+            if deleted_line_count < len(line_numbers) and line_numbers[deleted_line_count] == line_number:
+                deleted_line_count += 1
+                continue
 
-            # Most likely an incorrect file was chosen
-            logger.exception('Error has occurred.\n\n' + str(ex))
+            new_line_number = line_number - deleted_line_count
 
-            tk.messagebox.showerror("ERROR", 'Error reading GSI File:\n\nPlease make sure file is not opened '
-                                             'by another program.  If problem continues please contact Richard Walter')
-            #
-            # # rebuild database and GUI
-        GUIApplication.refresh()
+            if deleted_line_count:
+                self.list_box_view.set(item, '#1', new_line_number)
+
+            if self.orientation_tag in self.list_box_view.item(item, 'tags'):
+                ListBoxFrame.orientation_line_numbers.append(new_line_number)
 
 
 class CreateDatedDirectoryWindow:
@@ -3319,6 +3720,36 @@ class ImportRailMonitoringFileWindow:
         self.dialog_window.destroy()
 
 
+class StationSummaryWindow:
+
+    def __init__(self, master):
+
+        self.master = master
+
+        summary_rows = gsi.get_setup_statistics().get_summary_rows()
+        column_names = list(summary_rows[0].keys()) if summary_rows else ['Station']
+
+        self.dialog_window = tk.Toplevel(self.master)
+        self.dialog_window.title("Station Summary")
+
+        self.summary_view = ttk.Treeview(self.dialog_window, columns=column_names, show='headings', selectmode='browse')
+
+        for column_name in column_names:
+            self.summary_view.heading(column_name, text=column_name)
+            self.summary_view.column(column_name, width=250 if column_name == 'Change Points' else 90, anchor='w')
+
+        for summary_row in summary_rows:
+            self.summary_view.insert('', 'end', values=list(summary_row.values()))
+
+        self.yscrollbar = ttk.Scrollbar(self.dialog_window, orient='vertical', command=self.summary_view.yview)
+        self.summary_view.configure(yscrollcommand=self.yscrollbar.set)
+
+        self.summary_view.pack(side=tk.LEFT, expand=True, fill='both')
+        self.yscrollbar.pack(side=tk.LEFT, fill='y')
+
+        self.dialog_window.geometry(MainWindow.position_popup(self.master, 1000, 400))
+
+
 class PointNameWindow:
 
     def __init__(self, master):
@@ -3348,7 +3779,7 @@ class PointNameWindow:
             new_point_name = self.new_point_name_entry.get().strip()
             print(new_point_name)
 
-            if len(new_point_name) < 16:
+            if len(new_point_name) <= GSI.MAX_POINT_ID_LENGTH:
 
                 line_numbers_to_ammend = []
 
@@ -3360,30 +3791,20 @@ class PointNameWindow:
                         line_numbers_to_ammend.append(
                             gui_app.list_box.list_box_view.item(selected_item)['values'][0])
 
+                    gsi.begin_edit('Change point name to ' + new_point_name, '_EDITED')
+
                     # update each line to amend with new target height and coordinates
                     for line_number in line_numbers_to_ammend:
                         gsi.update_point_name(line_number, new_point_name)
 
-                    if "EDITED" not in MenuBar.filename_path:
-                        amended_filepath = MenuBar.filename_path[:-
-                                                                 4] + "_EDITED.gsi"
-                    else:
-                        amended_filepath = MenuBar.filename_path
-
-                    # create a new ammended gsi file
-                    with open(amended_filepath, "w") as gsi_file:
-                        for line in gsi.unformatted_lines:
-                            gsi_file.write(line)
-
                     self.dialog_window.destroy()
 
                     # rebuild database and GUI
-                    MenuBar.filename_path = amended_filepath
-                    GUIApplication.refresh()
+                    MenuBar.refresh_edits(gsi.end_edit())
             else:
                 # notify user that no lines were selected
                 tk.messagebox.showinfo(
-                    "INPUT ERROR", "Point names must be less than 15 characters in length.")
+                    "INPUT ERROR", "Point names must be " + str(GSI.MAX_POINT_ID_LENGTH) + " characters or less in length.")
         except Exception as ex:
             print("Problem opening up the GSI file\n\n" + str(ex))
             logger.exception(
@@ -3483,23 +3904,24 @@ class PrismConstantUpdate:
             self.line_numbers_to_amend = gsi.get_point_name_line_numbers(
                 self.point_name)
 
+        gsi.begin_edit('Change prism constant of ' + self.point_name, '_PCUpdated')
+
         # update each line to amend with coordinates
         for line_number in self.line_numbers_to_amend:
             corrections = self.get_prism_constant_corrections(
                 line_number, self.prism_constant_selected)
             if corrections.get('error', ""):
                 # something unexpected went wrong
+                gsi.cancel_edit()
                 tk.messagebox.showinfo(
                     "Updating Prism Constant", "An unexpected has occurred during update.")
                 return
 
             gsi.pc_change_update_coordinates(line_number, corrections)
 
-        self.create_updated_pc_gsi_file(self.line_numbers_to_amend)
+        self.show_updated_pc_lines()
 
     def run_pc_batch_file(self):
-        lines_amended = []
-        point_names_not_found_in_batch_file = set()
         self.pc_batch_file_selected = self.pc_column_entry.get()
 
         if not self.pc_batch_file_selected:
@@ -3518,37 +3940,20 @@ class PrismConstantUpdate:
             for row in csv_file:
                 point_pc_lookup_dict[row[0]] = row[1]
 
-        # update coordinates for each line
-        for line_number, formatted_line in enumerate(gsi.formatted_lines, start=1):
-            if gsi.is_station_setup(formatted_line):
-                continue  # can't update pc of a setup
-
-            point_name = formatted_line['Point_ID']
-            try:
-                old_prism_constant = formatted_line['Prism_Constant']
-                new_prism_constant = point_pc_lookup_dict[point_name]
-            except KeyError:
-                # tk.messagebox.showwarning("Updating Prism Constant", "Couldn't find the following point name in the pc batch file\n\n" + point_name)
-                point_names_not_found_in_batch_file.add(point_name)
-                continue
-            else:
-                # if PC is the same then skip
-                if old_prism_constant == str(gsi.PC_DICT_GSI_VALUES[new_prism_constant]):
-                    continue
-
-                corrections = self.get_prism_constant_corrections(
-                    line_number, new_prism_constant)
-                if corrections.get('error', ""):
-                    # something unexpected went wrong
-                    tk.messagebox.showinfo(
-                        "Updating Prism Constant", "An unexpected has occurred during update.")
-                    return
+        gsi.begin_edit('Prism constant batch file ' + self.pc_batch_file_selected, '_PCUpdated')
 
-                gsi.pc_change_update_coordinates(line_number, corrections)
-                lines_amended.append(line_number)
+        # update the prism constant and coordinates of every shot to a point in the batch file
+        try:
+            lines_amended, point_names_not_found_in_batch_file = gsi.update_prism_constants(point_pc_lookup_dict)
+        except Exception as ex:
+            # something unexpected went wrong
+            gsi.cancel_edit()
+            logger.exception("An unexpected error has occurred\n\nrun_pc_batch_file()\n\n" + str(ex))
+            tk.messagebox.showinfo(
+                "Updating Prism Constant", "An unexpected has occurred during update.\n\n" + str(ex))
+            return
 
-                print("Line amended " + str(line_number) + ":   old PC = " + old_prism_constant + "  new PC = " + str(gsi.PC_DICT_GSI_VALUES[
-                    new_prism_constant]))
+        logger.info(str(len(lines_amended)) + " lines amended with prism constants from " + self.pc_batch_file_selected)
 
         # display to user any points not found in batch file
         points_dialog_msg = ""
@@ -3558,34 +3963,19 @@ class PrismConstantUpdate:
         tk.messagebox.showwarning("Updating Prism Constant", "Warning:  Couldn't find the following point names in the pc batch file:\n\n" +
                                   points_dialog_msg)
 
-        self.create_updated_pc_gsi_file(lines_amended)
+        self.show_updated_pc_lines()
 
         self.dialog_window.destroy()
 
     def cancel(self):
         self.dialog_window.destroy()
 
-    def create_updated_pc_gsi_file(self, lines_amended=None):
-
-        if "PCUpdated" not in MenuBar.filename_path:
-
-            amended_filepath = MenuBar.filename_path[:-4] + "_PCUpdated.gsi"
-        else:
-            amended_filepath = MenuBar.filename_path
-
-        # create a new amended gsi file
-        with open(amended_filepath, "w") as gsi_file:
-            for line in gsi.unformatted_lines:
-                gsi_file.write(line)
+    def show_updated_pc_lines(self):
 
         self.dialog_window.destroy()
 
         # rebuild database and GUI
-        MenuBar.filename_path = amended_filepath
-        MenuBar.format_gsi_file()
-        MenuBar.create_and_populate_database()
-        gui_app.list_box.populate(gsi.formatted_lines, lines_amended)
-        gui_app.status_bar.status['text'] = MenuBar.filename_path
+        MenuBar.refresh_edits(gsi.end_edit())
 
     def get_prism_constant_corrections(self, line_number, prism_constant_selected):
 
@@ -3697,8 +4087,6 @@ class TargetHeightWindow(ChangeHeightWindow):
 
         self.master = master
 
-        self.new_stn_coordinates = OrderedDict()
-
         # create target height input dialog box
         self.dialog_window = tk.Toplevel(self.master)
 
@@ -3719,9 +4107,6 @@ class TargetHeightWindow(ChangeHeightWindow):
 
     def fix_target_height(self):
 
-        station_setup_dic = gsi.get_list_of_station_setups(gsi.formatted_lines)
-        stn_setup_elevation_updated = set()
-
         try:
             # set the new target height the user has entered
             new_target_height = self.get_entered_height(
@@ -3742,48 +4127,23 @@ class TargetHeightWindow(ChangeHeightWindow):
 
                     line_numbers_to_ammend.append(line_number)
 
-                # update each line to amend with new target height and coordinates
-                for line_number in line_numbers_to_ammend:
-                    point_id = gsi.get_formatted_line(line_number)['Point_ID']
-                    corrections = self.get_target_height_corrections(
-                        line_number, new_target_height)
-                    gsi.update_target_height(line_number, corrections)
-
-                    # update station setup coordinates if this is a shot to a station
-                    for stn_gsi_line_number, stn_point_id in station_setup_dic.items():
-                        stn_formatted_line_number = stn_gsi_line_number + 1
-
-                        # if shot is to a station and it the station setup elevation hasn't already been updated
-                        if point_id == stn_point_id and point_id not in stn_setup_elevation_updated:
-                            new_elevation = str(decimalize_value(
-                                corrections['83'], self.precision))
-                            gsi.update_station_elevation(
-                                stn_formatted_line_number, new_elevation)
-                            stn_setup_elevation_updated.add(point_id)
-
-                if "TgtUpdated" not in MenuBar.filename_path:
-
-                    amended_filepath = MenuBar.filename_path[:-
-                                                             4] + "_TgtUpdated.gsi"
-                else:
-                    amended_filepath = MenuBar.filename_path
+                point_target_heights = {gsi.get_formatted_line(line_number)['Point_ID']: new_target_height
+                                        for line_number in line_numbers_to_ammend}
 
-                # create a new ammended gsi file
-                with open(amended_filepath, "w") as gsi_file:
-                    for line in gsi.unformatted_lines:
-                        gsi_file.write(line)
+                gsi.begin_edit('Change target height to ' + str(new_target_height), '_TgtUpdated')
 
-                # self.dialog_window.destroy()
+                # update each line to amend with new target height and elevation, and the setups of any stations shot
+                gsi.update_target_heights(point_target_heights, line_numbers_to_ammend)
 
                 # rebuild database and GUI
-                MenuBar.filename_path = amended_filepath
-                GUIApplication.refresh()
+                MenuBar.refresh_edits(gsi.end_edit())
                 tk.messagebox.showinfo(
                     "Survey Assist", "Target Height Updated")
             else:
                 return  # User entered an incorrect target height.  Try again
 
         except Exception as ex:
+            gsi.cancel_edit()
             print("Problem fixing target height\n\n" + str(ex))
             logger.exception(
                 "An unexpected error has occurred\n\nfix_target_height()\n\n" + str(ex))
@@ -3791,35 +4151,91 @@ class TargetHeightWindow(ChangeHeightWindow):
                 "Survey Assist", "An unexpected error has occurred\n\nfix_target_height()\n\n" + str(ex))
             return
 
-    def get_target_height_corrections(self, line_number, new_target_height):
 
-        # update target height and Z coordinate for this line
-        formatted_line = gsi.get_formatted_line(line_number)
+class TargetHeightBatchUpdate:
 
-        new_target_height = float(new_target_height)
-        old_tgt_height = formatted_line['Target_Height']
+    def __init__(self, master):
 
-        old_elevation = float(formatted_line['Elevation'])
+        self.master = master
+        self.tgt_batch_file_selected = ""
 
-        if old_tgt_height == '':
-            old_tgt_height = 0.000
-        elif old_tgt_height == '0':
-            old_tgt_height = 0.000
-        else:
-            old_tgt_height = float(old_tgt_height)
+        self.config_files_path = os.path.join(os.getcwd(), 'Config Files')
+        self.dialog_window = tk.Toplevel(self.master)
+        self.dialog_window.title("Update Target Heights")
+        self.tgt_batch_label = tk.Label(
+            self.dialog_window, text="Please select the target height batch file to process: ")
+        self.tgt_column = tk.StringVar()
+        self.tgt_column_entry = ttk.Combobox(
+            self.dialog_window, width=32, textvariable=self.tgt_column, state='readonly')
+
+        # first lets build a list of batch files options for the user to choose from
+        self.tgt_column_entry['values'] = [filename for filename in os.listdir(self.config_files_path)
+                                           if 'TGT_BATCH_FILE' in filename]
+
+        self.dialog_window.geometry(
+            MainWindow.position_popup(self.master, 340, 130))
+        self.tgt_batch_label.grid(
+            row=0, column=1, columnspan=2, padx=25, pady=5)
+        self.tgt_column_entry.grid(
+            row=1, column=1, columnspan=2, padx=25, pady=5)
+
+        run_tgt_batch_file_btn = tk.Button(
+            self.dialog_window, text="Update", width=10, command=self.run_tgt_batch_file)
+        run_tgt_batch_file_btn.grid(row=3, column=1, padx=(25, 3), pady=10)
+
+        cancel_b = tk.Button(self.dialog_window, text="Cancel",
+                             width=10, command=self.dialog_window.destroy)
+        cancel_b.grid(row=3, column=2, padx=(3, 25), pady=10)
+
+    def run_tgt_batch_file(self):
+        self.tgt_batch_file_selected = self.tgt_column_entry.get()
 
-        target_height_difference = new_target_height - old_tgt_height
-        new_elevation = old_elevation - target_height_difference
+        if not self.tgt_batch_file_selected:
+            tk.messagebox.showinfo(
+                "Updating Target Height", "Please select a target height batch file to process")
+            self.dialog_window.lift()
+
+            return
+
+        self.dialog_window.destroy()
+
+        try:
+            # lets create a dictionary as a target height lookup from batch file e.g. GL76900,0.100
+            point_target_height_dict = OrderedDict()
+            tgt_batch_file_path = os.path.join(
+                self.config_files_path, self.tgt_batch_file_selected)
+            with open(tgt_batch_file_path) as csvfile:
+                csv_file = csv.reader(csvfile)
+                for row in csv_file:
+                    if row:
+                        point_target_height_dict[row[0].strip()] = round(float(row[1]), 3)
+
+            gsi.begin_edit('Target height batch file ' + self.tgt_batch_file_selected, '_TgtUpdated')
+
+            # update the target height and elevation of every shot to a point in the batch file and the setups of any
+            # stations shot
+            lines_amended, point_names_not_found_in_batch_file = gsi.update_target_heights(point_target_height_dict)
 
-        old_height_difference = float(formatted_line['Height_Diff'])
-        new_height_difference = old_height_difference - target_height_difference
+        except Exception as ex:
+            # something unexpected went wrong
+            gsi.cancel_edit()
+            logger.exception("An unexpected error has occurred\n\nrun_tgt_batch_file()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Updating Target Height", "An unexpected error has occurred during update.\n\n" + str(ex))
+            return
+
+        logger.info(str(len(lines_amended)) + " lines amended with target heights from " + self.tgt_batch_file_selected)
+
+        # rebuild database and GUI
+        MenuBar.refresh_edits(gsi.end_edit())
 
-        new_height_difference = str(
-            decimalize_value(new_height_difference, '3dp'))
-        new_elevation = str(decimalize_value(new_elevation, self.precision))
-        new_target_height = str(decimalize_value(new_target_height, '3dp'))
+        # display to user any points not found in batch file
+        if point_names_not_found_in_batch_file:
+            tk.messagebox.showwarning("Updating Target Height",
+                                      "Warning:  Couldn't find the following point names in the target height batch "
+                                      "file:\n\n" + "\n".join(sorted(point_names_not_found_in_batch_file)))
 
-        return {'33': new_height_difference, '83': new_elevation, '87': new_target_height}
+        tk.messagebox.showinfo("Survey Assist", str(len(lines_amended)) + " target heights updated")
 
 
 class StationHeightWindow(ChangeHeightWindow):
@@ -3828,7 +4244,6 @@ class StationHeightWindow(ChangeHeightWindow):
 
         super().__init__()
 
-        self.new_stn_coordinates = OrderedDict()
         self.master = master
 
         # create station height input dialog box
@@ -3840,10 +4255,21 @@ class StationHeightWindow(ChangeHeightWindow):
         self.btn1 = tk.Button(self.dialog_window, text="UPDATE",
                               command=self.change_station_height)
 
-        self.lbl.grid(row=0, column=1, padx=(20, 2), pady=20)
+        self.elevation_lbl = tk.Label(self.dialog_window,
+                                      text="New station elevation (optional):  ")
+        self.new_station_elevation_entry = tk.Entry(self.dialog_window)
+
+        self.cascade = tk.IntVar()
+        self.cascade_checkbox = tk.Checkbutton(self.dialog_window, text="Cascade through change points",
+                                               variable=self.cascade)
+
+        self.lbl.grid(row=0, column=1, padx=(20, 2), pady=(20, 5), sticky='w')
         self.new_station_height_entry.grid(
-            row=0, column=2, padx=(2, 2), pady=20)
-        self.btn1.grid(row=0, column=3, padx=(10, 20), pady=20)
+            row=0, column=2, padx=(2, 2), pady=(20, 5))
+        self.btn1.grid(row=0, column=3, padx=(10, 20), pady=(20, 5))
+        self.elevation_lbl.grid(row=1, column=1, padx=(20, 2), pady=5, sticky='w')
+        self.new_station_elevation_entry.grid(row=1, column=2, padx=(2, 2), pady=5)
+        self.cascade_checkbox.grid(row=2, column=1, columnspan=2, padx=(20, 2), pady=(5, 20), sticky='w')
 
         self.new_station_height_entry.focus()
         self.master.wait_window(self.dialog_window)
@@ -3851,153 +4277,56 @@ class StationHeightWindow(ChangeHeightWindow):
     def change_station_height(self):
 
         try:
-            new_station_height = self.get_entered_height(
-                self.new_station_height_entry)
-            self.dialog_window.destroy()
+            station_changes = OrderedDict()
 
-            if new_station_height != 'ERROR':
-
-                # Get user selected line number - should only be one selected line when updating station height
-                selected_line = gui_app.list_box.list_box_view.selection()[0]
-                stn_line_number = gui_app.list_box.list_box_view.item(selected_line)[
-                    'values'][0]
-
-                station_formatted_line = gsi.get_formatted_line(
-                    stn_line_number)
-
-                station_setup_dic = gsi.get_list_of_station_setups(
-                    gsi.formatted_lines)
-
-                # Determine difference in station height from old to new
-                old_stn_height = float(station_formatted_line['STN_Height'])
-                stn_height_diff = round(new_station_height - old_stn_height, 3)
-                new_station_height = str(
-                    decimalize_value(new_station_height, 3))
-
-                # get all shots including station
-                station_shots_dict = gsi.get_all_shots_from_a_station_including_setup(
-                    station_formatted_line['Point_ID'], stn_line_number - 1)
-
-                # update all shots from this station
-                for gsi_line_number, formatted_line in station_shots_dict.items():
-                    formatted_line_number = gsi_line_number + 1
-                    point_id = formatted_line['Point_ID']
-
-                    # should be a station but double check
-                    if gsi.is_station_setup(formatted_line):
-                        gsi.update_station_height(
-                            formatted_line_number, str(new_station_height))
-                    elif gsi.is_orientation_shot(formatted_line):
-                        continue
-                    else:  # update the elevation and height difference
-                        old_point_easting = formatted_line['Easting']
-                        old_point_northing = formatted_line['Northing']
-                        old_point_elevation = float(
-                            formatted_line['Elevation'])
-                        new_point_elevation = old_point_elevation + \
-                            float(stn_height_diff)
-                        new_point_elevation = str(decimalize_value(
-                            new_point_elevation, self.precision))
-                        gsi.update_elevation(
-                            formatted_line_number, new_point_elevation)
-
-                        old_height_diff = float(formatted_line['Height_Diff'])
-                        height_diff = old_height_diff + float(stn_height_diff)
-                        height_diff = str(decimalize_value(
-                            height_diff, self.precision))
-                        gsi.update_height_diff(
-                            formatted_line_number, height_diff)
-
-                        # add stn point_ID coordinates to a stn coordinate list if not already there
-                        for gsi_line_number, stn_point_id in station_setup_dic.items():
-
-                            formatted_line_number = gsi_line_number + 1
-
-                            if point_id == stn_point_id:
-
-                                stn_coordinates = self.new_stn_coordinates.get(
-                                    formatted_line_number)  # retrieve previous stn coordinates if they exist
-                                if stn_coordinates:
-                                    continue
-                                else:
-                                    self.new_stn_coordinates[formatted_line_number] = [float(old_point_easting), float(old_point_northing),
-                                                                                       float(new_point_elevation)]
-
-                # Update stations setup coordinates that have been shot from this station
-                for formatted_line_number, coordinate_list in self.new_stn_coordinates.items():
-
-                    formatted_line = gsi.get_formatted_line(
-                        formatted_line_number)
-
-                    # should be a station but double check
-                    if gsi.is_station_setup(formatted_line):
-                        new_elevation = str(decimalize_value(
-                            coordinate_list[2], self.precision))
-                        gsi.update_station_elevation(
-                            formatted_line_number, new_elevation)
-                    else:
-                        raise Exception(
-                            "Unexpected error changing station height")
+            # the station height can be left blank if only the station elevation is changing
+            if self.new_station_height_entry.get().strip() or not self.new_station_elevation_entry.get().strip():
 
-                if "STNUpdated" not in MenuBar.filename_path:
+                new_station_height = self.get_entered_height(self.new_station_height_entry)
 
-                    amended_filepath = MenuBar.filename_path[:-
-                                                             4] + "_STNUpdated.gsi"
-                else:
-                    amended_filepath = MenuBar.filename_path
+                if new_station_height == 'ERROR':
+                    # User entered an incorrect station height.  Try again
+                    return
 
-                # create a new ammended gsi file
-                with open(amended_filepath, "w") as gsi_file:
-                    for line in gsi.unformatted_lines:
-                        gsi_file.write(line)
+                station_changes['STN_Height'] = new_station_height
 
-                self.dialog_window.destroy()
+            if self.new_station_elevation_entry.get().strip():
 
-                # rebuild database and GUI
-                MenuBar.filename_path = amended_filepath
-                GUIApplication.refresh()
-                tk.messagebox.showinfo(
-                    "Survey Assist", "Station Height Updated")
-            else:
-                # User entered an incorrect station height.  Try again
-                return
-        except Exception as ex:
-            print("Problem updating station height\n\n" + str(ex))
-            logger.exception(
-                "An unexpected error has occurred\n\nupdate_station_height()\n\n" + str(ex))
-            tk.messagebox.showerror(
-                "Survey Assist", "An unexpected error has occurred\n\nupdate_station_height()\n\n" + str(ex))
-            return
+                new_station_elevation = self.get_entered_height(self.new_station_elevation_entry)
 
-    def update_all_shot_elevations_from_station(self, line_number, station, elevation_diff):
+                if new_station_elevation == 'ERROR':
+                    return
 
-        change_coordinates_dict = OrderedDict()
+                station_changes['STN_Elevation'] = new_station_elevation
 
-        # get all shots including station
-        station_shots_dict = gsi.get_all_shots_from_a_station_including_setup(
-            station, line_number - 1)
+            cascade = bool(self.cascade.get())
+            self.dialog_window.destroy()
 
-        for gsi_line_number, formatted_line in station_shots_dict.items():
-            formatted_line_number = gsi_line_number + 1
+            # Get user selected line number - should only be one selected line when updating station height
+            selected_line = gui_app.list_box.list_box_view.selection()[0]
+            stn_line_number = gui_app.list_box.list_box_view.item(selected_line)[
+                'values'][0]
 
-            # we dont update the elevation for a station setup
-            if gsi.is_station_setup(formatted_line):
-                continue
-            else:  # update the elevation
-                point_easting = formatted_line['Easting']
-                point_northing = formatted_line['Northing']
-                old_point_elevation = float(formatted_line['Elevation'])
-                new_point_elevation = old_point_elevation + elevation_diff
-                new_point_elevation = str(decimalize_value(
-                    new_point_elevation, self.precision))
-                gsi.update_elevation(
-                    formatted_line_number, new_point_elevation)
+            station_formatted_line = gsi.get_formatted_line(
+                stn_line_number)
 
-                # add new coordinates to change dictionary
-                change_coordinates_dict[formatted_line_number] = [
-                    float(point_easting), float(point_northing), float(new_point_elevation)]
+            # update the setup, every shot from it and the setups of the stations it shot in one edit
+            gsi.begin_edit('Change station height of ' + station_formatted_line['Point_ID'], '_STNUpdated')
+            gsi.update_station_setups({stn_line_number: station_changes}, cascade)
+
+            # rebuild database and GUI
+            MenuBar.refresh_edits(gsi.end_edit())
+            tk.messagebox.showinfo(
+                "Survey Assist", "Station Height Updated")
 
-        return change_coordinates_dict
+        except Exception as ex:
+            gsi.cancel_edit()
+            print("Problem updating station height\n\n" + str(ex))
+            logger.exception(
+                "An unexpected error has occurred\n\nupdate_station_height()\n\n" + str(ex))
+            tk.messagebox.showerror(
+                "Survey Assist", "An unexpected error has occurred\n\nupdate_station_height()\n\n" + str(ex))
+            return
 
 
 class CompnetUpdateFixedFileWindow:
@@ -4420,8 +4749,11 @@ class CompnetCreateControlOnlyGSI:
             control_only_filename = old_gsi.create_control_only_gsi()
 
             # Update GUI
+            if not MenuBar.ask_save_edits():
+                return
+
             MenuBar.filename_path = control_only_filename
-            GUIApplication.refresh()
+            GUIApplication.refresh(ask_save_edits=False)
             gui_app.menu_bar.enable_menus()
 
         except FileNotFoundError as ex:
@@ -4587,8 +4919,11 @@ class CombineGSIFilesWindow:
                 tk.messagebox.showinfo(
                     "Success", "The gsi files have been combined:\n\n" + self.combined_gsi_file_path)
                 # display results to the user
+                if not MenuBar.ask_save_edits():
+                    return
+
                 MenuBar.filename_path = self.combined_gsi_file_path
-                GUIApplication.refresh()
+                GUIApplication.refresh(ask_save_edits=False)
                 gui_app.menu_bar.enable_menus()
 
             else:
@@ -4724,8 +5059,7 @@ class CombineGSIFilesWindow:
 
     def write_out_combined_gsi(self, gsi_contents, file_path):
 
-        with open(file_path, 'w') as f_update:
-            f_update.write(gsi_contents)
+        write_file_atomically(file_path, [gsi_contents])
 
 
 #  Job Diary and its dependencies was written by Chris Kelly
@@ -5297,10 +5631,15 @@ class GUIApplication(tk.Frame):
         return [elm for elm in self.style.map('Treeview', query_opt=option) if
                 elm[:2] != ('!disabled', '!selected')]
 
+    # ask_save_edits is False if the user has already been asked to save the edits of the survey that is open
     @staticmethod
-    def refresh():
+    def refresh(ask_save_edits=True):
+        if ask_save_edits and not MenuBar.ask_save_edits():
+            return
+
         MenuBar.format_gsi_file()
         MenuBar.create_and_populate_database()
+        MenuBar.update_point_registry()
         MenuBar.update_gui()
 
 
@@ -5309,6 +5648,7 @@ def main():
     global gsi
     global survey_config
     global database
+    global point_registry
     global logger
 
     # Create main window
@@ -5327,6 +5667,10 @@ def main():
     gsi = GSI(logger, survey_config)
     gui_app = GUIApplication(root)
     database = GSIDatabase()
+    point_registry = PointRegistry()
+
+    # ask to save any unsaved edits when the window is closed
+    root.protocol('WM_DELETE_WINDOW', lambda: MenuBar.close_window(root))
 
     logger.info('************************* STARTED APPLICATION - User: ' +
                 gui_app.menu_bar.user_config.user_initials + ' *************************')
@@ -0,0 +1,93 @@
+from collections import Counter
+
+
+class PointNameIndex:
+    """ Trigram index over point names used to suggest the closest existing name for a misspelt point ID.
+
+    Candidates are found by counting shared trigrams and only the best of these are ranked by edit distance, so a
+    lookup stays fast with thousands of distinct names.
+    """
+
+    # number of trigram candidates that are ranked by edit distance
+    MAX_CANDIDATES = 25
+
+    def __init__(self, point_names=()):
+
+        self.point_names = set()
+        self.trigram_index = {}
+
+        for point_name in point_names:
+            self.add(point_name)
+
+    @staticmethod
+    def get_trigrams(point_name):
+
+        # pad the name so short names and the start/end of a name also produce trigrams
+        padded_name = '  ' + point_name.upper() + ' '
+
+        return {padded_name[index:index + 3] for index in range(len(padded_name) - 2)}
+
+    def add(self, point_name):
+
+        if not point_name or point_name in self.point_names:
+            return
+
+        self.point_names.add(point_name)
+
+        for trigram in self.get_trigrams(point_name):
+            self.trigram_index.setdefault(trigram, set()).add(point_name)
+
+    # returns a list of the closest existing point names e.g. ['STN1', 'STN11'] - closest first
+    def suggest(self, point_name, max_suggestions=3, max_distance=None):
+
+        # allow about a third of the characters to be wrong by default
+        if max_distance is None:
+            max_distance = max(1, len(point_name) // 3)
+
+        shared_trigrams = Counter()
+
+        for trigram in self.get_trigrams(point_name):
+            shared_trigrams.update(self.trigram_index.get(trigram, ()))
+
+        shared_trigrams.pop(point_name, None)
+
+        ranked_names = []
+
+        for candidate, _ in shared_trigrams.most_common(PointNameIndex.MAX_CANDIDATES):
+            distance = levenshtein_distance(point_name.upper(), candidate.upper(), max_distance)
+
+            if distance <= max_distance:
+                ranked_names.append((distance, -shared_trigrams[candidate], candidate))
+
+        return [candidate for _, _, candidate in sorted(ranked_names)[:max_suggestions]]
+
+
+# edit distance between two strings, counting a swap of two neighbouring characters as one edit (e.g. SNT1 -> STN1).
+# Returns max_distance + 1 as soon as the distance is known to exceed it
+def levenshtein_distance(string_1, string_2, max_distance=None):
+
+    if max_distance is not None and abs(len(string_1) - len(string_2)) > max_distance:
+        return max_distance + 1
+
+    row_before_previous = None
+    previous_row = list(range(len(string_2) + 1))
+
+    for index_1, char_1 in enumerate(string_1, start=1):
+        current_row = [index_1]
+
+        for index_2, char_2 in enumerate(string_2, start=1):
+            distance = min(previous_row[index_2] + 1, current_row[index_2 - 1] + 1,
+                           previous_row[index_2 - 1] + (char_1 != char_2))
+
+            # transposition of two neighbouring characters
+            if index_1 > 1 and index_2 > 1 and char_1 == string_2[index_2 - 2] and string_1[index_1 - 2] == char_2:
+                distance = min(distance, row_before_previous[index_2 - 2] + 1)
+
+            current_row.append(distance)
+
+        if max_distance is not None and min(current_row) > max_distance:
+            return max_distance + 1
+
+        row_before_previous, previous_row = previous_row, current_row
+
+    return previous_row[-1]
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import datetime
+import logging
+
+
+class PointRegistry:
+    """ Persistent registry of the prism constant and target height of every point in the GSI files processed.
+
+    The points table holds one row per point ID with the latest prism constant and target height along with the
+    first and last seen dates and files.  The point_surveys table holds the values of each point in each survey so a
+    file can be checked against every other survey.  Files are registered once, keyed by their content hash, so the
+    registry updates incrementally as surveys are opened.
+    """
+
+    DATABASE_PATH = 'C:\\SurveyAssist\\point_registry.db'
+
+    def __init__(self, database_path=DATABASE_PATH):
+
+        self.logger = logging.getLogger('Survey Assist')
+        self.conn = sqlite3.connect(database_path)
+
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS points (point_id text PRIMARY KEY, prism_constant text, '
+                              'target_height text, first_seen text, last_seen text, first_file text, last_file text)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS point_surveys (point_id text, prism_constant text, '
+                              'target_height text, survey_date text, content_hash text, file_path text)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS point_surveys_point_id ON point_surveys (point_id, survey_date)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS processed_files (content_hash text PRIMARY KEY, file_path text, '
+                              'survey_date text)')
+
+    def close_database(self):
+
+        self.conn.close()
+
+    @staticmethod
+    def get_survey_date(file_path):
+
+        return datetime.date.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+
+    def is_registered(self, content_hash):
+
+        return self.conn.execute('SELECT 1 FROM processed_files WHERE content_hash=?', (content_hash,)).fetchone() is not None
+
+    # Adds the prism constants and target heights of a parsed GSI to the registry.  Returns False if it was already registered
+    def register_survey(self, gsi):
+
+        if gsi.content_hash is None or self.is_registered(gsi.content_hash):
+            return False
+
+        survey_date = self.get_survey_date(gsi.filename)
+        file_name = os.path.basename(gsi.filename)
+        point_survey_rows = []
+
+        for point_id, (prism_constants, target_heights) in gsi.get_point_summary().items():
+            for prism_constant in sorted(prism_constants):
+                for target_height in sorted(target_heights):
+                    point_survey_rows.append((point_id, prism_constant, target_height, survey_date, gsi.content_hash,
+                                              gsi.filename))
+
+        with self.conn:
+            self.conn.executemany('INSERT INTO point_surveys VALUES (?, ?, ?, ?, ?, ?)', point_survey_rows)
+            self.conn.execute('INSERT INTO processed_files VALUES (?, ?, ?)', (gsi.content_hash, gsi.filename, survey_date))
+
+            for point_id, prism_constant, target_height, _, _, _ in point_survey_rows:
+                self.conn.execute('INSERT OR IGNORE INTO points VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                  (point_id, prism_constant, target_height, survey_date, survey_date, file_name, file_name))
+
+                # newer surveys replace the registered values
+                self.conn.execute('UPDATE points SET prism_constant=?, target_height=?, last_seen=?, last_file=? '
+                                  'WHERE point_id=? AND last_seen<=?',
+                                  (prism_constant, target_height, survey_date, file_name, point_id, survey_date))
+                self.conn.execute('UPDATE points SET first_seen=?, first_file=? WHERE point_id=? AND first_seen>?',
+                                  (survey_date, file_name, point_id, survey_date))
+
+        self.logger.info('Registered ' + str(len(point_survey_rows)) + ' points from ' + gsi.filename + ' in the point registry')
+
+        return True
+
+    def get_point(self, point_id):
+
+        return self.conn.execute('SELECT point_id, prism_constant, target_height, first_seen, last_seen, first_file, last_file '
+                                 'FROM points WHERE point_id=?', (point_id,)).fetchone()
+
+    # Returns a list of (point_id, current PCs, current target heights, registered row) for each point whose prism
+    # constant or target height differs from the most recent other survey it was seen in
+    def check_survey(self, gsi):
+
+        differences = []
+
+        for point_id, (prism_constants, target_heights) in gsi.get_point_summary().items():
+
+            registered_row = self.conn.execute('SELECT prism_constant, target_height, survey_date, file_path FROM point_surveys '
+                                               'WHERE point_id=? AND content_hash!=? ORDER BY survey_date DESC LIMIT 1',
+                                               (point_id, gsi.content_hash)).fetchone()
+
+            if registered_row is None:
+                continue  # a new point
+
+            if prism_constants != {registered_row[0]} or target_heights != {registered_row[1]}:
+                differences.append((point_id, prism_constants, target_heights, registered_row))
+
+        return differences
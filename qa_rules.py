@@ -0,0 +1,239 @@
+import re
+import fnmatch
+import operator
+from configparser import ConfigParser
+
+import numpy as np
+
+
+class QARuleError(Exception):
+    """Raised when a QA rule in the rules file can't be understood"""
+    pass
+
+
+class QARule:
+    """ A site specific QA check read from the QA rules file.  Each section of the file is a rule e.g.
+
+        [GL prisms use the monitoring prism]
+        where = Point_ID matches GL*
+        check = Prism_Constant == 8
+
+        [Target height constant per point]
+        check = Target_Height constant per Point_ID
+
+        [Face difference in height]
+        check = Elevation face difference <= flfr_height_tolerance
+
+    'where' is optional and can join conditions with 'and'.  Values can be numbers, text, or the name of a survey
+    tolerance in settings.ini.  Rules are compiled to column predicates that are evaluated over the whole file at once.
+    """
+
+    COMPARISON_OPERATORS = {'==': operator.eq, '!=': operator.ne, '<=': operator.le, '>=': operator.ge,
+                            '<': operator.lt, '>': operator.gt}
+
+    re_constant_per = re.compile(r'^(\w+)\s+constant\s+per\s+(\w+)$', re.IGNORECASE)
+    re_face_difference = re.compile(r'^(\w+)\s+face\s+difference\s*(==|!=|<=|>=|<|>)\s*(.+)$', re.IGNORECASE)
+    re_matches = re.compile(r'^(\w+)\s+(not\s+)?matches\s+(.+)$', re.IGNORECASE)
+    re_comparison = re.compile(r'^(\w+)\s*(==|!=|<=|>=|<|>)\s*(.+)$')
+
+    def __init__(self, name, check, where="", message=""):
+
+        self.name = name
+        self.check = check.strip()
+        self.where = where.strip()
+        self.message = message.strip()
+
+        self.where_conditions = [self.parse_condition(condition) for condition in
+                                 re.split(r'\s+and\s+', self.where, flags=re.IGNORECASE) if condition]
+
+        if QARule.re_constant_per.match(self.check):
+            self.check_type = 'constant per'
+            self.check_columns = QARule.re_constant_per.match(self.check).groups()
+
+        elif QARule.re_face_difference.match(self.check):
+            self.check_type = 'face difference'
+            self.check_columns = QARule.re_face_difference.match(self.check).groups()
+
+        else:
+            self.check_type = 'condition'
+            self.check_columns = self.parse_condition(self.check)
+
+    def parse_condition(self, condition):
+
+        condition = condition.strip()
+
+        if QARule.re_matches.match(condition):
+            column_name, negate, patterns = QARule.re_matches.match(condition).groups()
+            return 'not matches' if negate else 'matches', column_name, patterns
+
+        elif QARule.re_comparison.match(condition):
+            column_name, comparison, value = QARule.re_comparison.match(condition).groups()
+            return comparison, column_name, value
+
+        raise QARuleError("Rule '" + self.name + "': can't understand '" + condition + "'")
+
+    # Returns a boolean array of the gsi lines that break this rule
+    def evaluate(self, columns):
+
+        where_mask = np.ones(columns.line_count, dtype=bool)
+
+        for condition in self.where_conditions:
+            where_mask &= columns.evaluate_condition(self.name, *condition)
+
+        if self.check_type == 'constant per':
+            value_column, group_column = self.check_columns
+            return where_mask & columns.get_inconsistent_groups(self.name, value_column, group_column, where_mask)
+
+        elif self.check_type == 'face difference':
+            column_name, comparison, value = self.check_columns
+            return columns.get_failed_face_pairs(self.name, column_name, comparison, value, where_mask)
+
+        else:
+            evaluated = where_mask & columns.is_evaluated(self.name, self.check_columns[1])
+            return evaluated & ~columns.evaluate_condition(self.name, *self.check_columns)
+
+
+class QAColumns:
+    """ Column arrays of a GSI file that QA rules are evaluated against.  Each column is only built once. """
+
+    # formatted columns that are compared as text.  Angles are compared in decimal degrees
+    TEXT_COLUMNS = ('Point_ID', 'Timestamp')
+    ANGLE_WORD_IDS = {'Horizontal_Angle': '21', 'Vertical_Angle': '22'}
+
+    def __init__(self, gsi, survey_config):
+
+        self.gsi = gsi
+        self.survey_config = survey_config
+        self.line_count = len(gsi.formatted_lines)
+
+    def get_column(self, rule_name, column_name):
+
+        if column_name not in self.gsi.GSI_WORD_ID_DICT.values():
+            raise QARuleError("Rule '" + rule_name + "': unknown column '" + column_name + "'")
+
+        if column_name in QAColumns.TEXT_COLUMNS:
+            return self.gsi.get_text_column(column_name)
+        elif column_name in QAColumns.ANGLE_WORD_IDS:
+            return self.gsi.get_word_column(QAColumns.ANGLE_WORD_IDS[column_name])
+        else:
+            return self.gsi.get_float_column(column_name)
+
+    # lines where the column has a value e.g. station setups have no prism constant
+    def is_evaluated(self, rule_name, column_name):
+
+        if column_name in QAColumns.TEXT_COLUMNS:
+            return np.ones(self.line_count, dtype=bool)
+
+        return ~np.isnan(self.get_column(rule_name, column_name))
+
+    def get_value(self, rule_name, column_name, value):
+
+        value = value.strip()
+
+        # name of a survey tolerance e.g. flfr_height_tolerance
+        if hasattr(self.survey_config, value):
+            value = getattr(self.survey_config, value)
+
+        if column_name in QAColumns.TEXT_COLUMNS:
+            return value.strip('"\'')
+
+        try:
+            return float(value)
+        except ValueError:
+            raise QARuleError("Rule '" + rule_name + "': '" + value + "' is not a number or survey tolerance")
+
+    def evaluate_condition(self, rule_name, comparison, column_name, value):
+
+        column_values = self.get_column(rule_name, column_name)
+
+        if comparison in ('matches', 'not matches'):
+
+            # match each distinct value once and map the result back to every line
+            patterns = [pattern.strip() for pattern in value.split(',')]
+            unique_values, unique_indexes = np.unique(column_values.astype(str), return_inverse=True)
+            unique_matches = np.array([any(fnmatch.fnmatchcase(unique_value, pattern) for pattern in patterns)
+                                       for unique_value in unique_values], dtype=bool)
+            matches = unique_matches[unique_indexes.reshape(-1)] if len(unique_values) else np.zeros(self.line_count, dtype=bool)
+
+            return ~matches if comparison == 'not matches' else matches
+
+        return QARule.COMPARISON_OPERATORS[comparison](column_values, self.get_value(rule_name, column_name, value))
+
+    # lines whose group (e.g. Point_ID) has more than one distinct value of the column
+    def get_inconsistent_groups(self, rule_name, value_column, group_column, where_mask):
+
+        value_column_values = self.get_column(rule_name, value_column)
+        evaluated = where_mask & self.is_evaluated(rule_name, value_column)
+
+        group_values = self.get_column(rule_name, group_column).astype(str)
+        inconsistent_lines = np.zeros(self.line_count, dtype=bool)
+
+        if not evaluated.any():
+            return inconsistent_lines
+
+        group_names, groups = np.unique(group_values[evaluated], return_inverse=True)
+        _, values = np.unique(value_column_values[evaluated], return_inverse=True)
+        groups, values = groups.reshape(-1), values.reshape(-1)
+
+        # count the distinct (group, value) pairs of each group
+        distinct_pairs = np.unique(groups * (values.max() + 1) + values)
+        distinct_values_per_group = np.bincount(distinct_pairs // (values.max() + 1), minlength=len(group_names))
+
+        inconsistent_lines[np.flatnonzero(evaluated)] = distinct_values_per_group[groups] > 1
+
+        return inconsistent_lines
+
+    # both lines of each face left / face right pair whose difference fails the comparison
+    def get_failed_face_pairs(self, rule_name, column_name, comparison, value, where_mask):
+
+        column_values = self.get_column(rule_name, column_name)
+        face_left_indexes, face_right_indexes = self.gsi.get_face_pair_indexes()
+
+        if column_name in QAColumns.ANGLE_WORD_IDS:
+            raise QARuleError("Rule '" + rule_name + "': face difference of angles is checked by Check FL-FR")
+
+        face_differences = np.abs(column_values[face_left_indexes] - column_values[face_right_indexes])
+        failed_pairs = ~QARule.COMPARISON_OPERATORS[comparison](face_differences, self.get_value(rule_name, column_name, value))
+        failed_pairs &= ~np.isnan(face_differences) & where_mask[face_left_indexes] & where_mask[face_right_indexes]
+
+        failed_lines = np.zeros(self.line_count, dtype=bool)
+        failed_lines[face_left_indexes[failed_pairs]] = True
+        failed_lines[face_right_indexes[failed_pairs]] = True
+
+        return failed_lines
+
+
+class QARuleSet:
+
+    def __init__(self, rules_file_path):
+
+        self.rules = []
+
+        config_parser = ConfigParser()
+        config_parser.optionxform = str
+
+        if not config_parser.read(rules_file_path):
+            raise QARuleError("QA rules file " + rules_file_path + " could not be found")
+
+        for rule_name in config_parser.sections():
+
+            if not config_parser.has_option(rule_name, 'check'):
+                raise QARuleError("Rule '" + rule_name + "' has no check")
+
+            self.rules.append(QARule(rule_name, config_parser.get(rule_name, 'check'), config_parser.get(rule_name, 'where', fallback=""),
+                                     config_parser.get(rule_name, 'message', fallback="")))
+
+    # Returns a list of (rule, line numbers that break the rule) for every rule that fails
+    def evaluate(self, gsi, survey_config):
+
+        failed_rules = []
+        columns = QAColumns(gsi, survey_config)
+
+        for rule in self.rules:
+
+            failed_line_numbers = (np.flatnonzero(rule.evaluate(columns)) + 1).tolist()
+
+            if failed_line_numbers:
+                failed_rules.append((rule, failed_line_numbers))
+
+        return failed_rules
@@ -0,0 +1,92 @@
+import datetime
+from collections import OrderedDict, Counter
+
+
+class SetupStatistics:
+    """ Statistics of each station setup in a GSI file, computed in one pass over the formatted lines.
+
+    Each row is keyed by the gsi line number of the setup and holds the shot count, shots to each target, double
+    doubles, orientation shots and time span of the setup.  The change points of the survey are passed in from the
+    observation network so every report agrees on them.
+    """
+
+    # a point shot this many times from a setup is a double double
+    DOUBLE_DOUBLE_SHOT_COUNT = 4
+
+    def __init__(self, formatted_lines, change_points):
+
+        self.setups = OrderedDict()  # e.g. {1: {'station_name': 'STN1', 'target_shots': Counter(), ...}}
+
+        setup = None
+
+        for line_number, formatted_line in enumerate(formatted_lines, start=1):
+
+            # check to see if point id is a station setup
+            if formatted_line['STN_Easting']:
+                setup = {'station_name': formatted_line['Point_ID'], 'line_numbers': [], 'target_shots': Counter(),
+                         'orientation_shots': 0, 'start_time': formatted_line['Timestamp'],
+                         'end_time': formatted_line['Timestamp']}
+                self.setups[line_number] = setup
+                continue
+
+            if setup is None:
+                continue
+
+            setup['line_numbers'].append(line_number)
+
+            if formatted_line['Timestamp']:
+                setup['end_time'] = formatted_line['Timestamp']
+
+            # orientation shots have no slope distance
+            if not formatted_line['Slope_Distance']:
+                setup['orientation_shots'] += 1
+            else:
+                setup['target_shots'][formatted_line['Point_ID']] += 1
+
+        self.change_points = set(change_points)
+
+    def get_shot_count(self, setup_line_number):
+
+        return sum(self.setups[setup_line_number]['target_shots'].values())
+
+    def get_double_doubles(self, setup_line_number):
+
+        return [target for target, shot_count in self.setups[setup_line_number]['target_shots'].items()
+                if shot_count >= SetupStatistics.DOUBLE_DOUBLE_SHOT_COUNT]
+
+    def get_setup_change_points(self, setup_line_number):
+
+        return sorted(set(self.setups[setup_line_number]['target_shots']).intersection(self.change_points))
+
+    # time between the setup and its last shot e.g. '1:25', or '' if the timestamps can't be read
+    def get_time_span(self, setup_line_number):
+
+        setup = self.setups[setup_line_number]
+
+        try:
+            # timestamps are formatted as 'MM/DD - HH:MM'
+            start_time = datetime.datetime.strptime('2000/' + setup['start_time'], '%Y/%m/%d - %H:%M')
+            end_time = datetime.datetime.strptime('2000/' + setup['end_time'], '%Y/%m/%d - %H:%M')
+        except ValueError:
+            return ''
+
+        minutes = int((end_time - start_time).total_seconds() // 60)
+
+        return str(minutes // 60) + ':' + str(minutes % 60).zfill(2)
+
+    # one row of the station summary for each setup
+    def get_summary_rows(self):
+
+        summary_rows = []
+
+        for setup_line_number, setup in self.setups.items():
+            summary_rows.append(OrderedDict([('Line', setup_line_number), ('Station', setup['station_name']),
+                                             ('Shots', self.get_shot_count(setup_line_number)),
+                                             ('Targets', len(setup['target_shots'])),
+                                             ('Double Doubles', len(self.get_double_doubles(setup_line_number))),
+                                             ('Orientation Shots', setup['orientation_shots']),
+                                             ('Start', setup['start_time']),
+                                             ('Time Span', self.get_time_span(setup_line_number)),
+                                             ('Change Points', ', '.join(self.get_setup_change_points(setup_line_number)))]))
+
+        return summary_rows
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+
+# Per-point summary of a survey - the gsi line numbers of each prism constant and target height the point was shot with
+# e.g. {'GL76900': {'Prism_Constant': {'8': [3, 7]}, 'Target_Height': {'0.100': [3, 7]}, 'line_numbers': [3, 7]}}
+def summarise_survey(gsi):
+
+    survey_summary = OrderedDict()
+
+    for line_number, formatted_line in enumerate(gsi.formatted_lines, start=1):
+
+        # check to see if point id is a control point and skip if true
+        if gsi.is_station_setup(formatted_line):
+            continue
+
+        point_summary = survey_summary.setdefault(formatted_line['Point_ID'], {'Prism_Constant': OrderedDict(),
+                                                                               'Target_Height': OrderedDict(),
+                                                                               'line_numbers': []})
+        point_summary['Prism_Constant'].setdefault(formatted_line['Prism_Constant'], []).append(line_number)
+        point_summary['Target_Height'].setdefault(formatted_line['Target_Height'], []).append(line_number)
+        point_summary['line_numbers'].append(line_number)
+
+    return survey_summary
+
+
+class SurveyComparison:
+    """ Compares the current survey with one or more previous surveys of the same job.
+
+    Both surveys are summarised per point and the summaries are joined on point ID, so a comparison is linear in the
+    size of the two surveys.  A shot in the current survey differs if the previous survey shot the same point with a
+    different prism constant or target height.
+    """
+
+    COMPARED_FIELDS = ('Prism_Constant', 'Target_Height')
+
+    def __init__(self, current_gsi):
+
+        self.current_summary = summarise_survey(current_gsi)
+
+    # Returns the differences with one previous survey e.g. {'Prism_Constant': {'GL76900': (['8'], ['24'])},
+    # 'Target_Height': {}, 'missing_points': ['GL76920'], 'old_point_ids': {...}, 'line_numbers': {3, 7}}
+    def compare(self, old_gsi):
+
+        old_summary = summarise_survey(old_gsi)
+        differences = {'missing_points': [], 'old_point_ids': set(old_summary), 'line_numbers': set()}
+
+        for field_name in SurveyComparison.COMPARED_FIELDS:
+            differences[field_name] = OrderedDict()
+
+        for point_id, current_point_summary in self.current_summary.items():
+
+            old_point_summary = old_summary.get(point_id)
+
+            # point wasn't in the previous survey
+            if old_point_summary is None:
+                differences['missing_points'].append(point_id)
+                differences['line_numbers'].update(current_point_summary['line_numbers'])
+                continue
+
+            for field_name in SurveyComparison.COMPARED_FIELDS:
+
+                old_values = set(old_point_summary[field_name])
+
+                for current_value, line_numbers in current_point_summary[field_name].items():
+
+                    # the previous survey shot this point with a different value
+                    if old_values.difference({current_value}):
+                        differences[field_name][point_id] = (list(current_point_summary[field_name]), sorted(old_values))
+                        differences['line_numbers'].update(line_numbers)
+
+        differences['missing_points'].sort()
+
+        return differences
+
+    def compare_all(self, old_gsis):
+
+        return [self.compare(old_gsi) for old_gsi in old_gsis]
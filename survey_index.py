@@ -0,0 +1,165 @@
+import os
+import json
+import zlib
+import logging
+
+import numpy as np
+
+
+# Reads just the point IDs of a GSI file (characters 8-24 of each line) without formatting the rest of the line
+def peek_point_ids(gsi_file_path):
+
+    point_ids = set()
+
+    with open(gsi_file_path, 'r') as gsi_file:
+        for line in gsi_file:
+            if line.startswith('*11'):
+                point_id = line[8:24].lstrip('0')
+                point_ids.add(point_id if point_id else '0')
+
+    return point_ids
+
+
+class SurveyIndex:
+    """ Index of the archived GSI files of a job, used to find the previous surveys most similar to the current one.
+
+    Each file is stored as a MinHash signature of its set of point IDs, so the similarity (Jaccard index) of two
+    surveys is estimated by comparing signatures rather than point lists.  Files are only re-read when their
+    modification time or size changes.
+    """
+
+    INDEX_FILE_PATH = 'C:\\SurveyAssist\\survey_index.json'
+    NUM_HASHES = 64
+    EDIT_SUFFIXES = ('_EDITED', '_PCUpdated', '_TgtUpdated', '_STNUpdated', '_CONTROL_ONLY')
+    MERSENNE_PRIME = (1 << 61) - 1
+
+    # fixed hash coefficients so signatures stay comparable between sessions
+    random_state = np.random.RandomState(20200416)
+    HASH_A = random_state.randint(1, 1 << 30, NUM_HASHES).astype(np.uint64)
+    HASH_B = random_state.randint(0, 1 << 30, NUM_HASHES).astype(np.uint64)
+
+    def __init__(self, index_file_path=INDEX_FILE_PATH):
+
+        self.logger = logging.getLogger('Survey Assist')
+        self.index_file_path = index_file_path
+        self.file_index = {}  # e.g. {'C:/.../survey.GSI': {'mtime': 1591234567.0, 'size': 12345, 'signature': [...]}}
+
+        try:
+            with open(self.index_file_path, 'r') as index_file:
+                self.file_index = json.load(index_file)
+        except (OSError, ValueError):
+            pass  # no index yet
+
+    def save(self):
+
+        with open(self.index_file_path, 'w') as index_file:
+            json.dump(self.file_index, index_file)
+
+    @staticmethod
+    def get_signature(point_ids):
+
+        if not point_ids:
+            return np.full(SurveyIndex.NUM_HASHES, SurveyIndex.MERSENNE_PRIME, dtype=np.uint64)
+
+        point_hashes = np.array([zlib.crc32(point_id.encode()) for point_id in point_ids], dtype=np.uint64)
+
+        # (a * x + b) mod p for every hash function and point ID - values are < 2^30 * 2^32 so don't overflow
+        hash_values = (SurveyIndex.HASH_A[:, np.newaxis] * point_hashes[np.newaxis, :] + SurveyIndex.HASH_B[:, np.newaxis]) % \
+            np.uint64(SurveyIndex.MERSENNE_PRIME)
+
+        return hash_values.min(axis=1)
+
+    # Adds new and changed GSI files under the job directory to the index and removes deleted ones
+    def update(self, job_directory):
+
+        index_changed = False
+        indexed_file_paths = set()
+
+        for directory, _, file_names in os.walk(job_directory):
+            for file_name in file_names:
+
+                if not file_name.lower().endswith('.gsi'):
+                    continue
+
+                file_path = os.path.normpath(os.path.join(directory, file_name))
+                file_stat = os.stat(file_path)
+                indexed_file_paths.add(file_path)
+                file_entry = self.file_index.get(file_path)
+
+                if file_entry and file_entry['mtime'] == file_stat.st_mtime and file_entry['size'] == file_stat.st_size:
+                    continue
+
+                try:
+                    signature = self.get_signature(peek_point_ids(file_path))
+                except (OSError, UnicodeDecodeError) as ex:
+                    self.logger.info('Unable to index ' + file_path + ': ' + str(ex))
+                    continue
+
+                self.file_index[file_path] = {'mtime': file_stat.st_mtime, 'size': file_stat.st_size,
+                                              'signature': signature.tolist()}
+                index_changed = True
+
+        job_directory = os.path.normpath(job_directory)
+
+        for file_path in list(self.file_index):
+            if file_path.startswith(job_directory + os.sep) and file_path not in indexed_file_paths:
+                del self.file_index[file_path]
+                index_changed = True
+
+        if index_changed:
+            self.save()
+
+    # Returns the survey a file belongs to as (dated directory, file name without its edit suffixes) so that e.g.
+    # .../201123/TS/survey.GSI and .../201123/EDITING/survey_PCUpdated_EDITED.GSI are the same survey
+    @staticmethod
+    def get_survey_key(file_path, job_directory):
+
+        relative_path = os.path.relpath(file_path, job_directory)
+        dated_directory = relative_path.split(os.sep)[0] if os.sep in relative_path else ''
+        survey_name = os.path.splitext(os.path.basename(file_path))[0].upper()
+
+        suffix_removed = True
+
+        while suffix_removed:
+            suffix_removed = False
+
+            for edit_suffix in SurveyIndex.EDIT_SUFFIXES:
+                if survey_name.endswith(edit_suffix.upper()):
+                    survey_name = survey_name[:-len(edit_suffix)]
+                    suffix_removed = True
+
+        return dated_directory.upper(), survey_name
+
+    # Returns a list of (estimated similarity, file path) of the indexed surveys in the job directory, most similar first.
+    # Only surveys made before the current survey are ranked - the current survey and its edited variants are excluded
+    def rank_similar_surveys(self, point_ids, job_directory, survey_file_path=None):
+
+        job_directory = os.path.normpath(job_directory)
+        file_paths = [file_path for file_path in self.file_index if file_path.startswith(job_directory + os.sep)]
+
+        if survey_file_path:
+            survey_file_path = os.path.normpath(survey_file_path)
+            survey_key = self.get_survey_key(survey_file_path, job_directory)
+            survey_file_paths = [file_path for file_path in file_paths
+                                 if self.get_survey_key(file_path, job_directory) == survey_key]
+
+            # the survey was made when its earliest variant (normally the original) was last modified
+            survey_mtimes = [self.file_index[file_path]['mtime'] for file_path in survey_file_paths]
+
+            if os.path.exists(survey_file_path):
+                survey_mtimes.append(os.stat(survey_file_path).st_mtime)
+
+            survey_file_paths = set(survey_file_paths)
+            survey_file_paths.add(survey_file_path)
+            file_paths = [file_path for file_path in file_paths if file_path not in survey_file_paths]
+
+            if survey_mtimes:
+                file_paths = [file_path for file_path in file_paths if self.file_index[file_path]['mtime'] < min(survey_mtimes)]
+
+        if not file_paths:
+            return []
+
+        signatures = np.array([self.file_index[file_path]['signature'] for file_path in file_paths], dtype=np.uint64)
+        similarities = (signatures == self.get_signature(point_ids)).mean(axis=1)
+
+        return sorted(zip(similarities.tolist(), file_paths), key=lambda item: item[0], reverse=True)
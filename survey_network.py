@@ -0,0 +1,222 @@
+from collections import OrderedDict, Counter, deque
+
+
+class ObservationGraph:
+    """ Observation network of a survey.  Station setups and targets are the nodes and each measured shot is an edge.
+
+    Edges are undirected and hold every shot between the two points as (setup line number, shot line number) so the
+    graph can answer connectivity, loop and change point questions without re-reading the GSI lines.  Angle only
+    orientation shots have no distance or height difference so they are kept separately and are not edges.
+    """
+
+    MAX_LOOPS_IN_SUMMARY = 20
+
+    def __init__(self, formatted_lines):
+
+        self.stations = OrderedDict()  # e.g. {'STN1': [1, 20]} - gsi line numbers of each setup of the station
+        self.setup_stations = OrderedDict()  # e.g. {1: 'STN1', 20: 'STN1'}
+        self.targets = set()
+        self.adjacency = OrderedDict()  # e.g. {'STN1': {'CP1', 'STN2'}}
+        self.observations = {}  # e.g. {('CP1', 'STN1'): [(1, 2), (1, 3)]}
+        self.orientation_observations = {}  # e.g. {('RO', 'STN1'): [(1, 2)]}
+        self.shot_counts = Counter()
+
+        setup_line_number = None
+        station_name = None
+
+        for line_number, formatted_line in enumerate(formatted_lines, start=1):
+
+            point_id = formatted_line['Point_ID']
+
+            # check to see if point id is a station setup
+            if formatted_line['STN_Easting']:
+                station_name = point_id
+                setup_line_number = line_number
+                self.stations.setdefault(station_name, []).append(line_number)
+                self.setup_stations[line_number] = station_name
+                self.adjacency.setdefault(station_name, set())
+
+            elif station_name is None:
+                continue
+
+            elif formatted_line['Slope_Distance']:
+                self.add_observation(station_name, point_id, setup_line_number, line_number)
+
+            else:
+                self.add_orientation_observation(station_name, point_id, setup_line_number, line_number)
+
+        # a target is any point shot that is never set up on
+        self.targets = set(self.adjacency).difference(self.stations)
+
+    @staticmethod
+    def get_edge(point_1, point_2):
+
+        return tuple(sorted((point_1, point_2)))
+
+    def add_observation(self, station_name, target_name, setup_line_number, line_number):
+
+        # a station shooting its own name is a naming error that is reported by check_control_naming
+        if station_name == target_name:
+            return
+
+        self.adjacency.setdefault(station_name, set()).add(target_name)
+        self.adjacency.setdefault(target_name, set()).add(station_name)
+        self.observations.setdefault(self.get_edge(station_name, target_name), []).append((setup_line_number, line_number))
+        self.shot_counts[target_name] += 1
+
+    def add_orientation_observation(self, station_name, target_name, setup_line_number, line_number):
+
+        if station_name == target_name:
+            return
+
+        self.orientation_observations.setdefault(self.get_edge(station_name, target_name), []).append(
+            (setup_line_number, line_number))
+        self.shot_counts[target_name] += 1
+
+    def get_observations(self, point_1, point_2):
+
+        return self.observations.get(self.get_edge(point_1, point_2), [])
+
+    # returns how many times each point was shot from any setup e.g. {'STN2': 4}
+    def get_shot_counts(self, point_names):
+
+        return OrderedDict((point_name, self.shot_counts[point_name]) for point_name in point_names)
+
+    # returns a list of sets of point names - one for each disconnected part of the network
+    def get_connected_components(self):
+
+        components = []
+        visited = set()
+
+        for start_point in self.adjacency:
+
+            if start_point in visited:
+                continue
+
+            component = {start_point}
+            visited.add(start_point)
+            points_to_visit = deque([start_point])
+
+            while points_to_visit:
+                for neighbour in self.adjacency[points_to_visit.popleft()]:
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        component.add(neighbour)
+                        points_to_visit.append(neighbour)
+
+            components.append(component)
+
+        return components
+
+    # returns a list of the station setups of each disconnected part of the network
+    def get_station_groups(self):
+
+        station_groups = []
+
+        for component in self.get_connected_components():
+            stations = sorted(component.intersection(self.stations))
+
+            if stations:
+                station_groups.append(stations)
+
+        return station_groups
+
+    def is_connected(self):
+
+        return len(self.get_station_groups()) <= 1
+
+    # stations that are not tied to any other station setup through a common station or target
+    def get_isolated_stations(self):
+
+        if len(self.stations) < 2:
+            return []
+
+        return sorted(stations[0] for stations in self.get_station_groups() if len(stations) == 1)
+
+    # change points are targets that tie two or more different stations together
+    def get_change_points(self):
+
+        return sorted(target for target in self.targets if len(self.adjacency[target].intersection(self.stations)) > 1)
+
+    # A fundamental set of loops (cycle basis) of the network.  A spanning tree is grown breadth first and every edge
+    # not in the tree closes exactly one loop.  Returns a list of loops, each a list of point names e.g. ['STN1', 'CP1', 'STN2']
+    def get_loops(self):
+
+        loops = []
+        parent = {}
+        depth = {}
+
+        for root in self.adjacency:
+
+            if root in parent:
+                continue
+
+            parent[root] = None
+            depth[root] = 0
+            points_to_visit = deque([root])
+
+            while points_to_visit:
+                point = points_to_visit.popleft()
+
+                for neighbour in self.adjacency[point]:
+                    if neighbour not in parent:
+                        parent[neighbour] = point
+                        depth[neighbour] = depth[point] + 1
+                        points_to_visit.append(neighbour)
+
+        tree_edges = {self.get_edge(point, parent_point) for point, parent_point in parent.items() if parent_point is not None}
+
+        for edge in sorted(self.observations):
+
+            if edge in tree_edges:
+                continue
+
+            # walk both ends of the edge back up the tree until they meet
+            path_1, path_2 = [edge[0]], [edge[1]]
+
+            while path_1[-1] != path_2[-1]:
+                if depth[path_1[-1]] >= depth[path_2[-1]]:
+                    path_1.append(parent[path_1[-1]])
+                else:
+                    path_2.append(parent[path_2[-1]])
+
+            loops.append(path_1 + path_2[-2::-1])
+
+        return loops
+
+    def get_summary(self):
+
+        summary_text = 'Station setups: ' + str(sum(len(line_numbers) for line_numbers in self.stations.values())) + \
+                       '   Stations: ' + str(len(self.stations)) + '   Targets: ' + str(len(self.targets)) + \
+                       '   Shots: ' + str(sum(len(shots) for shots in self.observations.values())) + '\n\n'
+
+        station_groups = self.get_station_groups()
+
+        if len(station_groups) > 1:
+            summary_text += 'WARNING!  The network is made up of ' + str(len(station_groups)) + ' disconnected parts:\n\n'
+
+            for stations in station_groups:
+                summary_text += '  ' + ', '.join(stations) + '\n'
+
+            summary_text += '\n'
+        else:
+            summary_text += 'All station setups are connected.\n\n'
+
+        isolated_stations = self.get_isolated_stations()
+
+        if isolated_stations:
+            summary_text += 'Isolated stations (no common points with any other setup): ' + ', '.join(isolated_stations) + '\n\n'
+
+        change_points = self.get_change_points()
+        summary_text += 'Change points: ' + (', '.join(change_points) if change_points else 'None') + '\n\n'
+
+        loops = self.get_loops()
+        summary_text += 'Independent loops: ' + str(len(loops)) + '\n\n'
+
+        for loop in loops[:ObservationGraph.MAX_LOOPS_IN_SUMMARY]:
+            summary_text += '  ' + ' - '.join(loop + loop[:1]) + '\n'
+
+        if len(loops) > ObservationGraph.MAX_LOOPS_IN_SUMMARY:
+            summary_text += '  ...\n'
+
+        return summary_text
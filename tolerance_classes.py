@@ -0,0 +1,94 @@
+import os
+import csv
+import fnmatch
+from configparser import ConfigParser
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ToleranceClasses:
+    """ Survey tolerances for classes of points e.g. monitoring prisms, rail targets and control stations.
+
+    Each section of the tolerance classes file is a class.  Points are assigned to the first class whose point_ids
+    patterns (e.g. GL*, CP*) match, or whose pc_batch_file lists the point.  Any tolerance a class doesn't set, and any
+    point not in a class, uses the SURVEY_TOLERANCES in settings.ini.
+    """
+
+    # tolerance keys in the tolerance classes file and the survey configuration attribute each one defaults to
+    TOLERANCE_SETTINGS = OrderedDict([('eastings', 'easting_tolerance'), ('northings', 'northing_tolerance'),
+                                      ('height', 'height_tolerance'), ('flfr_eastings', 'flfr_easting_tolerance'),
+                                      ('flfr_northings', 'flfr_northing_tolerance'), ('flfr_height', 'flfr_height_tolerance'),
+                                      ('naming', None)])
+
+    # default for the target naming tolerance which isn't in settings.ini
+    NAMING_TOLERANCE = 0.030
+
+    def __init__(self, survey_config, config_files_path='Config Files'):
+
+        self.tolerance_classes = OrderedDict()  # e.g. {'MONITORING': {'patterns': ['GL*'], 'point_ids': set(), 'eastings': 0.005}}
+        self.default_tolerances = OrderedDict()
+
+        for tolerance_name, setting in ToleranceClasses.TOLERANCE_SETTINGS.items():
+            self.default_tolerances[tolerance_name] = float(getattr(survey_config, setting)) if setting \
+                else ToleranceClasses.NAMING_TOLERANCE
+
+        config_parser = ConfigParser()
+        config_parser.read(survey_config.tolerance_classes_file)
+
+        for class_name in config_parser.sections():
+
+            tolerance_class = {'patterns': [pattern.strip() for pattern in
+                                            config_parser.get(class_name, 'point_ids', fallback='').split(',') if pattern.strip()],
+                               'point_ids': set()}
+
+            pc_batch_file = config_parser.get(class_name, 'pc_batch_file', fallback='')
+
+            if pc_batch_file:
+                with open(os.path.join(config_files_path, pc_batch_file)) as csv_file:
+                    for row in csv.reader(csv_file):
+                        if row and row[0] != 'POINT':
+                            tolerance_class['point_ids'].add(row[0])
+
+            for tolerance_name in ToleranceClasses.TOLERANCE_SETTINGS:
+                tolerance_class[tolerance_name] = config_parser.getfloat(class_name, tolerance_name,
+                                                                         fallback=self.default_tolerances[tolerance_name])
+
+            self.tolerance_classes[class_name] = tolerance_class
+
+    def get_class_name(self, point_id):
+
+        for class_name, tolerance_class in self.tolerance_classes.items():
+
+            if point_id in tolerance_class['point_ids'] or \
+                    any(fnmatch.fnmatchcase(point_id, pattern) for pattern in tolerance_class['patterns']):
+                return class_name
+
+        return None
+
+    # returns the tolerances of a single point e.g. {'eastings': 0.005, 'northings': 0.005, ...}
+    def get_point_tolerances(self, point_id):
+
+        class_name = self.get_class_name(point_id)
+
+        if class_name is None:
+            return self.default_tolerances
+
+        return OrderedDict((tolerance_name, self.tolerance_classes[class_name][tolerance_name])
+                           for tolerance_name in ToleranceClasses.TOLERANCE_SETTINGS)
+
+    # Returns a dictionary of tolerance name: array of the tolerance of each point ID e.g. {'eastings': array([0.01, 0.005])}.
+    # Each distinct point ID is only classified once
+    def get_tolerance_arrays(self, point_ids):
+
+        unique_point_ids, point_indexes = np.unique(np.asarray(point_ids, dtype=str), return_inverse=True)
+        point_indexes = point_indexes.reshape(-1)
+
+        tolerance_arrays = OrderedDict()
+        unique_tolerances = [self.get_point_tolerances(point_id) for point_id in unique_point_ids]
+
+        for tolerance_name in ToleranceClasses.TOLERANCE_SETTINGS:
+            class_tolerances = np.array([tolerances[tolerance_name] for tolerances in unique_tolerances], dtype=float)
+            tolerance_arrays[tolerance_name] = class_tolerances[point_indexes] if len(unique_point_ids) else class_tolerances
+
+        return tolerance_arrays
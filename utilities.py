@@ -1,5 +1,6 @@
 from decimal import Decimal
 import math
+import numpy as np
 import datetime
 import calendar
 
@@ -62,6 +63,111 @@ def angular_difference(angle_1, angle_2, angle):
     return round(angular_diff, 6)
 
 
+# NumPy versions of the above so that whole columns of values can be reduced, differenced and formatted in one call.
+# These give the same results as the scalar functions (which remain for the existing callers)
+
+def round_half_even_array(in_values, decimal_places):
+    # Rounds half to even on the exact binary value of each float - the same as Decimal.quantize() and round().  Scaling
+    # by 10^dp can push a value across a half way point so these few values are rounded with Decimal instead
+    values = np.asarray(in_values, dtype=float)
+    scaled = values * 10.0 ** decimal_places
+    rounded = np.rint(scaled)
+
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= 4 * np.spacing(np.abs(scaled))
+    for index in np.flatnonzero(near_half):
+        exact_value = Decimal(float(values.flat[index])).quantize(Decimal(1).scaleb(-decimal_places))
+        rounded.flat[index] = float(exact_value.scaleb(decimal_places))
+
+    return rounded / 10.0 ** decimal_places
+
+
+def decimalize_array(in_values, precision):
+    if precision == '4dp':
+        return round_half_even_array(in_values, 4)
+    else:
+        return round_half_even_array(in_values, 3)
+
+
+# returns a list of strings formatted the same as str(decimalize_value()) e.g. '1000.123'
+def format_decimal_array(in_values, precision):
+    number_format = '{:.4f}' if precision == '4dp' else '{:.3f}'
+
+    return [number_format.format(value) for value in decimalize_array(in_values, precision)]
+
+
+def rad2deg_array(radians):
+    degrees = 180 * np.asarray(radians, dtype=float) / math.pi
+    return degrees
+
+
+def deg2rad_array(degrees):
+    radians = math.pi * np.asarray(degrees, dtype=float) / 180
+    return radians
+
+
+def angle_decimal2DMS_array(in_deg):
+    min, sec = np.divmod(np.asarray(in_deg, dtype=float) * 3600, 60)
+    deg, min = np.divmod(min, 60)
+
+    deg = np.char.zfill(deg.astype(np.int64).astype(str), 3)
+    min = np.char.zfill(min.astype(np.int64).astype(str), 2)
+    sec = np.char.zfill(np.trunc(sec).astype(np.int64).astype(str), 2)
+
+    return np.char.add(np.char.add(deg, min), sec)
+
+
+def angle_DMS_2_decimal_array(angle_deg, angle_min, angle_sec):
+    return np.asarray(angle_deg, dtype=float) + np.asarray(angle_min, dtype=float) / 60 + \
+        np.asarray(angle_sec, dtype=float) / (60 * 60)
+
+
+def angular_difference_array(angle_1, angle_2, angle):
+    rad_a = deg2rad_array(angle_1)
+    rad_b = deg2rad_array(angle_2)
+    if angle == 180:
+        rad_diff = np.maximum(rad_a, rad_b) - np.minimum(rad_a, rad_b)
+        angular_diff = np.abs(angle - rad2deg_array(rad_diff))
+    else:
+        rad_diff = rad_a + rad_b
+        angular_diff = np.abs(angle - rad2deg_array(rad_diff))
+    return round_half_even_array(angular_diff, 6)
+
+
+# median of the values in each group e.g. groups=[0, 0, 1] returns [median of group 0, median of group 1].  Values must not be NaN
+def group_median(values, groups, group_count):
+    values = np.asarray(values, dtype=float)
+    sort_order = np.lexsort((values, groups))
+    sorted_values = values[sort_order]
+
+    group_sizes = np.bincount(groups, minlength=group_count)
+    group_starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+    lower_middle = group_starts + np.maximum(group_sizes - 1, 0) // 2
+    upper_middle = group_starts + group_sizes // 2
+
+    medians = np.full(group_count, np.nan)
+    has_values = group_sizes > 0
+    medians[has_values] = (sorted_values[lower_middle[has_values]] + sorted_values[upper_middle[has_values]]) / 2
+    return medians
+
+
+# array version of get_numerical_value_from_string() for angles and floats.  Blank values are returned as NaN
+def get_numerical_values_from_strings(str_values, field_type, precision='3dp'):
+    if field_type == FIELD_TYPE_NUMBER:
+        return np.array([int(str_value) for str_value in str_values], dtype=np.int64)
+    elif field_type == FIELD_TYPE_ANGLE:
+        # e.g '035° 13\' 27"'
+        angle_lists = [str_value.split() if str_value.count(' ') == 2 else ['nan', 'nan', 'nan'] for str_value in str_values]
+        angle_deg = [angle_list[0].replace('°', '') for angle_list in angle_lists]
+        angle_min = [angle_list[1].replace('\'', '') for angle_list in angle_lists]
+        angle_sec = [angle_list[2].replace('\"', '') for angle_list in angle_lists]
+
+        return angle_DMS_2_decimal_array(angle_deg, angle_min, angle_sec)
+
+    elif field_type == FIELD_TYPE_FLOAT:
+        values = np.array([float(str_value) if str_value != "" else np.nan for str_value in str_values], dtype=float)
+        return decimalize_array(values, precision)
+
+
 def get_time_differance(time1, time2):
     time1_list = time1.split(':')
     time2_list = time2.split(':')